@@ -0,0 +1,143 @@
+from collections import OrderedDict
+import sys
+import threading
+import uuid
+
+
+CHART_CACHE_SIZE = 256
+TRANSACTIONS_CACHE_SIZE = 64
+TRANSACTIONS_CACHE_BYTES = 256 * 1024 * 1024
+PROFILES_CACHE_SIZE = 16
+PROFILES_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def value_bytes(value):
+    # Frames, arrays and the containers holding them. Shallow for frames: strings are shared with the dataset
+    # the frame was sliced from.
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(value_bytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(value_bytes(item) for item in value)
+    if hasattr(value, 'memory_usage'):
+        usage = value.memory_usage(index=True)
+        return int(usage.sum() if hasattr(usage, 'sum') else usage)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class LRUCache():
+    # With weigh, entries are also evicted to keep the sum of their weights under max_bytes
+    def __init__(self, max_entries, max_bytes=None, weigh=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.weigh = weigh
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        size = self.weigh(value) if self.weigh is not None else 0
+        with self.lock:
+            self.remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.bytes += size
+            while len(self.entries) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        if key in self.entries:
+            del self.entries[key]
+            self.bytes -= self.sizes.pop(key)
+
+    def get_or_set(self, key, compute):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, version):
+        # Keys are tuples whose first element is the dataset version
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == version]:
+                self.remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            stats = {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / requests, 4) if requests else 0,
+            }
+            if self.weigh is not None:
+                stats['bytes'] = self.bytes
+                stats['max_bytes'] = self.max_bytes
+            return stats
+
+
+chart_cache = LRUCache(CHART_CACHE_SIZE)
+# Filtered and grouped transactions and the tables computed from them, what the pages show for their query string
+transactions_cache = LRUCache(TRANSACTIONS_CACHE_SIZE, TRANSACTIONS_CACHE_BYTES, value_bytes)
+# Organizer and event profiles (row indices of every one) and the search index built from them
+profiles_cache = LRUCache(PROFILES_CACHE_SIZE, PROFILES_CACHE_BYTES, value_bytes)
+
+CACHES = {
+    'charts': chart_cache,
+    'transactions': transactions_cache,
+    'profiles': profiles_cache,
+}
+
+
+def get_dataset_version(session):
+    version = session.get('dataset_version')
+    if version is None:
+        version = uuid.uuid4().hex
+        session['dataset_version'] = version
+    return version
+
+
+def bump_dataset_version(session, version=None):
+    # Called every time the session dataset changes (new query, exchange applied or restored).
+    # Shared datasets pass their content key, other sessions may still use what's cached under it.
+    previous = session.get('dataset_version')
+    if previous is not None and not session.get('dataset_version_shared'):
+        for cache in CACHES.values():
+            cache.invalidate(previous)
+    session['dataset_version'] = version or uuid.uuid4().hex
+    session['dataset_version_shared'] = version is not None
+    return session['dataset_version']
+
+
+def caches_stats():
+    return {name: cache.stats() for name, cache in CACHES.items()}
@@ -1,6 +1,11 @@
 from django import forms
 from datetime import date, timedelta
 
+from revenue_app.queries import (
+    PUSHDOWN_REPORT,
+    REPORT_CHOICES,
+)
+
 
 class CustomDateInput(forms.DateInput):
     input_type = 'date'
@@ -11,6 +16,9 @@ class QueryForm(forms.Form):
     okta_password = forms.CharField(widget=forms.PasswordInput(render_value=True))
     start_date = forms.DateField(widget=CustomDateInput())
     end_date = forms.DateField(widget=CustomDateInput())
+    report = forms.ChoiceField(choices=REPORT_CHOICES, initial='full', required=False)
+    # Set by the page on submit, names the progress stream of the run
+    progress_id = forms.RegexField(regex=r'^[0-9a-f]{32}$', widget=forms.HiddenInput(), required=False)
 
     def clean(self):
         cleaned_data = super().clean()
@@ -31,8 +39,10 @@ class QueryForm(forms.Form):
                 self.add_error('start_date', error)
                 self.add_error('end_date', error)
 
-            if (end_date - start_date) > timedelta(days=92):
-                error = forms.ValidationError("Time between End and Start date can't be over 3 months.")
+            # Only the totals leave Presto when aggregating there, so longer ranges are fine
+            max_days, period = (366, 'a year') if cleaned_data.get('report') == PUSHDOWN_REPORT else (92, '3 months')
+            if (end_date - start_date) > timedelta(days=max_days):
+                error = forms.ValidationError(f"Time between End and Start date can't be over {period}.")
                 self.add_error('start_date', error)
                 self.add_error('end_date', error)
 
@@ -0,0 +1,55 @@
+import importlib
+import os
+import subprocess
+import sys
+import types
+
+
+# Dependencies loaded on first use, importing the URLconf (every manage.py command, test run and worker boot)
+# shouldn't pay for them
+HEAVY_MODULES = ['pandas', 'numpy', 'pyhive', 'xlwt', 'requests']
+
+
+class LazyModule(types.ModuleType):
+    # Stands in for a module until one of its attributes is used, then keeps the module's attributes
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attribute)
+
+
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
+def parse_import_times(output):
+    # `python -X importtime` lines: "import time: self [us] | cumulative | imported package"
+    import_times = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        import_times.append({
+            'module': name.strip(),
+            'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+            'self': int(self_time) / 1000,
+            'cumulative': int(cumulative) / 1000,
+        })
+    return import_times
+
+
+def import_times(module):
+    # A fresh interpreter, what a worker boot pays to set Django up and import `module`
+    code = f'import django; django.setup(); import {module}'
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return parse_import_times(result.stderr)
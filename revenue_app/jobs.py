@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def write_atomically(path, content):
+    temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary_path, 'wb') as temporary_file:
+        temporary_file.write(content)
+    os.replace(temporary_path, path)
+
+
+class JobPool():
+    # Reports too big to render within the request run on a few threads of the worker that got it. Their
+    # state and result are files, so whichever worker gets the polling can answer it.
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.executor = None
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='jobs')
+            return self.executor
+
+    def paths(self, job_id):
+        return os.path.join(settings.JOBS_DIR, f'{job_id}.json'), os.path.join(settings.JOBS_DIR, f'{job_id}.result')
+
+    def submit(self, owner, filename, content_type, function, *args, **kwargs):
+        os.makedirs(settings.JOBS_DIR, exist_ok=True)
+        self.expire_jobs()
+        job_id = uuid.uuid4().hex
+        state_path, result_path = self.paths(job_id)
+        state = {'owner': owner, 'filename': filename, 'content_type': content_type}
+        self.write_state(state_path, state, QUEUED)
+        with self.lock:
+            self.submitted += 1
+        self.get_executor().submit(self.run, state_path, result_path, state, function, args, kwargs)
+        return job_id
+
+    def run(self, state_path, result_path, state, function, args, kwargs):
+        with self.lock:
+            self.running += 1
+        self.write_state(state_path, state, RUNNING)
+        start = time.perf_counter()
+        try:
+            write_atomically(result_path, function(*args, **kwargs))
+        except Exception as exception:
+            self.write_state(state_path, state, FAILED, error=str(exception))
+            with self.lock:
+                self.failed += 1
+        else:
+            self.write_state(state_path, state, DONE, ms=round((time.perf_counter() - start) * 1000, 2))
+            with self.lock:
+                self.completed += 1
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def write_state(self, state_path, state, status, **data):
+        write_atomically(state_path, json.dumps(dict(state, status=status, **data)).encode('utf-8'))
+
+    def state(self, job_id):
+        # The ids are the file names, nothing but a uuid is looked up
+        if not JOB_ID.match(job_id or ''):
+            return None
+        try:
+            with open(self.paths(job_id)[0]) as state_file:
+                return json.load(state_file)
+        except (OSError, ValueError):
+            return None
+
+    def result_path(self, job_id):
+        return self.paths(job_id)[1]
+
+    def expire_jobs(self):
+        expired = time.time() - settings.JOBS_TTL
+        for pattern in ('*.json', '*.result', '*.tmp'):
+            for path in glob.glob(os.path.join(settings.JOBS_DIR, pattern)):
+                try:
+                    if os.path.getmtime(path) < expired:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': self.max_workers,
+                'submitted': self.submitted,
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+            }
+
+
+job_pool = JobPool(max_workers=settings.JOBS_WORKERS)
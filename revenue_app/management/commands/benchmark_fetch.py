@@ -0,0 +1,89 @@
+from datetime import (
+    date,
+    timedelta,
+)
+from multiprocessing import (
+    Process,
+    Queue,
+)
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+import requests
+
+from revenue_app.presto_connection import (
+    fetch_dataframe,
+    pyhive_dataframe,
+    read_sql,
+)
+from revenue_app.presto_standin import (
+    generate_dataset,
+    PrestoStandin,
+)
+
+QUERIES = ['transactions', 'corrections', 'organizer_sales', 'organizer_refunds']
+
+CLIENTS = {
+    'pyhive': pyhive_dataframe,
+    'fast': fetch_dataframe,
+}
+
+
+def serve(queue, **options):
+    standin = PrestoStandin(**options)
+    queue.put(standin.port)
+    standin.serve_forever()
+
+
+class Command(BaseCommand):
+    help = 'Compare the pyhive and fast fetch clients against a local Presto stand-in'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=31)
+        parser.add_argument('--rows-per-day', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=1000, help='Rows per result page')
+        parser.add_argument('--latency', type=float, default=0, help='Seconds added to every response')
+        parser.add_argument('--no-compress', action='store_false', dest='compress', help="Don't gzip responses")
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        end_date = date.today()
+        start_date = end_date - timedelta(days=options['days'] - 1)
+        # The stand-in runs in its own process so its JSON encoding doesn't compete for the GIL
+        queue = Queue()
+        standin = Process(target=serve, args=(queue,), daemon=True, kwargs={
+            'dataset': generate_dataset(start_date, end_date, rows_per_day=options['rows_per_day']),
+            'latency': options['latency'],
+            'page_size': options['page_size'],
+            'compress': options['compress'],
+        })
+        standin.start()
+        port = queue.get()
+        try:
+            with requests.Session() as session:
+                for query_name in QUERIES:
+                    self.benchmark(session, port, query_name, read_sql(query_name).format(start_date, end_date), options)
+        finally:
+            standin.terminate()
+
+    def benchmark(self, session, port, query_name, sql, options):
+        # Wall time includes waiting on the stand-in, CPU time is only the client (fetch + decode)
+        timings = {}
+        for client, fetch in CLIENTS.items():
+            wall_times = []
+            cpu_times = []
+            for _ in range(options['repeat']):
+                wall_start = time.perf_counter()
+                cpu_start = time.process_time()
+                dataframe = fetch(session, sql, '127.0.0.1', port, 'http', 'benchmark')
+                cpu_times.append((time.process_time() - cpu_start) * 1000)
+                wall_times.append((time.perf_counter() - wall_start) * 1000)
+            timings[client] = (statistics.median(wall_times), statistics.median(cpu_times))
+        self.stdout.write(f'{query_name} ({len(dataframe)} rows)')
+        for client, (wall_time, cpu_time) in timings.items():
+            self.stdout.write(f'    {client:<8} wall {wall_time:>9.1f}ms  cpu {cpu_time:>9.1f}ms')
+        self.stdout.write('    speedup  wall {:>9.2f}x   cpu {:>9.2f}x'.format(
+            timings['pyhive'][0] / timings['fast'][0],
+            timings['pyhive'][1] / timings['fast'][1],
+        ))
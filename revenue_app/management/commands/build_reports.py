@@ -0,0 +1,137 @@
+from concurrent.futures import (
+    as_completed,
+    ProcessPoolExecutor,
+)
+from datetime import datetime
+import getpass
+import json
+import os
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from revenue_app.presto_connection import PrestoError
+from revenue_app.reports import (
+    build_report,
+    EXPORT_FORMATS,
+    missing_engines,
+    range_months,
+)
+from revenue_app.utils import month_range
+
+
+def date_range(value):
+    start_date, _, end_date = value.partition(':')
+    return (
+        datetime.strptime(start_date, '%Y-%m-%d').date(),
+        datetime.strptime(end_date or start_date, '%Y-%m-%d').date(),
+    )
+
+
+def month(value):
+    month_date = datetime.strptime(value, '%Y-%m').date()
+    return month_range(month_date.year, month_date.month)
+
+
+class Command(BaseCommand):
+    help = 'Fetch, consolidate, convert and export reports for one or many date ranges without the web UI'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--range', type=date_range, action='append', default=[], dest='ranges',
+            help='START:END (YYYY-MM-DD), repeat for more ranges',
+        )
+        parser.add_argument(
+            '--month', type=month, action='append', default=[], dest='ranges',
+            help='YYYY-MM, the whole month as a range',
+        )
+        parser.add_argument(
+            '--organizer', action='append', default=[], dest='organizers',
+            help='eventholder_user_id, also export its transactions on their own',
+        )
+        parser.add_argument(
+            '--rates',
+            help='JSON file of USD rates per month name, e.g. {"August": {"ars_to_usd": 60.01, "brl_to_usd": 5.02}}',
+        )
+        parser.add_argument(
+            '--format', choices=EXPORT_FORMATS, action='append', dest='formats',
+            help='Export format, repeat for more (default csv)',
+        )
+        parser.add_argument('--output-dir', default='.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Ranges built at the same time')
+        parser.add_argument('--okta-username', default=os.environ.get('OKTA_USERNAME'))
+
+    def handle(self, *args, **options):
+        if not options['ranges']:
+            raise CommandError('Give at least one --range or --month')
+        export_formats = options['formats'] or ['csv']
+        missing = missing_engines(export_formats)
+        if missing:
+            raise CommandError('; '.join(
+                f'{export_format} exports need {" or ".join(engines)} installed'
+                for export_format, engines in missing.items()
+            ))
+        rates = self.read_rates(options['rates']) if options['rates'] else None
+        exchange_data = {
+            (start_date, end_date): self.get_exchange_data(rates, start_date, end_date)
+            for start_date, end_date in options['ranges']
+        }
+        okta_username = options['okta_username'] or input('Okta username: ')
+        okta_password = os.environ.get('OKTA_PASSWORD') or getpass.getpass('Okta password: ')
+        os.makedirs(options['output_dir'], exist_ok=True)
+        jobs = {
+            (start_date, end_date): dict(
+                start_date=start_date,
+                end_date=end_date,
+                okta_username=okta_username,
+                okta_password=okta_password,
+                output_dir=options['output_dir'],
+                export_formats=export_formats,
+                exchange_data=exchange_data[(start_date, end_date)],
+                organizers=options['organizers'],
+            )
+            for start_date, end_date in options['ranges']
+        }
+        failed = self.run(jobs, options['workers'])
+        if failed:
+            raise CommandError(f'{failed} of {len(jobs)} ranges failed')
+
+    def run(self, jobs, workers):
+        failed = 0
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as executor:
+            futures = {executor.submit(build_report, **job): job_range for job_range, job in jobs.items()}
+            for future in as_completed(futures):
+                start_date, end_date = futures[future]
+                try:
+                    paths = future.result()
+                except PrestoError as exception:
+                    failed += 1
+                    self.stderr.write(f'{start_date} - {end_date}: {exception.args[0]}')
+                    continue
+                except Exception as exception:
+                    # Anything else failing in one range (missing rates, disk, export engine) leaves the others be
+                    failed += 1
+                    self.stderr.write(f'{start_date} - {end_date}: {type(exception).__name__}: {exception}')
+                    continue
+                for path in paths:
+                    self.stdout.write(f'{start_date} - {end_date}: {path}')
+        return failed
+
+    def read_rates(self, path):
+        try:
+            with open(path) as rates_file:
+                return json.load(rates_file)
+        except (OSError, ValueError) as exception:
+            raise CommandError(f"Can't read the rates file: {exception}")
+
+    def get_exchange_data(self, rates, start_date, end_date):
+        # dataframe_to_usd drops the rows of months without rates, every month of the range needs them
+        if rates is None:
+            return None
+        months = range_months(start_date, end_date)
+        missing = [month_name for month_name in months if month_name not in rates]
+        if missing:
+            raise CommandError(f'No rates for {", ".join(missing)} in the rates file')
+        return {month_name: rates[month_name] for month_name in months}
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from revenue_app.imports import (
+    HEAVY_MODULES,
+    import_times,
+)
+
+
+class Command(BaseCommand):
+    help = 'Report what a cold start (Django setup + importing a module) spends importing, like -X importtime'
+
+    def add_arguments(self, parser):
+        parser.add_argument('module', nargs='?', default=settings.ROOT_URLCONF)
+        parser.add_argument('--sort', choices=['self', 'cumulative'], default='cumulative')
+        parser.add_argument('--limit', type=int, default=30, help='Number of modules to print')
+
+    def handle(self, *args, **options):
+        times = import_times(options['module'])
+        self.stdout.write(f'{"self":>10}  {"cumulative":>10}  module')
+        for entry in sorted(times, key=lambda entry: entry[options['sort']], reverse=True)[:options['limit']]:
+            self.stdout.write('{self:>8.1f}ms  {cumulative:>8.1f}ms  {indent}{module}'.format(
+                indent='  ' * entry['depth'],
+                **entry,
+            ))
+        total = sum(entry['self'] for entry in times)
+        module_time = next(entry['cumulative'] for entry in reversed(times) if entry['module'] == options['module'])
+        self.stdout.write(f'total {total:.1f}ms in {len(times)} modules, {options["module"]} {module_time:.1f}ms')
+        imported = [entry['module'] for entry in times]
+        loaded = [name for name in HEAVY_MODULES if name in imported]
+        if loaded:
+            self.stdout.write(self.style.WARNING(f'Loaded at startup instead of on first use: {", ".join(loaded)}'))
+        if module_time > settings.COLD_START_BUDGET_MS:
+            self.stdout.write(self.style.ERROR(f'Over the {settings.COLD_START_BUDGET_MS}ms cold start budget'))
@@ -0,0 +1,70 @@
+from datetime import (
+    date,
+    datetime,
+    timedelta,
+)
+
+from django.core.management.base import BaseCommand
+
+from revenue_app.presto_standin import (
+    FAILURE_MODES,
+    generate_dataset,
+    PrestoStandin,
+)
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class Command(BaseCommand):
+    help = 'Run a local Presto stand-in with synthetic data'
+
+    def add_arguments(self, parser):
+        today = date.today()
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8089)
+        parser.add_argument('--start-date', type=parse_date, default=today - timedelta(days=90))
+        parser.add_argument('--end-date', type=parse_date, default=today)
+        parser.add_argument('--rows-per-day', type=int, default=100)
+        parser.add_argument('--latency', type=float, default=0, help='Seconds added to every response')
+        parser.add_argument('--page-size', type=int, default=1000, help='Rows per result page')
+        parser.add_argument('--failure-rate', type=float, default=0, help='Probability of failing a page')
+        parser.add_argument('--failure-mode', choices=FAILURE_MODES, default='error')
+        parser.add_argument('--no-compress', action='store_false', dest='compress', help="Don't gzip responses")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        dataset = generate_dataset(
+            options['start_date'],
+            options['end_date'],
+            rows_per_day=options['rows_per_day'],
+            seed=options['seed'],
+        )
+        standin = PrestoStandin(
+            host=options['host'],
+            port=options['port'],
+            dataset=dataset,
+            latency=options['latency'],
+            page_size=options['page_size'],
+            failure_rate=options['failure_rate'],
+            failure_mode=options['failure_mode'],
+            compress=options['compress'],
+            seed=options['seed'],
+            verbose=options['verbosity'] > 1,
+        )
+        self.stdout.write(
+            f'Presto stand-in with {len(dataset["transactions"])} transactions '
+            f'from {options["start_date"]} to {options["end_date"]}, listening on {standin.host}:{standin.port}'
+        )
+        self.stdout.write(
+            f'Run the app against it with: PRESTO_HOST={standin.host} PRESTO_PORT={standin.port} '
+            'PRESTO_PROTOCOL=http PRESTO_SQL_DIR=revenue_app/tests/sql python manage.py runserver'
+        )
+        try:
+            standin.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            standin.server.server_close()
+            self.stdout.write(f'Stats: {standin.stats()}')
@@ -0,0 +1,55 @@
+from datetime import date
+import os
+
+from django.conf import settings
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from revenue_app.presto_connection import PrestoError
+from revenue_app.prewarm import prewarm_range
+from revenue_app.utils import (
+    month_to_date_range,
+    previous_month_range,
+)
+
+PREWARM_RANGES = {
+    'previous_month': previous_month_range,
+    'month_to_date': month_to_date_range,
+}
+
+
+class Command(BaseCommand):
+    help = 'Fetch and consolidate the most requested ranges ahead of the analysts, meant to run nightly from cron'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--range', choices=PREWARM_RANGES, action='append', dest='ranges',
+            help='Range to prewarm, repeat for more (default all of them)',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.SHARED_DATASET_DIR:
+            raise CommandError('SHARED_DATASET_DIR must be set, prewarmed datasets are shared through it')
+        okta_username = os.environ.get('OKTA_USERNAME')
+        okta_password = os.environ.get('OKTA_PASSWORD')
+        if not okta_username or not okta_password:
+            raise CommandError('OKTA_USERNAME and OKTA_PASSWORD must be set')
+        today = date.today()
+        failed = 0
+        for name in options['ranges'] or PREWARM_RANGES:
+            date_range = PREWARM_RANGES[name](today)
+            if date_range is None:
+                self.stdout.write(f'{name}: nothing to prewarm today')
+                continue
+            start_date, end_date = date_range
+            try:
+                key = prewarm_range(start_date, end_date, okta_username, okta_password)
+            except PrestoError as exception:
+                failed += 1
+                self.stderr.write(f'{name} ({start_date} - {end_date}): {exception.args[0]}')
+                continue
+            self.stdout.write(f'{name} ({start_date} - {end_date}): {key}')
+        if failed:
+            raise CommandError(f'{failed} ranges failed')
@@ -0,0 +1,52 @@
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from revenue_app.profiling import (
+    dump_profile,
+    get_profile,
+    list_profiles,
+)
+
+
+class Command(BaseCommand):
+    help = 'List and dump request profiles captured with ?profile=cprofile|sample'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action')
+        subparsers.required = True
+        subparsers.add_parser('list', cmd=self, help='List stored profiles')
+        dump = subparsers.add_parser('dump', cmd=self, help='Print a stored profile')
+        dump.add_argument('profile_id')
+        dump.add_argument('--sort', default='cumulative', help='pstats sort key (cprofile only)')
+        dump.add_argument('--limit', type=int, default=30, help='Number of entries to print')
+
+    def handle(self, *args, **options):
+        if options['action'] == 'list':
+            self.list_profiles()
+        else:
+            self.dump_profile(options['profile_id'], options['sort'], options['limit'])
+
+    def list_profiles(self):
+        profiles = list_profiles()
+        if not profiles:
+            self.stdout.write('No profiles stored.')
+            return
+        for metadata in profiles:
+            query_string = '&'.join(f'{key}={value}' for key, value in metadata['filters'].items())
+            self.stdout.write(
+                '{id}  {mode:<8}  {duration:>10.2f}ms  {path}{query_string}  '
+                '[{start_date} - {end_date}] dataset={dataset_fingerprint}'.format(
+                    query_string=f'?{query_string}' if query_string else '',
+                    **metadata
+                )
+            )
+
+    def dump_profile(self, profile_id, sort, limit):
+        metadata = get_profile(profile_id)
+        if metadata is None:
+            raise CommandError(f'Profile {profile_id} not found.')
+        for key in ['view', 'path', 'filters', 'start_date', 'end_date', 'exchange_data', 'dataset_fingerprint']:
+            self.stdout.write(f'{key}: {metadata[key]}')
+        self.stdout.write(dump_profile(metadata, sort, limit))
@@ -0,0 +1,69 @@
+import time
+
+from revenue_app.performance import (
+    current_metrics,
+    finish_request,
+    registry,
+    server_timing,
+    start_request,
+    timer,
+    TIMED_METRICS,
+)
+from revenue_app.profiling import (
+    get_profile_mode,
+    profile_request,
+)
+
+
+class PerformanceMiddleware():
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            finish_request()
+        timings = {'total': metrics.elapsed()}
+        for name in TIMED_METRICS:
+            timings[name] = metrics.timings[name]
+        if not response.streaming:
+            timings['size'] = len(response.content)
+        response['Server-Timing'] = server_timing(timings)
+        registry.record(self.get_view_name(request), timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, 'session'):
+            with timer('session'):
+                # Force the session (and the dataset stored on it) to be loaded here
+                request.session.keys()
+
+    def process_template_response(self, request, response):
+        metrics = current_metrics()
+        if metrics is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                metrics.timings['render'] += (time.perf_counter() - start) * 1000
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def get_view_name(self, request):
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is None:
+            return 'unresolved'
+        return resolver_match.url_name or resolver_match.view_name
+
+
+class ProfilingMiddleware():
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = get_profile_mode(request)
+        if mode and request.user.is_staff:
+            return profile_request(self.get_response, request, mode)
+        return self.get_response(request)
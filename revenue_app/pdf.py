@@ -0,0 +1,358 @@
+import math
+import re
+import unicodedata
+import zlib
+
+# Points, 72 per inch
+A4 = (595.28, 841.89)
+MARGIN = 40
+
+FONTS = {False: 'Helvetica', True: 'Helvetica-Bold'}
+
+# Widths of the standard Helvetica fonts (per 1000 units of size) for ASCII 32-126, from their AFM files
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+HELVETICA_BOLD_WIDTHS = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+WIDTHS = {False: HELVETICA_WIDTHS, True: HELVETICA_BOLD_WIDTHS}
+DEFAULT_WIDTH = 556
+ELLIPSIS = '…'
+
+BLACK = (0, 0, 0)
+WHITE = (1, 1, 1)
+GREY = (0.55, 0.55, 0.55)
+LIGHT_GREY = (0.95, 0.95, 0.95)
+# Brand colors of base.css
+PRIMARY = (0x1E / 255, 0x0A / 255, 0x3C / 255)
+SECONDARY = (0xD1 / 255, 0x41 / 255, 0x0C / 255)
+
+
+def char_width(char, bold):
+    code = ord(char)
+    if 32 <= code <= 126:
+        return WIDTHS[bold][code - 32]
+    if char == ELLIPSIS:
+        return 1000
+    # Accented letters are as wide as the letter
+    base = unicodedata.normalize('NFD', char)[0]
+    if base != char and 32 <= ord(base) <= 126:
+        return WIDTHS[bold][ord(base) - 32]
+    return DEFAULT_WIDTH
+
+
+def text_width(text, size, bold=False):
+    return sum(char_width(char, bold) for char in text) * size / 1000
+
+
+def fit_text(text, width, size, bold=False):
+    if text_width(text, size, bold) <= width:
+        return text
+    while text and text_width(text + ELLIPSIS, size, bold) > width:
+        text = text[:-1]
+    return text + ELLIPSIS if text else ''
+
+
+def wrap_text(text, width, size, bold=False):
+    # Breaks at spaces, or after the underscores of long names like sale__gtf_esf__epp
+    if text_width(text, size, bold) <= width:
+        return [text]
+    for pieces, joiner in [(text.split(' '), ' '), (re.findall(r'[^_]*_+|[^_]+$', text), '')]:
+        if len(pieces) == 1:
+            continue
+        lines = [pieces[0]]
+        for piece in pieces[1:]:
+            candidate = lines[-1] + joiner + piece
+            if text_width(candidate, size, bold) <= width:
+                lines[-1] = candidate
+            else:
+                lines.append(piece)
+        if all(text_width(line, size, bold) <= width for line in lines):
+            return lines
+    return [fit_text(text, width, size, bold)]
+
+
+def pdf_string(text):
+    encoded = text.encode('cp1252', errors='replace')
+    return b'(' + encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def number(value):
+    return f'{value:.3f}'.rstrip('0').rstrip('.') if isinstance(value, float) else str(value)
+
+
+def color_operator(color, operator):
+    return ' '.join(number(round(component, 4)) for component in color) + f' {operator}'
+
+
+def arc_points(cx, cy, radius, start, end):
+    # Cubic Béziers for an arc between two angles (radians, counter-clockwise), at most a quarter turn each
+    segments = max(1, math.ceil(abs(end - start) / (math.pi / 2)))
+    step = (end - start) / segments
+    control = 4 / 3 * math.tan(step / 4)
+    points = []
+    for segment in range(segments):
+        a0 = start + step * segment
+        a1 = a0 + step
+        x0, y0 = cx + radius * math.cos(a0), cy + radius * math.sin(a0)
+        x3, y3 = cx + radius * math.cos(a1), cy + radius * math.sin(a1)
+        points.append((
+            (x0 - control * radius * math.sin(a0), y0 + control * radius * math.cos(a0)),
+            (x3 + control * radius * math.sin(a1), y3 - control * radius * math.cos(a1)),
+            (x3, y3),
+        ))
+    return points
+
+
+class Page():
+    def __init__(self, size):
+        self.width, self.height = size
+        self.operations = []
+
+    def add(self, operation):
+        self.operations.append(operation)
+
+    def content(self):
+        return '\n'.join(self.operations).encode('latin-1')
+
+
+class PDFDocument():
+    # Just what the reports draw: text in the standard Helvetica fonts, filled rectangles, lines and
+    # donut wedges. Layout uses top-down coordinates from the top left corner of the page.
+    def __init__(self, title, subtitle=None, size=A4):
+        self.title = title
+        self.subtitle = subtitle
+        self.size = size
+        self.pages = []
+        self.page = None
+        self.y = 0
+        self.new_page()
+
+    @property
+    def width(self):
+        return self.page.width - 2 * MARGIN
+
+    def new_page(self, landscape=None):
+        width, height = self.size if self.page is None else (self.page.width, self.page.height)
+        if landscape is not None:
+            width, height = (max(self.size), min(self.size)) if landscape else (min(self.size), max(self.size))
+        self.page = Page((width, height))
+        self.pages.append(self.page)
+        self.y = MARGIN
+        self.text(MARGIN, self.y + 14, self.title, size=14, bold=True, color=PRIMARY)
+        if self.subtitle:
+            self.text(self.page.width - MARGIN, self.y + 14, self.subtitle, size=8, color=GREY, align='right')
+        self.line(MARGIN, self.y + 20, self.page.width - MARGIN, self.y + 20, SECONDARY, 1.5)
+        self.y += 34
+
+    def ensure(self, height):
+        if self.y + height > self.page.height - MARGIN:
+            self.new_page()
+
+    def space(self, height):
+        self.y += height
+
+    # Drawing, y is the baseline for text and the top edge for shapes
+
+    def text(self, x, y, value, size=8, bold=False, color=BLACK, align='left'):
+        if align == 'right':
+            x -= text_width(value, size, bold)
+        elif align == 'center':
+            x -= text_width(value, size, bold) / 2
+        self.page.add(
+            f'BT {color_operator(color, "rg")} /F{int(bold) + 1} {number(size)} Tf '
+            f'{number(round(x, 2))} {number(round(self.page.height - y, 2))} Td '
+            f'{pdf_string(value).decode("latin-1")} Tj ET'
+        )
+
+    def rect(self, x, y, width, height, color):
+        self.page.add(
+            f'{color_operator(color, "rg")} {number(round(x, 2))} {number(round(self.page.height - y - height, 2))} '
+            f'{number(round(width, 2))} {number(round(height, 2))} re f'
+        )
+
+    def line(self, x0, y0, x1, y1, color=GREY, width=0.5):
+        self.page.add(
+            f'{color_operator(color, "RG")} {number(width)} w {number(round(x0, 2))} '
+            f'{number(round(self.page.height - y0, 2))} m {number(round(x1, 2))} '
+            f'{number(round(self.page.height - y1, 2))} l S'
+        )
+
+    def wedge(self, cx, cy, outer, inner, start, end, color):
+        # Angles clockwise from 12 o'clock like the d3 donuts, a ring slice between the two radii
+        cy = self.page.height - cy
+        start, end = math.pi / 2 - start, math.pi / 2 - end
+        x0, y0 = cx + outer * math.cos(start), cy + outer * math.sin(start)
+        operations = [color_operator(color, 'rg'), f'{number(round(x0, 2))} {number(round(y0, 2))} m']
+        for radius, arc_start, arc_end in [(outer, start, end), (inner, end, start)]:
+            if radius == inner:
+                x, y = cx + inner * math.cos(end), cy + inner * math.sin(end)
+                operations.append(f'{number(round(x, 2))} {number(round(y, 2))} l')
+            for points in arc_points(cx, cy, radius, arc_start, arc_end):
+                operations.append(' '.join(f'{number(round(x, 2))} {number(round(y, 2))}' for x, y in points) + ' c')
+        operations.append('h f')
+        self.page.add(' '.join(operations))
+
+    # Flowing blocks, each one starts at the cursor and moves it down
+
+    def heading(self, text, size=12):
+        self.ensure(size * 3)
+        self.y += size * 1.5
+        self.text(MARGIN, self.y, text, size=size, bold=True, color=PRIMARY)
+        self.y += size * 0.75
+
+    def paragraph(self, text, size=8, color=GREY):
+        self.ensure(size * 2)
+        self.y += size * 1.4
+        self.text(MARGIN, self.y, text, size=size, color=color)
+        self.y += size * 0.4
+
+    def key_values(self, rows, x=None, width=None, size=8):
+        # Label / value rows, values right aligned
+        x = MARGIN if x is None else x
+        width = self.width if width is None else width
+        row_height = size * 2
+        for position, (label, value) in enumerate(rows):
+            self.ensure(row_height)
+            if position % 2 == 0:
+                self.rect(x, self.y, width, row_height, LIGHT_GREY)
+            baseline = self.y + row_height / 2 + size * 0.35
+            self.text(x + 4, baseline, fit_text(label, width / 2 - 8, size, True), size=size, bold=True)
+            self.text(x + width - 4, baseline, fit_text(value, width / 2 - 8, size), size=size, align='right')
+            self.y += row_height
+
+    def table(self, headers, rows, aligns=None, size=7, max_column_width=150):
+        # Columns as wide as their content (capped), the font shrinks when they don't fit the page. The
+        # header is repeated on every page.
+        aligns = aligns or ['left'] * len(headers)
+        padding = 3
+        # Content widths, a header gets at least as wide as the widest piece it can be broken into
+        widths = [
+            min(
+                max_column_width - 2 * padding,
+                max(
+                    [text_width(piece, size, True) for piece in re.findall(r'[^_]*_+|[^_]+$', header)]
+                    + [text_width(row[position], size) for row in rows],
+                ),
+            )
+            for position, header in enumerate(headers)
+        ]
+        available = self.width - 2 * padding * len(headers)
+        scale = available / sum(widths)
+        if scale < 1:
+            size = max(4, size * scale)
+        widths = [width * scale + 2 * padding for width in widths]
+        header_lines = [wrap_text(header, width - 2 * padding, size, True) for header, width in zip(headers, widths)]
+        header_height = max(len(lines) for lines in header_lines) * size * 1.2 + 2 * padding
+        row_height = size * 1.9
+
+        def draw_header():
+            self.rect(MARGIN, self.y, self.width, header_height, PRIMARY)
+            x = MARGIN
+            for lines, width in zip(header_lines, widths):
+                for number_of_line, line in enumerate(lines):
+                    baseline = self.y + padding + size * (1.2 * number_of_line + 0.95)
+                    self.text(x + padding, baseline, line, size=size, bold=True, color=WHITE)
+                x += width
+            self.y += header_height
+
+        self.ensure(header_height + row_height)
+        draw_header()
+        for position, row in enumerate(rows):
+            if self.y + row_height > self.page.height - MARGIN:
+                self.new_page()
+                draw_header()
+            if position % 2:
+                self.rect(MARGIN, self.y, self.width, row_height, LIGHT_GREY)
+            x = MARGIN
+            baseline = self.y + row_height / 2 + size * 0.35
+            for value, width, align in zip(row, widths, aligns):
+                value = fit_text(value, width - 2 * padding, size)
+                if align == 'right':
+                    self.text(x + width - padding, baseline, value, size=size, align='right')
+                else:
+                    self.text(x + padding, baseline, value, size=size)
+                x += width
+            self.y += row_height
+
+    def donut(self, items, colors, x=None, diameter=160):
+        # items: (label, quantity) pairs, drawn as ring slices next to their legend
+        x = MARGIN if x is None else x
+        self.ensure(diameter + 10)
+        cx, cy = x + diameter / 2, self.y + diameter / 2
+        outer, inner = diameter / 2, diameter / 4
+        total = sum(quantity for label, quantity in items if quantity > 0)
+        if total <= 0:
+            self.wedge(cx, cy, outer, inner, 0, 2 * math.pi, LIGHT_GREY)
+        angle = 0
+        for position, (label, quantity) in enumerate(items):
+            if quantity <= 0 or total <= 0:
+                continue
+            sweep = 2 * math.pi * quantity / total
+            self.wedge(cx, cy, outer, inner, angle, angle + sweep, colors[position % len(colors)])
+            angle += sweep
+        legend_x = x + diameter + 20
+        legend_width = self.page.width - MARGIN - legend_x
+        legend_y = self.y + max(0, (diameter - len(items) * 14) / 2)
+        for position, (label, quantity) in enumerate(items):
+            self.rect(legend_x, legend_y + 3, 8, 8, colors[position % len(colors)])
+            self.text(legend_x + 14, legend_y + 10, fit_text(label, legend_width - 14, 8), size=8)
+            legend_y += 14
+        self.y += max(diameter, legend_y - self.y) + 10
+
+    def render(self):
+        # Objects: catalog, page tree, two fonts, then a page and its content stream per page
+        fonts = [
+            f'<< /Type /Font /Subtype /Type1 /BaseFont /{FONTS[bold]} /Encoding /WinAnsiEncoding >>'.encode('latin-1')
+            for bold in (False, True)
+        ]
+        page_ids = [5 + 2 * position for position in range(len(self.pages))]
+        objects = [
+            b'<< /Type /Catalog /Pages 2 0 R >>',
+            f'<< /Type /Pages /Kids [{" ".join(f"{page_id} 0 R" for page_id in page_ids)}] '
+            f'/Count {len(self.pages)} >>'.encode('latin-1'),
+            *fonts,
+        ]
+        for number_of_page, (page, page_id) in enumerate(zip(self.pages, page_ids), start=1):
+            footer = f'Page {number_of_page} of {len(self.pages)}'
+            footer_x = round(page.width - MARGIN - text_width(footer, 7), 2)
+            page.add(
+                f'BT {color_operator(GREY, "rg")} /F1 7 Tf {number(footer_x)} {number(MARGIN / 2)} Td '
+                f'{pdf_string(footer).decode("latin-1")} Tj ET'
+            )
+            content = zlib.compress(page.content())
+            objects.append(
+                f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {number(page.width)} {number(page.height)}] '
+                f'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> '
+                f'/Contents {page_id + 1} 0 R >>'.encode('latin-1')
+            )
+            objects.append(
+                f'<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n'.encode('latin-1')
+                + content + b'\nendstream'
+            )
+        output = [b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n']
+        offsets = []
+        position = len(output[0])
+        for object_id, body in enumerate(objects, start=1):
+            offsets.append(position)
+            chunk = f'{object_id} 0 obj\n'.encode('latin-1') + body + b'\nendobj\n'
+            output.append(chunk)
+            position += len(chunk)
+        xref = [f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('latin-1')]
+        xref.extend(f'{offset:010d} 00000 n \n'.encode('latin-1') for offset in offsets)
+        output.extend(xref)
+        output.append(
+            f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{position}\n%%EOF\n'.encode('latin-1')
+        )
+        return b''.join(output)
@@ -0,0 +1,133 @@
+from revenue_app.imports import lazy_import
+from revenue_app.pdf import PDFDocument
+
+pd = lazy_import('pandas')
+
+# britecharts color schema, the one of the donuts on the pages
+CHART_COLORS = [
+    (0x6a / 255, 0xed / 255, 0xc7 / 255),
+    (0x39 / 255, 0xc2 / 255, 0xc9 / 255),
+    (0xff / 255, 0xce / 255, 0x00 / 255),
+    (0xff / 255, 0xa7 / 255, 0x1a / 255),
+    (0xf8 / 255, 0x66 / 255, 0xb9 / 255),
+    (0x99 / 255, 0x8c / 255, 0xe3 / 255),
+]
+
+CHART_TYPES = {
+    'payment_processor': 'Payment Processor',
+    'sales_flag': 'Sales Flag',
+}
+
+CHART_FILTERS = {
+    'gtv': 'GTV',
+    'gtf': 'GTF',
+    'organizers': 'Organizers',
+}
+
+RATE_COLUMNS = ['eb_perc_take_rate', 'Take Rate']
+INTEGER_COLUMNS = ['PaidTix']
+# Float in the top tables, where the Others row has none
+ID_COLUMNS = ['eventholder_user_id', 'event_id', 'Organizer']
+
+
+def money(value, currency=None):
+    formatted = f'{value:,.2f}'
+    return f'{currency} {formatted}' if currency else formatted
+
+
+def cell(column, value):
+    if value is None or (isinstance(value, float) and pd.isnull(value)):
+        return ''
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    if column in ID_COLUMNS and isinstance(value, float):
+        return str(int(value))
+    if column in RATE_COLUMNS:
+        return f'{value:.2f}%'
+    if column in INTEGER_COLUMNS:
+        return f'{int(value):,}'
+    if isinstance(value, float):
+        return money(value)
+    return str(value)
+
+
+def frame_table(dataframe):
+    columns = dataframe.columns.tolist()
+    numeric = [dataframe[column].dtype.kind in 'iuf' and column not in ID_COLUMNS for column in columns]
+    rows = [
+        [cell(column, value) for column, value in zip(columns, row)]
+        for row in dataframe.itertuples(index=False, name=None)
+    ]
+    return [str(column) for column in columns], rows, ['right' if flag else 'left' for flag in numeric]
+
+
+def chart_quantity(value, unit):
+    return f'{value:,.0f} {unit}' if unit == 'organizers' else money(value, unit)
+
+
+def chart_items(chart):
+    # The legend names of the charts already start with the percentage
+    return [
+        (f'{item["name"]} ({chart_quantity(item["quantity"], chart["unit"])})', item['quantity'])
+        for item in chart['legend']
+    ]
+
+
+def dashboard_pdf(summarized_data, charts, subtitle):
+    document = PDFDocument('Dashboard', subtitle)
+    for country, data in summarized_data.items():
+        document.heading(country)
+        rows = []
+        for group, values in data.items():
+            if group == 'currency':
+                continue
+            for key, value in values.items():
+                if group == 'Totals':
+                    formatted = f'{int(value):,}'
+                elif 'Rate' in key:
+                    formatted = f'{value:.2f}%'
+                else:
+                    formatted = money(value, data['currency'])
+                rows.append((f'{group} {key}', formatted))
+        document.key_values(rows)
+    for chart_type, type_label in CHART_TYPES.items():
+        for chart_filter, by_country in charts.get(chart_type, {}).items():
+            filter_label = CHART_FILTERS.get(chart_filter, chart_filter)
+            for country, chart in by_country.items():
+                # The heading on the same page as its chart
+                document.ensure(200)
+                document.heading(f'{type_label} referred to {filter_label} for {country}', size=10)
+                document.space(6)
+                document.donut(chart_items(chart), CHART_COLORS)
+    return document.render()
+
+
+def top_pdf(title, sections, subtitle):
+    # sections: (heading, table, chart) per currency
+    document = PDFDocument(title, subtitle)
+    for position, (heading, table, chart) in enumerate(sections):
+        if position:
+            document.new_page()
+        document.heading(heading)
+        document.space(4)
+        document.table(*frame_table(table))
+        document.space(10)
+        document.donut(chart_items(chart), CHART_COLORS)
+    return document.render()
+
+
+def detail_pdf(title, details, sales_refunds, net_sales_refunds, currency, transactions, subtitle):
+    document = PDFDocument(title, subtitle)
+    document.key_values([
+        (key, f'{value:,.2f}' if isinstance(value, float) else str(value))
+        for key, value in details.items()
+    ])
+    for group in [net_sales_refunds, sales_refunds]:
+        for name, data in group.items():
+            document.heading(name, size=10)
+            document.key_values([(key, money(value, currency)) for key, value in data.items()])
+    document.new_page(landscape=True)
+    document.heading(f'Transactions ({len(transactions):,})')
+    document.space(4)
+    document.table(*frame_table(transactions))
+    return document.render()
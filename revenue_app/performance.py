@@ -0,0 +1,133 @@
+from collections import (
+    defaultdict,
+    deque,
+)
+from contextlib import contextmanager
+from functools import wraps
+import math
+import threading
+import time
+
+
+HISTOGRAM_SIZE = 1000
+
+PERCENTILES = (50, 95, 99)
+
+TIMED_METRICS = ['session', 'utils', 'render']
+
+_local = threading.local()
+
+
+class RollingHistogram():
+    def __init__(self, size=HISTOGRAM_SIZE):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self, value):
+        with self.lock:
+            self.samples.append(value)
+            self.count += 1
+
+    def percentile(self, sorted_samples, percent):
+        # Nearest-rank percentile
+        index = max(0, math.ceil(percent / 100 * len(sorted_samples)) - 1)
+        return sorted_samples[index]
+
+    def summary(self):
+        with self.lock:
+            samples = sorted(self.samples)
+            count = self.count
+        if not samples:
+            return {'count': count}
+        summary = {f'p{percent}': round(self.percentile(samples, percent), 2) for percent in PERCENTILES}
+        summary['count'] = count
+        summary['max'] = round(samples[-1], 2)
+        return summary
+
+
+class PerformanceRegistry():
+    def __init__(self):
+        self.histograms = defaultdict(dict)
+        self.lock = threading.Lock()
+
+    def histogram(self, view_name, metric):
+        with self.lock:
+            if metric not in self.histograms[view_name]:
+                self.histograms[view_name][metric] = RollingHistogram()
+            return self.histograms[view_name][metric]
+
+    def record(self, view_name, metrics):
+        for metric, value in metrics.items():
+            self.histogram(view_name, metric).add(value)
+
+    def summary(self):
+        with self.lock:
+            views = {view_name: dict(metrics) for view_name, metrics in self.histograms.items()}
+        return {
+            view_name: {metric: histogram.summary() for metric, histogram in metrics.items()}
+            for view_name, metrics in sorted(views.items())
+        }
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+registry = PerformanceRegistry()
+
+
+class RequestMetrics():
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.timings = defaultdict(float)
+        self.depth = defaultdict(int)
+
+    def elapsed(self):
+        return (time.perf_counter() - self.start) * 1000
+
+
+def start_request():
+    _local.metrics = RequestMetrics()
+    return _local.metrics
+
+
+def finish_request():
+    return _local.__dict__.pop('metrics', None)
+
+
+def current_metrics():
+    return getattr(_local, 'metrics', None)
+
+
+@contextmanager
+def timer(name):
+    metrics = current_metrics()
+    if metrics is None or metrics.depth[name]:
+        # Nested calls are already accounted by the outermost timer
+        yield
+        return
+    metrics.depth[name] += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[name] += (time.perf_counter() - start) * 1000
+        metrics.depth[name] -= 1
+
+
+def timed(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing(metrics):
+    return ', '.join(
+        f'{name};dur={duration:.2f}' for name, duration in metrics.items()
+        if name != 'size'
+    )
@@ -1,11 +1,65 @@
-import pandas as pd
-from pyhive import presto
-from pyhive.exc import DatabaseError
+from array import array
+from collections import (
+    Counter,
+    defaultdict,
+)
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from revenue_app.imports import lazy_import
+from revenue_app.progress import report_fetch
+from revenue_app.queries import (
+    aggregate_sql,
+    AGGREGATES,
+    get_query_columns,
+    projected_sql,
+    QUERY_COLUMNS,
+)
+from revenue_app.single_flight import SingleFlight
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+presto = lazy_import('pyhive.presto')
+exc = lazy_import('pyhive.exc')
+requests = lazy_import('requests')
+
+try:
+    import orjson as fast_json
+except ImportError:
+    import json as fast_json
+
+
+# Presto types that fit in a typed buffer, anything else (varchar, date, decimal, ...) is kept in a list
+COLUMN_BUFFER_TYPES = {
+    'tinyint': 'q',
+    'smallint': 'q',
+    'integer': 'q',
+    'bigint': 'q',
+    'real': 'd',
+    'double': 'd',
+}
+
+BUFFER_DTYPES = {
+    'q': 'int64',
+    'd': 'float64',
+}
+
+FAST_FETCH_POLL_INTERVAL = 0.05
+
+FAST_FETCH_MAX_POLL_INTERVAL = 1
 
 
 class PrestoError(Exception):
-    def __init__(self, error_message):
-        self.args = (self.get_message(error_message),)
+    def __init__(self, error_message, formatted=False):
+        self.args = (error_message if formatted else self.get_message(error_message),)
+
+    def __reduce__(self):
+        # Raised in a worker process (build_reports), the message is already formatted
+        return (PrestoError, (self.args[0], True))
 
     def get_message(self, error_message):
         if 'NewConnectionError' in error_message:
@@ -32,34 +86,275 @@ class PrestoError(Exception):
         return message
 
 
+class PooledSession():
+    def __init__(self, session):
+        self.session = session
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class PrestoConnectionPool():
+    # pyhive connections are stateless, the expensive part (TLS handshake and auth) lives in the
+    # keep-alive connections of the requests session, so the pool hands out sessions instead
+    def __init__(self, max_size, idle_timeout, health_check_interval, timeout):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.idle = defaultdict(list)
+        self.in_use = Counter()
+        self.created = 0
+        self.reused = 0
+        self.expired = 0
+        self.discarded = 0
+
+    def acquire(self, key):
+        with self.condition:
+            self.expire_idle()
+            deadline = time.monotonic() + self.timeout
+            while not self.idle[key] and self.in_use[key] >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PrestoError('Timed out waiting for a free Presto connection.')
+                self.condition.wait(remaining)
+            pooled = self.idle[key].pop() if self.idle[key] else None
+            self.in_use[key] += 1
+        try:
+            if pooled is not None and not self.is_healthy(key, pooled):
+                self.close(pooled)
+                pooled = None
+            if pooled is None:
+                pooled = PooledSession(requests.Session())
+                with self.condition:
+                    self.created += 1
+            else:
+                with self.condition:
+                    self.reused += 1
+        except Exception:
+            self.release(key, None)
+            raise
+        return pooled
+
+    def release(self, key, pooled, discard=False):
+        with self.condition:
+            self.in_use[key] -= 1
+            if pooled is not None:
+                if discard:
+                    self.close(pooled)
+                else:
+                    pooled.last_used = time.monotonic()
+                    self.idle[key].append(pooled)
+            # Waiters of every key share the condition, only the ones of this key can go on
+            self.condition.notify_all()
+
+    @contextmanager
+    def session(self, host, port, protocol, user):
+        key = (host, port, protocol, user)
+        pooled = self.acquire(key)
+        try:
+            yield pooled.session
+        except Exception:
+            # The session may hold a broken connection, don't hand it out again
+            self.release(key, pooled, discard=True)
+            raise
+        else:
+            self.release(key, pooled)
+
+    def is_healthy(self, key, pooled):
+        if time.monotonic() - pooled.last_used < self.health_check_interval:
+            return True
+        host, port, protocol, user = key
+        try:
+            response = pooled.session.get(f'{protocol}://{host}:{port}/v1/info', timeout=5)
+        except requests.RequestException:
+            return False
+        return response.status_code == requests.codes.ok
+
+    def expire_idle(self):
+        now = time.monotonic()
+        for key, sessions in self.idle.items():
+            expired = [pooled for pooled in sessions if now - pooled.last_used >= self.idle_timeout]
+            for pooled in expired:
+                sessions.remove(pooled)
+                self.expired += 1
+                pooled.session.close()
+
+    def close(self, pooled):
+        self.discarded += 1
+        pooled.session.close()
+
+    def clear(self):
+        with self.condition:
+            for sessions in self.idle.values():
+                for pooled in sessions:
+                    pooled.session.close()
+            self.idle.clear()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'idle': sum(len(sessions) for sessions in self.idle.values()),
+                'in_use': sum(self.in_use.values()),
+                'max_size': self.max_size,
+                'created': self.created,
+                'reused': self.reused,
+                'expired': self.expired,
+                'discarded': self.discarded,
+            }
+
+
+presto_pool = PrestoConnectionPool(
+    max_size=settings.PRESTO_POOL_SIZE,
+    idle_timeout=settings.PRESTO_POOL_IDLE_TIMEOUT,
+    health_check_interval=settings.PRESTO_POOL_HEALTH_CHECK_INTERVAL,
+    timeout=settings.PRESTO_POOL_TIMEOUT,
+)
+
+single_flight = SingleFlight()
+
+
 def read_sql(file_name):
-    with open('sql/{}.sql'.format(file_name), 'r') as fd:
+    with open(os.path.join(settings.PRESTO_SQL_DIR, '{}.sql'.format(file_name)), 'r') as fd:
         sql_file = fd.read()
     return sql_file
 
 
+class ColumnBuffer():
+    def __init__(self, name, type):
+        self.name = name
+        self.typecode = COLUMN_BUFFER_TYPES.get(type)
+        self.values = array(self.typecode) if self.typecode else []
+
+    def extend(self, values):
+        if self.typecode:
+            length = len(self.values)
+            try:
+                self.values.extend(values)
+                return
+            except TypeError:
+                # NULLs don't fit in a typed buffer, fall back to a list for this column
+                del self.values[length:]
+                self.values = self.values.tolist()
+                self.typecode = None
+        self.values.extend(values)
+
+    def to_array(self):
+        if self.typecode:
+            if not self.values:
+                return np.empty(0, dtype=BUFFER_DTYPES[self.typecode])
+            return np.frombuffer(self.values, dtype=BUFFER_DTYPES[self.typecode])
+        return self.values
+
+
+def fetch_dataframe(session, sql, host, port, protocol, user, password=None):
+    # Reads the paged results straight into column buffers instead of going through pyhive rows
+    headers = {
+        'X-Presto-Catalog': 'hive',
+        'X-Presto-Schema': 'default',
+        'X-Presto-Source': 'revenue_latam',
+        'X-Presto-User': user,
+        'Accept-Encoding': 'gzip',
+    }
+    auth = requests.auth.HTTPBasicAuth(user, password) if password is not None else None
+    url = f'{protocol}://{host}:{port}/v1/statement'
+    # Proxies and CA bundle are read from the environment once, not for every page
+    send_settings = session.merge_environment_settings(url, {}, None, None, None)
+    response = session.post(url, data=sql.encode('utf-8'), headers=headers, auth=auth, **send_settings)
+    buffers = None
+    poll_interval = FAST_FETCH_POLL_INTERVAL
+    while True:
+        if response.status_code != requests.codes.ok:
+            raise exc.OperationalError(f'Unexpected status code {response.status_code}\n{response.content}')
+        page = fast_json.loads(response.content)
+        if 'error' in page:
+            raise exc.DatabaseError(page['error'])
+        if buffers is None and page.get('columns'):
+            buffers = [ColumnBuffer(column['name'], column['type']) for column in page['columns']]
+        rows = page.get('data')
+        if rows:
+            for buffer, values in zip(buffers, zip(*rows)):
+                buffer.extend(values)
+            report_fetch(len(rows), len(response.content))
+        next_uri = page.get('nextUri')
+        if next_uri is None:
+            break
+        if rows or response.request.method == 'POST':
+            poll_interval = FAST_FETCH_POLL_INTERVAL
+        else:
+            # Query still running
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, FAST_FETCH_MAX_POLL_INTERVAL)
+        request = session.prepare_request(requests.Request('GET', next_uri, headers=headers, auth=auth))
+        response = session.send(request, **send_settings)
+    if buffers is None:
+        return pd.DataFrame()
+    if not len(buffers[0].values):
+        return pd.DataFrame(columns=[buffer.name for buffer in buffers])
+    dataframe = pd.DataFrame({index: buffer.to_array() for index, buffer in enumerate(buffers)})
+    dataframe.columns = [buffer.name for buffer in buffers]
+    return dataframe
+
+
+def pyhive_dataframe(session, sql, host, port, protocol, user, password=None):
+    connection = presto.connect(
+        host,
+        port,
+        user,
+        password=password,
+        protocol=protocol,
+        requests_session=session,
+    )
+    dataframe = pd.read_sql(sql, connection)
+    connection.close()
+    return dataframe
+
+
 def query_presto(start_date, end_date, okta_username, okta_password, query, query_name):
+    sql = query.format(start_date, end_date)
+    key = single_flight.key(settings.PRESTO_HOST, str(settings.PRESTO_PORT), sql)
+    return single_flight.run(
+        key,
+        lambda: run_query(sql, okta_username, okta_password, query_name),
+        # A result someone else fetched is only given to users allowed to read the same tables
+        verify=lambda: check_access(sql, okta_username, okta_password, query_name),
+    )
+
+
+def run_query(sql, okta_username, okta_password, query_name):
+    fetch = fetch_dataframe if settings.PRESTO_FAST_FETCH else pyhive_dataframe
     try:
-        connection = presto.connect(
-            'presto-tableau.prod.dataf.eb',
-            8443,
+        with presto_pool.session(
+            settings.PRESTO_HOST,
+            settings.PRESTO_PORT,
+            settings.PRESTO_PROTOCOL,
             okta_username,
-            password=okta_password,
-            protocol='https',
-        )
-        dataframe = pd.read_sql(query.format(start_date, end_date), connection)
-        connection.close()
+        ) as session:
+            dataframe = fetch(
+                session,
+                sql,
+                settings.PRESTO_HOST,
+                settings.PRESTO_PORT,
+                settings.PRESTO_PROTOCOL,
+                okta_username,
+                # pyhive only sends the password over https (a local stand-in doesn't need it)
+                password=okta_password if settings.PRESTO_PROTOCOL == 'https' else None,
+            )
+    except PrestoError:
+        raise
     except pd.io.sql.DatabaseError as exception:
         error = exception.args[0].split('\n\n')[1]
         raise PrestoError(error)
-    except DatabaseError as exception:
+    except exc.DatabaseError as exception:
         # Raised when you don't have permissions to a specific table
 
         # Uncomment this if you are a developer with no access to the finance database
         # if query_name == 'transactions':
         #     dataframe = pd.read_csv('datasets/transactions.csv')
         #     return dataframe
-        message = exception.args[0]['message']
+        error = exception.args[0]
+        # OperationalError (unexpected HTTP status) carries the response text instead of the error dict
+        message = error['message'] if isinstance(error, dict) else str(error)
         raise PrestoError(message)
     except Exception as exception:
         message = "Unknown error.<br>" + str(exception)
@@ -67,7 +362,43 @@ def query_presto(start_date, end_date, okta_username, okta_password, query, quer
     return dataframe
 
 
-def make_query(start_date, end_date, okta_username, okta_password, query_name):
+def check_access(sql, okta_username, okta_password, query_name):
+    # Presto checks the permissions on every table a statement reads while planning it, EXPLAIN does
+    # that without running the query. Never shared through single_flight either.
+    run_query(f'EXPLAIN {sql}', okta_username, okta_password, query_name)
+
+
+def check_query_access(start_date, end_date, okta_username, okta_password, query_name, columns=None):
+    query = query_sql(query_name, columns).format(start_date, end_date)
+    check_access(query, okta_username, okta_password, query_name)
+
+
+def query_sql(query_name, columns=None):
     query = read_sql(query_name)
+    query_columns = get_query_columns(query_name, columns)
+    if query_columns is not None:
+        query = projected_sql(query, query_columns)
+    return query
+
+
+def aggregate_query_sql(start_date, end_date, aggregate):
+    queries = {query_name: read_sql(query_name).format(start_date, end_date) for query_name in QUERY_COLUMNS}
+    # The dates are already in place, escape the braces left for the format in query_presto
+    return aggregate_sql(queries, AGGREGATES[aggregate]).replace('{', '{{').replace('}', '}}')
+
+
+def consolidation_parts(start_date, end_date, dataframes, columns=None):
+    # What identifies a consolidated dataset: the SQL that ran, the range and the rows returned
+    return [[query_sql(name, columns) for name in dataframes], start_date, end_date, *dataframes.values()]
+
+
+def make_query(start_date, end_date, okta_username, okta_password, query_name, columns=None):
+    query = query_sql(query_name, columns)
     dataframe = query_presto(start_date, end_date, okta_username, okta_password, query, query_name)
     return dataframe
+
+
+def make_aggregate_query(start_date, end_date, okta_username, okta_password, aggregate):
+    query = aggregate_query_sql(start_date, end_date, aggregate)
+    dataframe = query_presto(start_date, end_date, okta_username, okta_password, query, aggregate)
+    return dataframe
@@ -0,0 +1,386 @@
+from datetime import (
+    date,
+    timedelta,
+)
+import gzip
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+import json
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Stand-in for the Presto coordinator, it speaks enough of the HTTP protocol for pyhive
+# (POST /v1/statement and paged nextUri results) and runs the queries on sqlite with synthetic data.
+
+FAILURE_MODES = ['error', 'http']
+
+PAYMENT_PROCESSORS = {
+    'ARS': ['ADYEN', 'MERCADO_PAGO'],
+    'BRL': ['ADYEN', 'MERCADO_PAGO', 'PAYPAL'],
+}
+
+SALES_VERTICALS = {
+    'ARS': 'Argentina',
+    'BRL': 'Brazil',
+}
+
+VERTICALS = [
+    ('Music/Promoters', 'Other - Music'),
+    ('Music/Promoters', 'Music Festival'),
+    ('Festivals/Special Events', 'Other'),
+    ('Registration', 'Business & Professional'),
+    ('Registration', ''),
+]
+
+SALES_FLAGS = ['sales', 'SSO']
+
+TRANSACTIONS_MONEY_COLUMNS = [
+    'sale__payment_amount__epp',
+    'sale__eb_tax__epp',
+    'sale__ap_organizer__gts__epp',
+    'sale__ap_organizer__royalty__epp',
+    'sale__gtf_esf__epp',
+    'refund__payment_amount__epp',
+    'refund__gtf_epp__gtf_esf__epp',
+    'refund__eb_tax__epp',
+    'refund__ap_organizer__gts__epp',
+    'refund__ap_organizer__royalty__epp',
+]
+
+
+def generate_organizers(random, count):
+    organizers = []
+    for index in range(count):
+        currency = random.choice(['ARS', 'BRL'])
+        events = []
+        for event_index in range(random.randint(1, 5)):
+            vertical, sub_vertical = VERTICALS[random.randint(len(VERTICALS))]
+            events.append({
+                'event_id': int(random.randint(10000000, 99999999)),
+                'event_title': f'Event {index}-{event_index}',
+                'vertical': vertical,
+                'sub_vertical': sub_vertical,
+            })
+        organizers.append({
+            'eventholder_user_id': int(random.randint(100000000, 999999999)),
+            'email': f'organizer{index}@example.com',
+            'organizer_name': f'Organizer {index}',
+            'currency': currency,
+            'sales_flag': SALES_FLAGS[random.randint(len(SALES_FLAGS))],
+            'events': events,
+        })
+    return organizers
+
+
+def generate_dataset(start_date, end_date, rows_per_day=100, seed=0):
+    random = np.random.RandomState(seed)
+    organizers = generate_organizers(random, max(5, rows_per_day // 5))
+    transactions = []
+    organizer_sales = []
+    organizer_refunds = []
+    day = start_date
+    while day <= end_date:
+        for _ in range(rows_per_day):
+            organizer = organizers[random.randint(len(organizers))]
+            event = organizer['events'][random.randint(len(organizer['events']))]
+            processors = PAYMENT_PROCESSORS[organizer['currency']]
+            is_refund = random.random_sample() < 0.1
+            tickets = int(random.randint(1, 50))
+            amount = round(tickets * random.uniform(100, 2000), 2)
+            fee = round(amount * random.uniform(0.04, 0.1), 2)
+            sign = -1 if is_refund else 1
+            money = dict.fromkeys(TRANSACTIONS_MONEY_COLUMNS, 0.0)
+            prefix = 'refund' if is_refund else 'sale'
+            money[f'{prefix}__payment_amount__epp'] = sign * amount
+            money[f'{prefix}__eb_tax__epp'] = sign * round(fee * 0.21, 2)
+            money[f'{prefix}__ap_organizer__gts__epp'] = sign * round(amount - fee, 2)
+            money['refund__gtf_epp__gtf_esf__epp' if is_refund else 'sale__gtf_esf__epp'] = sign * fee
+            transactions.append(dict(
+                eventholder_user_id=organizer['eventholder_user_id'],
+                transaction_created_date=day.isoformat(),
+                payment_processor=processors[random.randint(len(processors))],
+                currency=organizer['currency'],
+                event_id=event['event_id'],
+                email=organizer['email'],
+                is_refund=int(is_refund),
+                is_sale=int(not is_refund),
+                **money
+            ))
+            (organizer_refunds if is_refund else organizer_sales).append({
+                'trx_date': day.isoformat(),
+                'organizer_email': organizer['email'],
+                'organizer_name': organizer['organizer_name'],
+                'event_id': event['event_id'],
+                'event_title': event['event_title'],
+                'sales_flag': organizer['sales_flag'],
+                'sales_vertical': SALES_VERTICALS[organizer['currency']],
+                'vertical': event['vertical'],
+                'sub_vertical': event['sub_vertical'],
+                'GTSntv': sign * amount,
+                'GTFntv': sign * fee,
+                'PaidTix': sign * tickets,
+            })
+        day += timedelta(days=1)
+    transactions = pd.DataFrame(transactions)
+    corrections = transactions.sample(frac=0.02, random_state=seed)
+    corrections[TRANSACTIONS_MONEY_COLUMNS] = -corrections[TRANSACTIONS_MONEY_COLUMNS] * 0.5
+    return {
+        'transactions': transactions,
+        'corrections': corrections,
+        'organizer_sales': pd.DataFrame(organizer_sales),
+        'organizer_refunds': pd.DataFrame(organizer_refunds),
+    }
+
+
+def translate_sql(sql):
+    # Presto dialect bits used by the queries that sqlite doesn't understand
+    sql = re.sub(r"CAST\(\s*('[^']*'|[\w.]+)\s+AS\s+DATE\s*\)", r'DATE(\1)', sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bDATE\s+('[^']*')", r'\1', sql, flags=re.IGNORECASE)
+    # catalog.schema.table -> table
+    sql = re.sub(r'\b(FROM|JOIN)\s+(?:\w+\.)+(\w+)', r'\1 \2', sql, flags=re.IGNORECASE)
+    return sql
+
+
+def read_tables(sql):
+    return {name.split('.')[-1] for name in re.findall(r'\b(?:FROM|JOIN)\s+([\w.]+)', sql, flags=re.IGNORECASE)}
+
+
+def presto_type(values):
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            return 'boolean'
+        if isinstance(value, int):
+            return 'bigint'
+        if isinstance(value, float):
+            return 'double'
+        if re.match(r'^\d{4}-\d{2}-\d{2}$', value):
+            return 'date'
+        return 'varchar'
+    return 'varchar'
+
+
+class StandinEngine():
+    def __init__(self, dataset):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(':memory:', check_same_thread=False)
+        for name, dataframe in dataset.items():
+            dataframe.to_sql(name, self.connection, index=False)
+
+    def execute(self, sql):
+        with self.lock:
+            cursor = self.connection.execute(translate_sql(sql))
+            rows = [list(row) for row in cursor.fetchall()]
+        names = [description[0] for description in cursor.description]
+        columns = [
+            {'name': name, 'type': presto_type(row[index] for row in rows)}
+            for index, name in enumerate(names)
+        ]
+        return columns, rows
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without this every response waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.standin.count('handshakes')
+
+    def send_json(self, content, status=200):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if self.server.standin.compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=1)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        standin = self.server.standin
+        time.sleep(standin.latency)
+        if self.path == '/v1/info':
+            self.send_json({'nodeVersion': {'version': 'standin'}, 'coordinator': True, 'starting': False})
+            return
+        match = re.match(r'^/v1/statement/(\w+)/(\d+)$', self.path)
+        if match is None:
+            self.send_json({'message': 'Not found'}, 404)
+            return
+        self.send_page(match.group(1), int(match.group(2)))
+
+    def do_POST(self):
+        standin = self.server.standin
+        sql = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+        time.sleep(standin.latency)
+        if self.path != '/v1/statement':
+            self.send_json({'message': 'Not found'}, 404)
+            return
+        standin.count('statements')
+        query_id = uuid.uuid4().hex
+        denied = standin.denied_tables.get(self.headers.get('X-Presto-User'), set()) & read_tables(sql)
+        try:
+            if denied:
+                # Checked while planning, EXPLAIN is denied too
+                raise PermissionError(f'Access Denied: Cannot select from table {min(denied)}')
+            standin.queries[query_id] = standin.engine.execute(sql)
+        except (sqlite3.Error, PermissionError) as exception:
+            standin.queries[query_id] = exception
+        # Like Presto, the statement is queued first and the results (or error) are fetched from nextUri
+        self.send_json({
+            'id': query_id,
+            'nextUri': standin.next_uri(self, query_id, 0),
+            'stats': {'state': 'QUEUED'},
+        })
+
+    def do_DELETE(self):
+        match = re.match(r'^/v1/statement/(\w+)/(\d+)$', self.path)
+        if match:
+            self.server.standin.queries.pop(match.group(1), None)
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_page(self, query_id, token):
+        standin = self.server.standin
+        if query_id not in standin.queries:
+            self.send_json({'message': f'Query {query_id} not found'}, 404)
+            return
+        if isinstance(standin.queries[query_id], Exception):
+            exception = standin.queries.pop(query_id)
+            error_name = 'PERMISSION_DENIED' if isinstance(exception, PermissionError) else 'SYNTAX_ERROR'
+            self.send_json(standin.error_response(query_id, str(exception), error_name))
+            return
+        failure = standin.should_fail()
+        if failure == 'http':
+            standin.queries.pop(query_id)
+            self.send_json({'message': 'Service unavailable'}, 503)
+            return
+        if failure == 'error':
+            standin.queries.pop(query_id)
+            self.send_json(standin.error_response(
+                query_id,
+                'Access Denied: Cannot select from table (injected failure)',
+                'PERMISSION_DENIED',
+            ))
+            return
+        standin.count('pages')
+        columns, rows = standin.queries[query_id]
+        start = token * standin.page_size
+        page = {
+            'id': query_id,
+            'columns': columns,
+            'data': rows[start:start + standin.page_size],
+            'stats': {'state': 'RUNNING'},
+        }
+        if start + standin.page_size < len(rows):
+            page['nextUri'] = standin.next_uri(self, query_id, token + 1)
+        else:
+            page['stats']['state'] = 'FINISHED'
+            standin.queries.pop(query_id)
+        self.send_json(page)
+
+    def log_message(self, *args):
+        if self.server.standin.verbose:
+            super().log_message(*args)
+
+
+class PrestoStandin():
+    def __init__(
+        self,
+        host='127.0.0.1',
+        port=0,
+        dataset=None,
+        latency=0,
+        page_size=1000,
+        failure_rate=0,
+        failure_mode='error',
+        compress=True,
+        seed=0,
+        verbose=False,
+        denied_tables=None,
+    ):
+        if failure_mode not in FAILURE_MODES:
+            raise ValueError(f'failure_mode must be one of {FAILURE_MODES}')
+        if dataset is None:
+            today = date.today()
+            dataset = generate_dataset(today - timedelta(days=60), today, seed=seed)
+        self.engine = StandinEngine(dataset)
+        self.latency = latency
+        self.page_size = page_size
+        self.failure_rate = failure_rate
+        self.failure_mode = failure_mode
+        self.compress = compress
+        # {user: tables} the user has no permission to read
+        self.denied_tables = {user: set(tables) for user, tables in (denied_tables or {}).items()}
+        self.random = np.random.RandomState(seed)
+        self.verbose = verbose
+        self.queries = {}
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(['handshakes', 'statements', 'pages', 'failures'], 0)
+        self.server = ThreadingHTTPServer((host, port), StandinHandler)
+        self.server.daemon_threads = True
+        self.server.standin = self
+        self.thread = None
+
+    @property
+    def host(self):
+        return self.server.server_address[0]
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def next_uri(self, handler, query_id, token):
+        return 'http://{}/v1/statement/{}/{}'.format(handler.headers['Host'], query_id, token)
+
+    def error_response(self, query_id, message, error_name):
+        return {
+            'id': query_id,
+            'stats': {'state': 'FAILED'},
+            'error': {'message': message, 'errorName': error_name, 'errorCode': 1},
+        }
+
+    def should_fail(self):
+        with self.lock:
+            if self.failure_rate and self.random.random_sample() < self.failure_rate:
+                self.counters['failures'] += 1
+                return self.failure_mode
+        return None
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,27 @@
+from revenue_app.presto_connection import consolidation_parts
+from revenue_app.reports import fetch_dataframes
+from revenue_app.shared_datasets import (
+    content_key,
+    get_store,
+    SharedDataset,
+)
+from revenue_app.utils import (
+    generate_transactions_consolidation,
+    warm_derived,
+)
+
+PREWARM_OWNER = 'prewarm'
+
+
+def prewarm_range(start_date, end_date, okta_username, okta_password):
+    # The full report of the range, stored like MakeQuery would and found by MakeQuery through the alias
+    store = get_store()
+    start_date, end_date = str(start_date), str(end_date)
+    dataframes = fetch_dataframes(start_date, end_date, okta_username, okta_password)
+    transactions = generate_transactions_consolidation(**dataframes)
+    key = store.write(transactions, content_key(*consolidation_parts(start_date, end_date, dataframes)))
+    # Held until the ttl runs out, analysts leaving the dataset don't remove it
+    store.acquire(key, f'{PREWARM_OWNER}-{start_date}_{end_date}')
+    store.set_alias(f'{start_date}_{end_date}', key)
+    warm_derived({'transactions': SharedDataset(key, transactions.columns)})
+    return key
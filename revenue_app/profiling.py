@@ -0,0 +1,164 @@
+import cProfile
+from collections import Counter
+from datetime import datetime
+import hashlib
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+
+PROFILE_PARAM = 'profile'
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+PROFILE_MODES = ['cprofile', 'sample']
+
+SAMPLE_INTERVAL = 0.005
+
+
+def get_profiles_dir():
+    return getattr(settings, 'PROFILES_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+
+
+def get_profile_mode(request):
+    mode = request.GET.get(PROFILE_PARAM) or request.META.get(PROFILE_HEADER)
+    if not mode:
+        return None
+    return mode if mode in PROFILE_MODES else PROFILE_MODES[0]
+
+
+def dataset_fingerprint(transactions):
+    if transactions is None:
+        return None
+    if hasattr(transactions, 'key'):
+        # A shared dataset is written once under a fresh key
+        return transactions.key[:16]
+    import pandas as pd
+    hashed = pd.util.hash_pandas_object(transactions, index=False).values
+    return hashlib.sha1(hashed.tobytes()).hexdigest()[:16]
+
+
+class StackSampler():
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.sampler.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        # Collapsed stacks format, readable by flamegraph tools
+        with open(path, 'w') as fd:
+            for stack, count in self.stacks.most_common():
+                fd.write(f'{stack} {count}\n')
+
+
+def profile_request(get_response, request, mode):
+    if mode == 'sample':
+        profiler = StackSampler()
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        response = get_response(request)
+    finally:
+        duration = (time.perf_counter() - start) * 1000
+        if mode == 'sample':
+            profiler.stop()
+        else:
+            profiler.disable()
+    profile_id = save_profile(request, profiler, mode, duration)
+    response['X-Profile-Id'] = profile_id
+    return response
+
+
+def save_profile(request, profiler, mode, duration):
+    profiles_dir = get_profiles_dir()
+    os.makedirs(profiles_dir, exist_ok=True)
+    profile_id = '{}_{}'.format(datetime.now().strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:8])
+    extension = 'stacks' if mode == 'sample' else 'prof'
+    profile_path = os.path.join(profiles_dir, f'{profile_id}.{extension}')
+    if mode == 'sample':
+        profiler.dump(profile_path)
+    else:
+        profiler.dump_stats(profile_path)
+    resolver_match = getattr(request, 'resolver_match', None)
+    query_info = request.session.get('query_info') or {}
+    metadata = {
+        'id': profile_id,
+        'mode': mode,
+        'path': request.path,
+        'view': resolver_match.url_name if resolver_match else None,
+        'filters': {
+            key: value for key, value in request.GET.dict().items()
+            if key != PROFILE_PARAM
+        },
+        'start_date': str(query_info.get('start_date')),
+        'end_date': str(query_info.get('end_date')),
+        'exchange_data': request.session.get('exchange_data'),
+        'dataset_fingerprint': dataset_fingerprint(request.session.get('transactions')),
+        'user': request.user.get_username(),
+        'duration': round(duration, 2),
+        'created_at': datetime.now().isoformat(),
+        'file': os.path.basename(profile_path),
+    }
+    with open(os.path.join(profiles_dir, f'{profile_id}.json'), 'w') as fd:
+        json.dump(metadata, fd, indent=2)
+    return profile_id
+
+
+def list_profiles():
+    profiles_dir = get_profiles_dir()
+    if not os.path.isdir(profiles_dir):
+        return []
+    profiles = []
+    for file_name in sorted(os.listdir(profiles_dir)):
+        if file_name.endswith('.json'):
+            with open(os.path.join(profiles_dir, file_name)) as fd:
+                profiles.append(json.load(fd))
+    return profiles
+
+
+def get_profile(profile_id):
+    for metadata in list_profiles():
+        if metadata['id'] == profile_id:
+            return metadata
+    return None
+
+
+def dump_profile(metadata, sort='cumulative', limit=30):
+    profile_path = os.path.join(get_profiles_dir(), metadata['file'])
+    if metadata['mode'] == 'sample':
+        with open(profile_path) as fd:
+            return ''.join(fd.readlines()[:limit])
+    output = io.StringIO()
+    stats = pstats.Stats(profile_path, stream=output)
+    stats.sort_stats(sort).print_stats(limit)
+    return output.getvalue()
@@ -0,0 +1,170 @@
+from contextlib import contextmanager
+import glob
+import json
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+
+# Progress ids come from the query form, they name a file so nothing but a uuid is accepted
+PROGRESS_ID = re.compile(r'^[0-9a-f]{32}$')
+
+# The view emits it once the run is over, ok or not
+FINAL_EVENT = 'done'
+
+_local = threading.local()
+
+
+class ProgressChannel():
+    # One append-only file of JSON lines per query run: the request running the queries writes it and the
+    # event stream (another thread or worker process) tails it
+    def __init__(self, directory, progress_id):
+        self.path = os.path.join(directory, f'{progress_id}.jsonl')
+        self.owner_path = os.path.join(directory, f'{progress_id}.owner')
+
+    def claim(self, owner):
+        # The first session to open the channel (the run or its stream, whichever comes first) owns it.
+        # Linked in place so a competing request never reads a half written owner.
+        temporary = f'{self.owner_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as owner_file:
+            owner_file.write(owner)
+        try:
+            os.link(temporary, self.owner_path)
+        except FileExistsError:
+            with open(self.owner_path) as owner_file:
+                return owner_file.read() == owner
+        finally:
+            os.remove(temporary)
+        return True
+
+    def emit(self, event, **data):
+        line = json.dumps(dict(data, event=event, time=round(time.time(), 3)), default=str) + '\n'
+        # A single write of a line under PIPE_BUF with O_APPEND never interleaves with other writers
+        descriptor = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(descriptor, line.encode('utf-8'))
+        finally:
+            os.close(descriptor)
+
+    def read(self, offset=0):
+        try:
+            with open(self.path, 'rb') as channel_file:
+                channel_file.seek(offset)
+                content = channel_file.read()
+        except FileNotFoundError:
+            return [], offset
+        # A line still being written is read the next time
+        complete = content[:content.rfind(b'\n') + 1]
+        events = [json.loads(line) for line in complete.decode('utf-8').splitlines()]
+        return events, offset + len(complete)
+
+
+def get_channel(progress_id, owner):
+    # Channels are only open to the session that owns them
+    if not progress_id or not PROGRESS_ID.match(progress_id):
+        return None
+    os.makedirs(settings.PROGRESS_DIR, exist_ok=True)
+    expire_channels()
+    channel = ProgressChannel(settings.PROGRESS_DIR, progress_id)
+    return channel if channel.claim(owner) else None
+
+
+def expire_channels():
+    expired = time.time() - settings.PROGRESS_TTL
+    for path in glob.glob(os.path.join(settings.PROGRESS_DIR, '*.jsonl')) + \
+            glob.glob(os.path.join(settings.PROGRESS_DIR, '*.owner')):
+        try:
+            if os.path.getmtime(path) < expired:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def progress_channel(progress_id, owner):
+    # Everything reported from this thread while inside goes to the channel, reporting without one does nothing
+    _local.channel = get_channel(progress_id, owner)
+    try:
+        yield _local.channel
+    finally:
+        _local.__dict__.pop('channel', None)
+        _local.__dict__.pop('query', None)
+
+
+def report_progress(event, **data):
+    channel = getattr(_local, 'channel', None)
+    if channel is not None:
+        channel.emit(event, **data)
+
+
+@contextmanager
+def query_progress(name):
+    # running -> fetching (every page, fast fetch only) -> done | failed. The caller sets the rows returned,
+    # fetches shared with another request (single flight) report no pages here.
+    query = _local.query = {'name': name, 'rows': 0, 'bytes': 0}
+    start = time.perf_counter()
+    report_progress('query', name=name, state='running')
+    try:
+        yield query
+    except Exception as exception:
+        error = exception.args[0] if exception.args else exception
+        report_progress('query', name=name, state='failed', error=str(error))
+        raise
+    else:
+        report_progress(
+            'query',
+            name=name,
+            state='done',
+            rows=query['rows'],
+            bytes=query['bytes'],
+            ms=round((time.perf_counter() - start) * 1000, 2),
+        )
+    finally:
+        _local.__dict__.pop('query', None)
+
+
+def report_fetch(rows, size):
+    query = getattr(_local, 'query', None)
+    if query is None:
+        return
+    query['rows'] += rows
+    query['bytes'] += size
+    report_progress('query', name=query['name'], state='fetching', rows=query['rows'], bytes=query['bytes'])
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    yield
+    report_progress('stage', name=name, ms=round((time.perf_counter() - start) * 1000, 2))
+
+
+def server_sent_event(event, event_id=None):
+    event_id = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{event_id}event: {event["event"]}\ndata: {json.dumps(event)}\n\n'
+
+
+def stream_events(channel, offset=0, timeout=None, poll_interval=None):
+    # Tails the channel as Server-Sent Events until the run is done, with keep-alive comments
+    # so proxies don't close an idle stream while Presto is still working. A stream holds a worker thread,
+    # so it ends well before the worker timeout and the browser reconnects sending the last offset it got
+    # (the id of the last event of every read, the ones before it are sent again rather than skipped).
+    timeout = settings.PROGRESS_STREAM_TIMEOUT if timeout is None else timeout
+    poll_interval = settings.PROGRESS_POLL_INTERVAL if poll_interval is None else poll_interval
+    deadline = time.time() + timeout
+    idle_since = time.time()
+    yield 'retry: 1000\n\n'
+    while time.time() < deadline:
+        events, offset = channel.read(offset)
+        for position, event in enumerate(events, 1):
+            yield server_sent_event(event, offset if position == len(events) else None)
+            if event['event'] == FINAL_EVENT:
+                return
+        if events:
+            idle_since = time.time()
+        elif time.time() - idle_since > 15:
+            idle_since = time.time()
+            yield ': keep-alive\n\n'
+        time.sleep(poll_interval)
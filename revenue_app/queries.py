@@ -0,0 +1,280 @@
+from revenue_app.utils import (
+    CUSTOM_GROUPBY,
+    DESCRIPTIVE_COLUMNS,
+    MONEY_COLUMNS,
+    TIME_GROUPBY,
+)
+
+TRANSACTIONS_QUERY_COLUMNS = [
+    'eventholder_user_id',
+    'transaction_created_date',
+    'payment_processor',
+    'currency',
+    'event_id',
+    'email',
+    'is_refund',
+    'is_sale',
+    'sale__payment_amount__epp',
+    'sale__eb_tax__epp',
+    'sale__ap_organizer__gts__epp',
+    'sale__ap_organizer__royalty__epp',
+    'sale__gtf_esf__epp',
+    'refund__payment_amount__epp',
+    'refund__gtf_epp__gtf_esf__epp',
+    'refund__eb_tax__epp',
+    'refund__ap_organizer__gts__epp',
+    'refund__ap_organizer__royalty__epp',
+]
+
+ORGANIZER_QUERY_COLUMNS = [
+    'trx_date',
+    'organizer_email',
+    'organizer_name',
+    'event_id',
+    'event_title',
+    'sales_flag',
+    'sales_vertical',
+    'vertical',
+    'sub_vertical',
+    'GTSntv',
+    'GTFntv',
+    'PaidTix',
+]
+
+QUERY_COLUMNS = {
+    'transactions': TRANSACTIONS_QUERY_COLUMNS,
+    'corrections': TRANSACTIONS_QUERY_COLUMNS,
+    'organizer_sales': ORGANIZER_QUERY_COLUMNS,
+    'organizer_refunds': ORGANIZER_QUERY_COLUMNS,
+}
+
+# Columns always fetched, the consolidation merges and cleans the queries on them
+KEY_COLUMNS = {
+    'transactions': [
+        'eventholder_user_id',
+        'transaction_created_date',
+        'payment_processor',
+        'currency',
+        'event_id',
+        'email',
+        'is_refund',
+        'is_sale',
+    ],
+    'organizer_sales': ['trx_date', 'organizer_email', 'event_id', 'PaidTix'],
+}
+KEY_COLUMNS['corrections'] = KEY_COLUMNS['transactions']
+KEY_COLUMNS['organizer_refunds'] = KEY_COLUMNS['organizer_sales']
+
+TRANSACTIONS_MONEY_COLUMNS = [
+    column for column in TRANSACTIONS_QUERY_COLUMNS if column not in KEY_COLUMNS['transactions']
+]
+
+# Consolidated columns computed from other columns
+DERIVED_COLUMNS = {
+    'eb_perc_take_rate': ['sale__gtf_esf__epp', 'sale__payment_amount__epp'],
+}
+
+SUMMARY_COLUMNS = [
+    'transaction_created_date',
+    'eventholder_user_id',
+    'email',
+    'sales_flag',
+    'payment_processor',
+    'currency',
+    'PaidTix',
+    'event_id',
+    'event_title',
+    'eb_perc_take_rate',
+    'sale__payment_amount__epp',
+    'sale__gtf_esf__epp',
+    'refund__payment_amount__epp',
+    'refund__gtf_epp__gtf_esf__epp',
+]
+
+TOTALS_COLUMNS = [column for column in SUMMARY_COLUMNS if column != 'transaction_created_date']
+
+# Dimensions of the totals aggregated in Presto, every custom groupby is a subset of them
+GROUPING_COLUMNS = [
+    'eventholder_user_id',
+    'email',
+    'sales_flag',
+    'payment_processor',
+    'currency',
+    'sales_vertical',
+    'vertical',
+    'sub_vertical',
+    'event_id',
+    'event_title',
+]
+
+AGGREGATES = {
+    'totals': GROUPING_COLUMNS,
+    'daily': ['transaction_created_date', 'currency'],
+}
+
+AGGREGATE_COLUMNS = GROUPING_COLUMNS + MONEY_COLUMNS + ['PaidTix', 'eb_perc_take_rate']
+
+DAILY_COLUMNS = AGGREGATES['daily'] + MONEY_COLUMNS + ['PaidTix', 'eb_perc_take_rate']
+
+# Consolidated columns needed by each view, views not listed here need every column
+VIEW_COLUMNS = {
+    'dashboard': TOTALS_COLUMNS,
+    'exchange': SUMMARY_COLUMNS,
+    'top-organizers': TOTALS_COLUMNS,
+    'top-organizers-refunds': TOTALS_COLUMNS,
+    'top-events': TOTALS_COLUMNS,
+    'json_top_organizers': TOTALS_COLUMNS,
+    'json_top_organizers_refunds': TOTALS_COLUMNS,
+    'json_top_events': TOTALS_COLUMNS,
+    'json_dashboard_summary': TOTALS_COLUMNS,
+    'json_dashboard_charts': TOTALS_COLUMNS,
+    'pdf-dashboard': TOTALS_COLUMNS,
+    'pdf-top-organizers': TOTALS_COLUMNS,
+    'pdf-top-organizers-refunds': TOTALS_COLUMNS,
+    'pdf-top-events': TOTALS_COLUMNS,
+}
+
+FILTER_COLUMNS = {
+    'start_date': 'transaction_created_date',
+    'end_date': 'transaction_created_date',
+    'event_id': 'event_id',
+    'email': 'email',
+    'currency': 'currency',
+    'eventholder_user_id': 'eventholder_user_id',
+}
+
+PUSHDOWN_REPORT = 'pushdown'
+
+REPORTS = {
+    'full': None,
+    'summary': SUMMARY_COLUMNS,
+    PUSHDOWN_REPORT: AGGREGATE_COLUMNS,
+}
+
+REPORT_CHOICES = [
+    ('full', 'Full (every view and export)'),
+    ('summary', 'Summary (dashboard and top pages)'),
+    (PUSHDOWN_REPORT, 'Totals aggregated in Presto (dashboard, top and grouped pages, up to a year)'),
+]
+
+
+def get_query_columns(query_name, columns):
+    if columns is None:
+        return None
+    needed = set(KEY_COLUMNS[query_name])
+    for column in columns:
+        needed.update(DERIVED_COLUMNS.get(column, [column]))
+    return [column for column in QUERY_COLUMNS[query_name] if column in needed]
+
+
+def subquery(sql):
+    return sql.strip().rstrip(';')
+
+
+def projected_sql(sql, columns):
+    # Presto prunes the columns of the inner query that the outer select doesn't use
+    selected = ', '.join(f'"{column}"' for column in columns)
+    return f'SELECT {selected}\nFROM (\n{subquery(sql)}\n) AS projected'
+
+
+def consolidated_sql(flag, organizer_query):
+    # merge_transactions for one side (sales or refunds), missing organizer data is 'n/a' like in pandas
+    descriptive = [column for column in DESCRIPTIVE_COLUMNS if column not in ('email', 'event_id')]
+    selected = ',\n'.join(
+        [f't.{column}' for column in AGGREGATES['daily'] + ['eventholder_user_id', 'email', 'event_id']]
+        + ["coalesce(t.payment_processor, '') AS payment_processor"]
+        + [f"coalesce(d.{column}, 'n/a') AS {column}" for column in descriptive]
+        + ['coalesce(p.PaidTix, 0) AS PaidTix']
+        + [f't.{column}' for column in TRANSACTIONS_MONEY_COLUMNS + ['eb_perc_take_rate']]
+    )
+    return f'''SELECT
+{selected}
+FROM merged_transactions t
+LEFT JOIN (
+SELECT DISTINCT organizer_email, event_id, {', '.join(descriptive)}
+FROM {organizer_query}
+WHERE PaidTix <> 0
+) d ON d.organizer_email = t.email AND d.event_id = t.event_id
+LEFT JOIN (
+SELECT DISTINCT trx_date, organizer_email, event_id, PaidTix
+FROM {organizer_query}
+WHERE PaidTix <> 0
+) p ON p.trx_date = t.transaction_created_date AND p.organizer_email = t.email AND p.event_id = t.event_id
+WHERE t.{flag} = 1'''
+
+
+def aggregate_sql(queries, grouping):
+    # generate_transactions_consolidation in SQL, summed by `grouping` so only the totals leave Presto.
+    # Corrections are summed into the transactions on the same keys as merge_corrections.
+    keys = ', '.join(KEY_COLUMNS['transactions'])
+    # Money in cents like the consolidation keeps it: the raw amounts summed per transaction and rounded once
+    merged_money = ',\n'.join(
+        f'CAST(round(sum({column}) * 100) AS BIGINT) AS {column}' for column in TRANSACTIONS_MONEY_COLUMNS
+    )
+    groups = ', '.join(grouping)
+    summed = TRANSACTIONS_MONEY_COLUMNS + ['PaidTix', 'eb_perc_take_rate']
+    totals = ',\n'.join(
+        [f'"{column}"' for column in grouping] + [f'sum({column}) AS "{column}"' for column in summed]
+    )
+    return f'''WITH transactions_query AS (
+{subquery(queries['transactions'])}
+),
+corrections_query AS (
+{subquery(queries['corrections'])}
+),
+organizer_sales_query AS (
+{subquery(queries['organizer_sales'])}
+),
+organizer_refunds_query AS (
+{subquery(queries['organizer_refunds'])}
+),
+merged_transactions AS (
+SELECT
+{keys},
+{merged_money},
+CASE WHEN sum(sale__payment_amount__epp) = 0 THEN 0
+ELSE round(sum(sale__gtf_esf__epp) / sum(sale__payment_amount__epp) * 100, 2) END AS eb_perc_take_rate
+FROM (
+SELECT {', '.join(TRANSACTIONS_QUERY_COLUMNS)} FROM transactions_query
+UNION ALL
+SELECT {', '.join(TRANSACTIONS_QUERY_COLUMNS)} FROM corrections_query
+) AS transactions_corrections
+GROUP BY {keys}
+),
+consolidated AS (
+{consolidated_sql('is_sale', 'organizer_sales_query')}
+UNION ALL
+{consolidated_sql('is_refund', 'organizer_refunds_query')}
+)
+SELECT
+{totals}
+FROM consolidated
+GROUP BY {groups}'''
+
+
+def get_view_columns(view_name, params=None):
+    params = params or {}
+    if view_name == 'transactions-grouped':
+        groupby = params.get('groupby')
+        if groupby in TIME_GROUPBY:
+            columns = DAILY_COLUMNS
+        elif groupby in CUSTOM_GROUPBY:
+            columns = AGGREGATE_COLUMNS
+        else:
+            columns = None
+    else:
+        columns = VIEW_COLUMNS.get(view_name)
+    if columns is None:
+        return None
+    # Filtering needs the filtered column, e.g. a date range can't be applied to the totals
+    filtered = [FILTER_COLUMNS[key] for key in FILTER_COLUMNS if params.get(key)]
+    return columns + [column for column in filtered if column not in columns]
+
+
+def has_columns(dataset_columns, columns):
+    # None means the full dataset
+    if dataset_columns is None:
+        return True
+    if columns is None:
+        return False
+    return set(columns) <= set(dataset_columns)
@@ -0,0 +1,103 @@
+import calendar
+from datetime import timedelta
+import importlib.util
+import os
+
+from revenue_app.presto_connection import (
+    consolidation_parts,
+    make_query,
+)
+from revenue_app.shared_datasets import get_content_dataset
+from revenue_app.utils import (
+    cents_to_money,
+    dataframe_to_usd,
+    generate_transactions_consolidation,
+    manage_transactions,
+    month_range,
+    ORGANIZER_COLUMNS,
+    TRANSACTIONS_COLUMNS,
+)
+
+QUERIES = ['transactions', 'corrections', 'organizer_sales', 'organizer_refunds']
+
+EXPORT_FORMATS = ['csv', 'xls', 'xlsx', 'parquet']
+
+# Formats written through an optional engine, any of them will do
+EXPORT_ENGINES = {
+    'xls': ['xlwt'],
+    'xlsx': ['openpyxl', 'xlsxwriter'],
+    'parquet': ['pyarrow', 'fastparquet'],
+}
+
+
+def range_months(start_date, end_date):
+    # Month names like the exchange form, the rates are given per month
+    months = []
+    day = start_date
+    while day <= end_date:
+        months.append(calendar.month_name[day.month])
+        day = month_range(day.year, day.month)[1] + timedelta(days=1)
+    return list(dict.fromkeys(months))
+
+
+def missing_engines(export_formats):
+    return {
+        export_format: EXPORT_ENGINES[export_format]
+        for export_format in export_formats
+        if export_format in EXPORT_ENGINES
+        and not any(importlib.util.find_spec(engine) for engine in EXPORT_ENGINES[export_format])
+    }
+
+
+def export_dataframe(dataframe, path, export_formats):
+    paths = []
+    for export_format in export_formats:
+        export_path = f'{path}.{export_format}'
+        if export_format == 'csv':
+            dataframe.to_csv(export_path, index=False)
+        elif export_format == 'parquet':
+            dataframe.to_parquet(export_path, index=False)
+        else:
+            dataframe.to_excel(export_path, sheet_name='Transactions', index=False)
+        paths.append(export_path)
+    return paths
+
+
+def fetch_dataframes(start_date, end_date, okta_username, okta_password):
+    return {
+        query_name: make_query(
+            start_date=start_date,
+            end_date=end_date,
+            okta_username=okta_username,
+            okta_password=okta_password,
+            query_name=query_name,
+        )
+        for query_name in QUERIES
+    }
+
+
+def build_report(start_date, end_date, okta_username, okta_password, output_dir, export_formats,
+                 exchange_data=None, organizers=()):
+    # fetch -> consolidation -> USD -> exports for one range, runs in a worker process
+    start_date, end_date = str(start_date), str(end_date)
+    dataframes = fetch_dataframes(start_date, end_date, okta_username, okta_password)
+    transactions = get_content_dataset(
+        lambda: generate_transactions_consolidation(**dataframes),
+        lambda: consolidation_parts(start_date, end_date, dataframes),
+    )
+    if exchange_data:
+        transactions = dataframe_to_usd(transactions, exchange_data)
+    name = f'{start_date}_{end_date}'
+    paths = export_dataframe(
+        cents_to_money(transactions[TRANSACTIONS_COLUMNS]),
+        os.path.join(output_dir, f'transactions_{name}'),
+        export_formats,
+    )
+    for organizer in organizers:
+        organizer_transactions = manage_transactions(transactions, eventholder_user_id=organizer)
+        paths += export_dataframe(
+            cents_to_money(organizer_transactions[ORGANIZER_COLUMNS]),
+            os.path.join(output_dir, f'organizer_{organizer}_{name}'),
+            export_formats,
+        )
+    return paths
@@ -0,0 +1,136 @@
+import bisect
+import re
+import sys
+
+
+# What an organizer or event is found by, besides its id
+SEARCH_FIELDS = {
+    'eventholder_user_id': ['organizer_name', 'email'],
+    'event_id': ['event_title', 'email'],
+}
+
+SEARCH_TYPES = {
+    'eventholder_user_id': 'organizer',
+    'event_id': 'event',
+}
+
+SEARCH_LIMIT = 10
+
+# Exact field, field prefix, word prefix, anywhere
+EXACT, PREFIX, WORD_PREFIX, SUBSTRING = range(4)
+
+WORD_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def trigrams(text):
+    return {text[position:position + 3] for position in range(len(text) - 2)}
+
+
+class SearchIndex():
+    # Trigrams find the entries containing a query of 3+ characters, shorter ones (and ids) are looked up
+    # as word prefixes in a sorted list, neither scans the entries
+    def __init__(self, entries):
+        self.entries = entries
+        self.trigrams = {}
+        words = set()
+        for position, entry in enumerate(entries):
+            for text in entry['texts']:
+                for trigram in trigrams(text):
+                    self.trigrams.setdefault(trigram, set()).add(position)
+                words.update((word, position) for word in WORD_SEPARATORS.split(text) if word)
+            words.add((entry['id'], position))
+        self.words = sorted(words)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def nbytes(self):
+        # What the index adds, not counting the texts of the entries
+        return (
+            sys.getsizeof(self.entries) + sum(sys.getsizeof(entry) for entry in self.entries)
+            + sys.getsizeof(self.trigrams)
+            + sum(sys.getsizeof(trigram) + sys.getsizeof(posting) for trigram, posting in self.trigrams.items())
+            + sys.getsizeof(self.words) + sum(sys.getsizeof(pair) + sys.getsizeof(pair[0]) for pair in self.words)
+        )
+
+    def prefixed(self, query):
+        start = bisect.bisect_left(self.words, (query,))
+        positions = set()
+        for word, position in self.words[start:]:
+            if not word.startswith(query):
+                break
+            positions.add(position)
+        return positions
+
+    def containing(self, query):
+        postings = sorted((self.trigrams.get(trigram, set()) for trigram in trigrams(query)), key=len)
+        positions = set(postings[0])
+        for posting in postings[1:]:
+            positions &= posting
+        return positions
+
+    def rank(self, entry, query):
+        if entry['id'] == query:
+            return EXACT
+        ranks = [SUBSTRING]
+        for text in entry['texts']:
+            if text == query:
+                ranks.append(EXACT)
+            elif text.startswith(query):
+                ranks.append(PREFIX)
+            elif any(word.startswith(query) for word in WORD_SEPARATORS.split(text)):
+                ranks.append(WORD_PREFIX)
+        if entry['id'].startswith(query):
+            ranks.append(PREFIX)
+        return min(ranks)
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        query = query.strip().lower()
+        if not query:
+            return []
+        positions = self.prefixed(query)
+        if len(query) >= 3:
+            positions |= {
+                position for position in self.containing(query)
+                if any(query in text for text in self.entries[position]['texts'])
+            }
+        ranked = sorted(
+            positions,
+            key=lambda position: (
+                self.rank(self.entries[position], query),
+                -self.entries[position]['weight'],
+                self.entries[position]['label'],
+            ),
+        )
+        return [
+            {
+                'type': self.entries[position]['type'],
+                'id': self.entries[position]['id'],
+                'label': self.entries[position]['label'],
+                'detail': self.entries[position]['detail'],
+            }
+            for position in ranked[:limit]
+        ]
+
+
+def build_search_index(profiles):
+    # From the profile tables, one entry per organizer and per event weighted by its paid tickets
+    entries = []
+    for key, profile in profiles.items():
+        details = profile['details']
+        totals = profile['totals']
+        fields = [field for field in SEARCH_FIELDS.get(key, []) if field in details.columns]
+        for value, row in zip(details.index, details[fields].values.tolist()):
+            texts = [str(text) for text in row if text and text != 'n/a']
+            label = texts[0] if texts else str(value)
+            email = details.at[value, 'email'] if 'email' in details.columns else ''
+            entries.append({
+                'type': SEARCH_TYPES[key],
+                'id': str(value),
+                'label': label,
+                'detail': email if email and email != label else str(value),
+                'texts': [text.lower() for text in texts],
+                'weight': int(totals.at[value, 'PaidTix']) if 'PaidTix' in totals.columns else 0,
+            })
+    return SearchIndex(entries)
@@ -0,0 +1,389 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+from django.conf import settings
+
+from revenue_app.cache import LRUCache
+from revenue_app.imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+internals = lazy_import('pandas.core.internals')
+
+# Columns of these kinds are mapped as they are, object columns are stored as codes + uniques
+MAPPED_KINDS = 'biufM'
+
+# Part of every content key, bumped when consolidated datasets change layout (money in cents since 2) so the
+# ones stored before are not read back
+DATASET_FORMAT = 2
+
+# Frames read in this process, the object columns are decoded once per dataset instead of on every read
+SHARED_FRAMES_SIZE = 4
+
+shared_frames = LRUCache(SHARED_FRAMES_SIZE)
+
+
+class SharedDataset():
+    # Kept in the session instead of the frame, the columns are there so views can check them without loading
+    def __init__(self, key, columns, base=None):
+        self.key = key
+        self.columns = columns
+        # The dataset this one was derived from (an exchange applied), restored without recomputing
+        self.base = base
+
+    def keys(self):
+        return [self.key] + (self.base.keys() if self.base is not None else [])
+
+
+class SharedDatasetStore():
+    # Consolidated frames written once as one .npy per dtype block, every worker maps them copy-on-write so
+    # the page cache holds a single copy. Writes from a request go to private pages and are never shared.
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def supports(self, dataframe):
+        dtypes = list(dataframe.dtypes) + [dataframe.index.dtype]
+        return dataframe.columns.is_unique and all(
+            dtype == object or (isinstance(dtype, np.dtype) and dtype.kind in MAPPED_KINDS)
+            for dtype in dtypes
+        )
+
+    def write(self, dataframe, key=None):
+        os.makedirs(self.directory, exist_ok=True)
+        self.expire()
+        key = key or uuid.uuid4().hex
+        if self.exists(key):
+            return key
+        temporary_path = self.path(f'{key}.{uuid.uuid4().hex}.tmp')
+        os.makedirs(temporary_path)
+        # One block per dtype, laid out (columns, rows) like pandas keeps them
+        positions_by_dtype = {}
+        for position, dtype in enumerate(dataframe.dtypes):
+            positions_by_dtype.setdefault(str(dtype), []).append(position)
+        meta = {
+            'columns': dataframe.columns.tolist(),
+            'index': self.write_block(temporary_path, 'index', dataframe.index.values.reshape(1, -1)),
+            'index_name': dataframe.index.name,
+            'blocks': [
+                dict(
+                    self.write_block(temporary_path, f'block{number}', dataframe.iloc[:, positions].values.T),
+                    positions=positions,
+                )
+                for number, positions in enumerate(positions_by_dtype.values())
+            ],
+        }
+        with open(os.path.join(temporary_path, 'meta.json'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+        try:
+            os.rename(temporary_path, self.path(key))
+        except OSError:
+            # Another worker wrote the same content first
+            shutil.rmtree(temporary_path, ignore_errors=True)
+        return key
+
+    def write_block(self, path, name, values):
+        if values.dtype == object:
+            codes = np.empty(values.shape, dtype=np.int32)
+            uniques = []
+            for row, column in enumerate(values):
+                codes[row], column_uniques = pd.factorize(column)
+                uniques.append(list(column_uniques))
+            np.save(os.path.join(path, f'{name}.npy'), codes)
+            pd.to_pickle(uniques, os.path.join(path, f'{name}.uniques.pkl'))
+        else:
+            np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(values))
+        return {'name': name, 'dtype': str(values.dtype)}
+
+    def read_block(self, path, block):
+        values = np.load(os.path.join(path, f'{block["name"]}.npy'), mmap_mode='c')
+        if block['dtype'] != 'object':
+            return values
+        # Strings can't be mapped, each reader decodes its own object array
+        uniques = pd.read_pickle(os.path.join(path, f'{block["name"]}.uniques.pkl'))
+        decoded = np.empty(values.shape, dtype=object)
+        for row, column_uniques in enumerate(uniques):
+            # Code -1 (missing value) picks the NaN appended at the end
+            decoded[row] = np.array(column_uniques + [np.nan], dtype=object)[values[row]]
+        return decoded
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.path(key), 'meta.json'))
+
+    def read_meta(self, key):
+        try:
+            with open(os.path.join(self.path(key), 'meta.json')) as meta_file:
+                return json.load(meta_file)
+        except FileNotFoundError:
+            return None
+
+    def columns(self, key):
+        meta = self.read_meta(key)
+        return pd.Index(meta['columns']) if meta is not None else None
+
+    def read(self, key):
+        # The same frame for every read in the process, whoever needs to change it copies it first
+        path = self.path(key)
+        if not self.exists(key):
+            return None
+        dataframe = shared_frames.get((path,))
+        if dataframe is None:
+            dataframe = self.load(key)
+            if dataframe is not None:
+                shared_frames.set((path,), dataframe)
+        return dataframe
+
+    def load(self, key):
+        path = self.path(key)
+        meta = self.read_meta(key)
+        if meta is None:
+            return None
+        index = pd.Index(self.read_block(path, meta['index'])[0], name=meta['index_name'])
+        blocks = [
+            internals.make_block(self.read_block(path, block), placement=block['positions'])
+            for block in meta['blocks']
+        ]
+        return pd.DataFrame(internals.BlockManager(blocks, [pd.Index(meta['columns']), index]))
+
+    def reference_path(self, key, owner):
+        return os.path.join(self.path(key), f'{owner}.ref')
+
+    def references(self, key):
+        return len(glob.glob(os.path.join(self.path(key), '*.ref')))
+
+    def acquire(self, key, owner):
+        if not self.exists(key):
+            return False
+        try:
+            with open(self.reference_path(key, owner), 'w'):
+                pass
+        except FileNotFoundError:
+            return False
+        return True
+
+    def touch(self, key, owner):
+        # Sessions outlive the ttl, a reference lasts as long as its session keeps reading the dataset
+        try:
+            os.utime(self.reference_path(key, owner))
+        except FileNotFoundError:
+            pass
+
+    def release(self, key, owner):
+        try:
+            os.remove(self.reference_path(key, owner))
+        except FileNotFoundError:
+            pass
+        if not self.references(key):
+            shutil.rmtree(self.path(key), ignore_errors=True)
+
+    def derived_path(self, key, name):
+        return os.path.join(self.path(key), 'derived', f'{hashlib.sha1(name.encode("utf-8")).hexdigest()}.pkl')
+
+    def read_derived(self, key, name):
+        try:
+            return pd.read_pickle(self.derived_path(key, name))
+        except (OSError, EOFError):
+            return None
+
+    def write_derived(self, key, name, value):
+        path = self.derived_path(key, name)
+        temporary_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            pd.to_pickle(value, temporary_path)
+            os.replace(temporary_path, path)
+        except OSError:
+            # The dataset expired meanwhile
+            pass
+
+    def alias_path(self, name):
+        return self.path(f'alias-{name}.json')
+
+    def set_alias(self, name, key):
+        temporary_path = f'{self.alias_path(name)}.{uuid.uuid4().hex}.tmp'
+        with open(temporary_path, 'w') as alias_file:
+            json.dump({'key': key, 'created': time.time()}, alias_file)
+        os.replace(temporary_path, self.alias_path(name))
+
+    def get_alias(self, name):
+        try:
+            with open(self.alias_path(name)) as alias_file:
+                return json.load(alias_file)
+        except (OSError, ValueError):
+            return None
+
+    def expire(self):
+        # References of sessions that never released them (expired, abandoned) only last the ttl
+        expired = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = self.path(name)
+            try:
+                if os.path.isfile(path):
+                    if os.path.getmtime(path) < expired:
+                        os.remove(path)
+                    continue
+                for reference_path in glob.glob(os.path.join(path, '*.ref')):
+                    if os.path.getmtime(reference_path) < expired:
+                        os.remove(reference_path)
+                if os.path.getmtime(path) < expired and not self.references(name):
+                    shutil.rmtree(path)
+            except OSError:
+                pass
+
+
+def get_store():
+    if not settings.SHARED_DATASET_DIR:
+        return None
+    return SharedDatasetStore(settings.SHARED_DATASET_DIR, settings.SHARED_DATASET_TTL)
+
+
+def content_key(*parts):
+    # Same queries over the same range returning the same rows give the same key, whoever ran them
+    digest = hashlib.sha256(f'format {DATASET_FORMAT}\0'.encode('utf-8'))
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            digest.update(json.dumps(part.columns.tolist(), default=str).encode('utf-8'))
+            digest.update(pd.util.hash_pandas_object(part).values.tobytes())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def get_owner(session):
+    return session.setdefault('dataset_owner', uuid.uuid4().hex)
+
+
+def replace_dataset(session, name, value):
+    # The new references are taken before the old ones go, the same dataset can be both
+    store = get_store()
+    previous = session.get(name)
+    if isinstance(value, SharedDataset):
+        for key in value.keys():
+            store.acquire(key, get_owner(session))
+    if isinstance(previous, SharedDataset) and store is not None:
+        for key in previous.keys():
+            if not isinstance(value, SharedDataset) or key not in value.keys():
+                store.release(key, get_owner(session))
+    session[name] = value
+
+
+def set_dataset(session, name, dataframe, key=None, base=None):
+    store = get_store()
+    if store is None or dataframe is None or not store.supports(dataframe):
+        replace_dataset(session, name, dataframe)
+        return
+    replace_dataset(session, name, SharedDataset(store.write(dataframe, key), dataframe.columns, base))
+
+
+def set_content_dataset(session, name, build, get_parts, base=None):
+    # Sessions with identical inputs reference the same dataset, only the first one builds it.
+    # The inputs are only gathered (SQL read, raw data hashed) when datasets are shared.
+    store = get_store()
+    if store is None:
+        replace_dataset(session, name, build())
+        return
+    key = content_key(*([base.key] if base is not None else []), *get_parts())
+    columns = store.columns(key)
+    if columns is None:
+        set_dataset(session, name, build(), key, base)
+    else:
+        replace_dataset(session, name, SharedDataset(key, columns, base))
+
+
+def get_content_dataset(build, get_parts):
+    # Outside a session (batch reports) the dataset is kept under its content key until it expires
+    store = get_store()
+    if store is None:
+        return build()
+    key = content_key(*get_parts())
+    dataframe = store.read(key)
+    if dataframe is None:
+        dataframe = build()
+        if store.supports(dataframe):
+            store.write(dataframe, key)
+    return dataframe
+
+
+def get_derived(session, name, compute, dataset='transactions'):
+    # Results computed from a shared dataset are kept next to it, for every session on the same dataset
+    value = session.get(dataset)
+    store = get_store()
+    if not isinstance(value, SharedDataset) or store is None:
+        return compute(get_dataset(session, dataset))
+    derived = store.read_derived(value.key, name)
+    if derived is None:
+        derived = compute(store.read(value.key))
+        store.write_derived(value.key, name, derived)
+    return derived
+
+
+def get_prewarmed_dataset(name, fresh_since):
+    # Kept under an alias by prewarm_cache, only trusted when it was built after the range was complete
+    store = get_store()
+    if store is None:
+        return None
+    alias = store.get_alias(name)
+    if alias is None or alias['created'] < fresh_since:
+        return None
+    columns = store.columns(alias['key'])
+    return SharedDataset(alias['key'], columns) if columns is not None else None
+
+
+def layer_dataset(session, name, dataframe, *parts):
+    # Derived per user (e.g. an exchange) but shared with everyone deriving the same from the same base
+    current = session.get(name)
+    if not isinstance(current, SharedDataset):
+        set_dataset(session, name, dataframe)
+        return
+    base = current.base or current
+    set_content_dataset(session, name, lambda: dataframe, lambda: parts, base=base)
+
+
+def restore_base_dataset(session, name):
+    current = session.get(name)
+    if not isinstance(current, SharedDataset) or current.base is None:
+        return False
+    replace_dataset(session, name, current.base)
+    return True
+
+
+def get_dataset_key(session, name='transactions'):
+    value = session.get(name)
+    return value.key if isinstance(value, SharedDataset) else None
+
+
+def touch_dataset(session, store, value):
+    for key in value.keys():
+        store.touch(key, get_owner(session))
+
+
+def get_dataset(session, name='transactions'):
+    # The frame itself, not a copy: whoever needs to change it copies it first
+    value = session.get(name)
+    if isinstance(value, SharedDataset):
+        store = get_store()
+        if store is None:
+            return None
+        touch_dataset(session, store, value)
+        return store.read(value.key)
+    return value
+
+
+def has_dataset(session, name='transactions'):
+    value = session.get(name)
+    if isinstance(value, SharedDataset):
+        store = get_store()
+        if store is None or not store.exists(value.key):
+            return False
+        touch_dataset(session, store, value)
+        return True
+    return value is not None
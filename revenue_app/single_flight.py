@@ -0,0 +1,177 @@
+import glob
+import hashlib
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from revenue_app.imports import lazy_import
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks (Windows), identical fetches are only shared between threads
+    fcntl = None
+
+pd = lazy_import('pandas')
+
+
+class Flight():
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight():
+    # Identical concurrent fetches run once: threads wait on an in-process flight and
+    # processes (WSGI workers) wait on a file lock, then read the result the leader left for them.
+    # Without a directory or ttl the settings in effect at the time of the call are used.
+    def __init__(self, directory=None, result_ttl=None):
+        self.directory = directory
+        self.result_ttl = result_ttl
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.fetches = 0
+        self.shared = 0
+
+    def key(self, *parts):
+        return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    def get_directory(self):
+        return self.directory or settings.PRESTO_SINGLE_FLIGHT_DIR
+
+    def get_result_ttl(self):
+        return self.result_ttl if self.result_ttl is not None else settings.PRESTO_SINGLE_FLIGHT_RESULT_TTL
+
+    def paths(self, key):
+        directory = self.get_directory()
+        return os.path.join(directory, f'{key}.lock'), os.path.join(directory, f'{key}.pkl')
+
+    def run(self, key, fetch, verify=None):
+        # verify is called before a result fetched by someone else is handed over (e.g. the caller's own
+        # credentials), it raises when the caller may not have it
+        with self.lock:
+            self.calls += 1
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.failed:
+                # The leader failed (e.g. wrong credentials), don't share its error
+                result, shared = self.fetch_across_processes(key, fetch)
+            else:
+                result, shared = flight.result.copy(), True
+            return self.hand_over(result, shared, verify)
+        try:
+            flight.result, shared = self.fetch_across_processes(key, fetch)
+        except Exception:
+            flight.failed = True
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return self.hand_over(flight.result, shared, verify)
+
+    def hand_over(self, result, shared, verify):
+        if shared:
+            if verify is not None:
+                verify()
+            with self.lock:
+                self.shared += 1
+        return result
+
+    def fetch_across_processes(self, key, fetch):
+        # The result and whether it was fetched by another process
+        if fcntl is None:
+            return self.fetch(fetch), False
+        os.makedirs(self.get_directory(), exist_ok=True)
+        lock_path, result_path = self.paths(key)
+        waiting_since = time.time()
+        waiting_path = None
+        with open(lock_path, 'a') as lock_file:
+            # Touched so expire_results leaves the locks in use alone
+            os.utime(lock_path)
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Tells the process holding the lock that its result is wanted
+                waiting_path = f'{result_path}.{os.getpid()}.{threading.get_ident()}.waiting'
+                open(waiting_path, 'w').close()
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if waiting_path is not None:
+                    os.remove(waiting_path)
+                    result = self.read_result(result_path, waiting_since)
+                    if result is not None:
+                        return result, True
+                result = self.fetch(fetch)
+                if self.has_waiters(result_path):
+                    self.write_result(result_path, result)
+                return result, False
+            finally:
+                # The last one that wanted the result removes it
+                if not self.has_waiters(result_path):
+                    self.remove(result_path)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def has_waiters(self, result_path):
+        return bool(glob.glob(f'{glob.escape(result_path)}.*.waiting'))
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def fetch(self, fetch):
+        with self.lock:
+            self.fetches += 1
+        return fetch()
+
+    def read_result(self, result_path, waiting_since):
+        # Only a result written while we were waiting belongs to the same flight
+        try:
+            if os.path.getmtime(result_path) < waiting_since:
+                return None
+            return pd.read_pickle(result_path)
+        except (OSError, EOFError):
+            return None
+
+    def write_result(self, result_path, result):
+        temporary_path = f'{result_path}.{os.getpid()}.tmp'
+        result.to_pickle(temporary_path)
+        os.replace(temporary_path, result_path)
+        self.expire_results()
+
+    def expire_results(self):
+        # Left by processes that died holding or waiting on a lock
+        expired = time.time() - self.get_result_ttl()
+        for pattern in ('*.pkl', '*.lock', '*.waiting', '*.tmp'):
+            for path in glob.glob(os.path.join(self.get_directory(), pattern)):
+                try:
+                    if os.path.getmtime(path) < expired:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self.lock:
+            self.calls = 0
+            self.fetches = 0
+            self.shared = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'calls': self.calls,
+                'fetches': self.fetches,
+                'shared': self.shared,
+                'in_flight': len(self.flights),
+                'hit_rate': round(self.shared / self.calls, 4) if self.calls else 0,
+            }
@@ -0,0 +1,99 @@
+from functools import reduce
+import math
+
+from revenue_app.imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# HyperLogLog over 64 bit hashes with 2 ** 12 one byte registers (4 KB per sketch). The relative standard error
+# is 1.04 / sqrt(4096) = 1.6%: a count is within 1.6% of the real one ~68% of the time, within 3.3% ~95% and
+# within 4.9% ~99.7%, whatever the number of buckets merged. Up to EXACT_LIMIT values a sketch keeps the hashes
+# themselves (at most as big as the registers) and counts are exact, hash collisions aside (~n² / 2 ** 65).
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+EXACT_LIMIT = 512
+
+DISTINCT_COLUMNS = ['eventholder_user_id', 'event_id']
+
+
+def hash_values(values):
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+def hashes_to_registers(hashes):
+    # The first PRECISION bits pick the register, it keeps the most leading zeros seen in the low 32 bits + 1
+    index = (hashes >> np.uint64(64 - PRECISION)).astype(np.int64)
+    low = (hashes & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    rank = np.where(low > 0, 32 - np.floor(np.log2(np.maximum(low, 1))), 33).astype(np.uint8)
+    registers = np.zeros(REGISTERS, dtype=np.uint8)
+    np.maximum.at(registers, index, rank)
+    return registers
+
+
+class DistinctSketch():
+    def __init__(self, hashes=None, registers=None):
+        # Exactly one of them: sorted unique hashes (exact mode) or registers
+        self.hashes = hashes
+        self.registers = registers
+
+    @classmethod
+    def from_values(cls, values):
+        return cls(np.unique(hash_values(values))).compact()
+
+    @property
+    def exact(self):
+        return self.hashes is not None
+
+    def compact(self):
+        if self.exact and len(self.hashes) > EXACT_LIMIT:
+            return DistinctSketch(registers=hashes_to_registers(self.hashes))
+        return self
+
+    def to_registers(self):
+        return hashes_to_registers(self.hashes) if self.exact else self.registers
+
+    def merge(self, other):
+        if self.exact and other.exact:
+            return DistinctSketch(np.union1d(self.hashes, other.hashes)).compact()
+        return DistinctSketch(registers=np.maximum(self.to_registers(), other.to_registers()))
+
+    def count(self):
+        if self.exact:
+            return len(self.hashes)
+        alpha = 0.7213 / (1 + 1.079 / REGISTERS)
+        estimate = alpha * REGISTERS ** 2 / np.power(2.0, -self.registers.astype(np.float64)).sum()
+        zeros = int((self.registers == 0).sum())
+        if estimate <= 2.5 * REGISTERS and zeros:
+            # Few values, linear counting over the empty registers is more accurate
+            estimate = REGISTERS * math.log(REGISTERS / zeros)
+        return int(round(estimate))
+
+
+def build_distinct_sketches(transactions, columns=DISTINCT_COLUMNS):
+    # One sketch per (day, currency) bucket and column, aggregated datasets without days get one per currency.
+    # Converted datasets keep their buckets in the local currency.
+    currency_column = 'local_currency' if 'local_currency' in transactions.columns else 'currency'
+    by_day = 'transaction_created_date' in transactions.columns
+    buckets = ['transaction_created_date', currency_column] if by_day else [currency_column]
+    sketches = {}
+    for column in columns:
+        if column not in transactions.columns:
+            continue
+        sketches[column] = {
+            (bucket if by_day else (None, bucket)): DistinctSketch.from_values(values.values)
+            for bucket, values in transactions.groupby(buckets)[column]
+        }
+    return sketches
+
+
+def count_distinct(sketches, column, currency=None, start_date=None, end_date=None):
+    start_date = pd.Timestamp(start_date) if start_date else None
+    end_date = pd.Timestamp(end_date) if end_date else None
+    merged = [
+        sketch for (day, bucket_currency), sketch in sketches[column].items()
+        if (currency is None or bucket_currency == currency)
+        and (start_date is None or (day is not None and day >= start_date))
+        and (end_date is None or (day is not None and day <= end_date))
+    ]
+    return reduce(DistinctSketch.merge, merged).count() if merged else 0
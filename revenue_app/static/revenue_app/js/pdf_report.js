@@ -0,0 +1,56 @@
+function downloadFilename(response) {
+  let disposition = response.headers.get('Content-Disposition') || '';
+  let match = disposition.match(/filename="([^"]+)"/);
+  return match ? match[1] : 'report.pdf';
+}
+
+function downloadResponse(response) {
+  return response.blob().then(blob => {
+    let link = document.createElement('a');
+    link.href = URL.createObjectURL(blob);
+    link.download = downloadFilename(response);
+    document.body.appendChild(link);
+    link.click();
+    link.remove();
+    setTimeout(() => URL.revokeObjectURL(link.href), 1000);
+  });
+}
+
+function waitForJob(statusUrl) {
+  return fetch(statusUrl, {credentials: 'same-origin'})
+    .then(res => res.json())
+    .then(job => {
+      if (job.status === 'done') {
+        window.location = job.download_url;
+      } else if (job.status === 'failed') {
+        throw new Error(job.error);
+      } else {
+        return new Promise(resolve => setTimeout(resolve, 1000)).then(() => waitForJob(statusUrl));
+      }
+    });
+}
+
+// Reports are rendered on the server: small ones come back right away, the long ones are
+// rendered in a background job that is polled until the file is ready
+$(document).on('click', '.js-pdf-report', function(e) {
+  e.preventDefault();
+  let link = $(this);
+  if (link.hasClass('disabled')) {
+    return;
+  }
+  link.addClass('disabled');
+  fetch(this.href, {credentials: 'same-origin'})
+    .then(res => {
+      if (res.status === 202) {
+        return res.json().then(job => waitForJob(job.status_url));
+      }
+      if (!res.ok || res.redirected) {
+        // e.g. the dataset expired, the page it redirects to explains what to do
+        window.location = res.url;
+        return;
+      }
+      return downloadResponse(res);
+    })
+    .catch(error => alert(`The PDF could not be generated: ${error.message}`))
+    .finally(() => link.removeClass('disabled'));
+});
@@ -0,0 +1,217 @@
+from django.contrib.humanize.templatetags.humanize import intcomma
+from django.template import Context
+from django.template.base import render_value_in_context
+from django.template.defaultfilters import (
+    date,
+    floatformat,
+    truncatechars,
+)
+from django.urls import reverse
+from django.utils.html import conditional_escape
+from django.utils.timezone import template_localtime
+
+from revenue_app.templatetags.date_filters import (
+    get_quarter,
+    get_quarter_start,
+    get_semimonth_end,
+    substract_date,
+)
+from revenue_app.templatetags.glossary_filters import get_key_from_glossary
+from revenue_app.templatetags.number_filters import is_numeric
+
+# Fast renderer for revenue_app/_dynamic_table.html. The whitespace below mirrors the template
+# text nodes so both produce the same bytes; keep them in sync when the template changes.
+
+TABLE_START = (
+    '\n\n\n\n<div class="container-fluid transactions-table">\n'
+    '    <table class="table table-hover table-sm table-bordered">\n'
+    '        <thead>\n'
+    '            <tr class="text-center">\n'
+    '                '
+)
+
+HEADER = (
+    '\n                    '
+    '\n                    <th class="summarized-key" data-toggle="tooltip" data-placement="top" '
+    'title="{title}" scope="col">{header}</th>\n                    '
+    '\n                '
+)
+
+SKIPPED_HEADER = '\n                    \n                '
+
+TABLE_BODY = '\n            </tr>\n        </thead>\n        <tbody>\n            '
+
+ROW = '\n            <tr>\n                {cells}\n            </tr>\n            '
+
+CELL = '\n                    {}\n                '
+
+TABLE_END = '\n        </tbody>\n    </table>\n</div>\n'
+
+DATE_CELL = (
+    '\n                        \n'
+    '                            <td><a href="{url}?start_date={start}&end_date={end}">\n'
+    '                                {label}\n'
+    '                            </a></td>\n'
+    '                        \n                    '
+)
+
+LINK_CELL = '\n                        <td><a href="{url}">{value}</a></td>\n                    '
+
+TEXT_CELL = '\n                        <td>{}</td>\n                    '
+
+RIGHT_CELL = '\n                        <td class="text-right text-monospace">{}</td>\n                    '
+
+MONEY_CELL = (
+    '\n                        <td class="text-right text-monospace">\n'
+    '                      {currency}\n'
+    '                      \n'
+    '                          {value}\n'
+    '                      \n'
+    '                        </td>\n                    '
+)
+
+MONEY_CURRENCY = '\n                          {}\n                      '
+
+EMPTY_CELL = '\n                    '
+
+URL_PLACEHOLDER = '1234567890'
+
+
+def render(value, context):
+    return render_value_in_context(value, context)
+
+
+def render_date(value, format, context):
+    return render(date(template_localtime(value), format), context)
+
+
+def date_cell(value, groupby, prefix, context):
+    if groupby == 'week':
+        week_start = substract_date(value)
+        start = render_date(week_start, 'Y-m-d', context)
+        end = render_date(value, 'Y-m-d', context)
+        label = 'from {}<br/>to {}'.format(render_date(week_start, None, context), render_date(value, None, context))
+    elif groupby == 'semi_month':
+        semimonth_end = get_semimonth_end(value)
+        start = render_date(value, 'Y-m-d', context)
+        end = render_date(semimonth_end, 'Y-m-d', context)
+        label = 'from {}<br/>to {}'.format(render_date(value, None, context), render_date(semimonth_end, None, context))
+    elif groupby == 'month':
+        start = render_date(value, 'Y-m', context) + '-01'
+        end = render_date(value, 'Y-m-d', context)
+        label = render_date(value, 'F, Y', context)
+    elif groupby == 'quarter':
+        start = render_date(get_quarter_start(value), 'Y-m-d', context)
+        end = render_date(value, 'Y-m-d', context)
+        label = 'Q' + render(get_quarter(value), context)
+    elif groupby == 'year':
+        start = render(value.year, context) + '-01-01'
+        end = render_date(value, 'Y-m-d', context)
+        label = render(value.year, context)
+    else:
+        start = end = render_date(value, 'Y-m-d', context)
+        label = render_date(value, None, context)
+    return DATE_CELL.format(url=prefix, start=start, end=end, label=label)
+
+
+class UrlTemplate():
+    # Reverses the url once and fills in the ids, instead of reversing it for every row
+    def __init__(self, view_name, kwarg):
+        self.view_name = view_name
+        self.kwarg = kwarg
+        url = conditional_escape(reverse(view_name, kwargs={kwarg: URL_PLACEHOLDER}))
+        self.prefix, self.suffix = url.split(URL_PLACEHOLDER)
+
+    def __call__(self, value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            value = str(value)
+        if isinstance(value, str) and value.isdigit() and value.isascii():
+            return self.prefix + value + self.suffix
+        return None
+
+
+def link_cell(url, value, context):
+    if url is None:
+        # The id can't be reversed (e.g. the "Others" row of the top tables)
+        return TEXT_CELL.format(render(value, context))
+    return LINK_CELL.format(url=url, value=render(value, context))
+
+
+def money_cell(value, row_currency, currency, integer, context):
+    if row_currency:
+        currency_html = MONEY_CURRENCY.format(render(row_currency, context))
+    elif currency:
+        currency_html = MONEY_CURRENCY.format(render(currency, context))
+    else:
+        currency_html = ''
+    formatted = intcomma(floatformat(value, 0 if integer else 2))
+    return MONEY_CELL.format(currency=currency_html, value=render(formatted, context))
+
+
+def render_column(key, values, rows, groupby, currency, integer, context):
+    memo = {}
+
+    def memoized(format_value):
+        def cell(value):
+            try:
+                return memo[value]
+            except (KeyError, TypeError):
+                pass
+            html = format_value(value)
+            try:
+                memo[value] = html
+            except TypeError:
+                pass
+            return html
+        return cell
+
+    if key == 'transaction_created_date':
+        prefix = conditional_escape(reverse('organizers-transactions'))
+        cell = memoized(lambda value: date_cell(value, groupby, prefix, context))
+        return [cell(value) for value in values]
+    if key in 'eventholder_user_id,email' or key == 'Email':
+        url = UrlTemplate('organizer-transactions', 'eventholder_user_id')
+        ids = rows.get('eventholder_user_id' if key != 'Email' else 'Organizer', [None] * len(values))
+        return [link_cell(url(id), value, context) for id, value in zip(ids, values)]
+    if key == 'Organizer':
+        return [EMPTY_CELL] * len(values)
+    if key in 'event_id,event_title':
+        url = UrlTemplate('event-details', 'event_id')
+        ids = rows.get('event_id', [None] * len(values))
+        return [link_cell(url(id), value, context) for id, value in zip(ids, values)]
+    if key in 'eb_perc_take_rate, Take Rate':
+        cell = memoized(lambda value: RIGHT_CELL.format(render(floatformat(value, 2), context) + '%'))
+        return [cell(value) for value in values]
+    if key == 'PaidTix':
+        cell = memoized(lambda value: RIGHT_CELL.format(render(intcomma(floatformat(value, 0)), context)))
+        return [cell(value) for value in values]
+    if key == 'Event Title':
+        cell = memoized(lambda value: TEXT_CELL.format(render(truncatechars(value, 50), context)))
+        return [cell(value) for value in values]
+    row_currencies = rows.get('currency', [None] * len(values))
+    text = memoized(lambda value: TEXT_CELL.format(render(value, context)))
+    return [
+        money_cell(value, row_currency, currency, integer, context) if is_numeric(value) else text(value)
+        for value, row_currency in zip(values, row_currencies)
+    ]
+
+
+def render_dynamic_table(transactions, groupby=None, currency=None, integer=False):
+    context = Context(autoescape=True)
+    columns = transactions.columns.tolist()
+    headers = [
+        HEADER.format(
+            title=conditional_escape(get_key_from_glossary(header)),
+            header=render(header, context),
+        ) if not header == 'Organizer' else SKIPPED_HEADER
+        for header in columns
+    ]
+    # Same cell values the template gets from iterrows, one column at a time
+    values = list(zip(*transactions.values.tolist())) if len(transactions) else [[] for column in columns]
+    rows = dict(zip(columns, values))
+    cells = [
+        render_column(key, column_values, rows, groupby, currency, integer, context)
+        for key, column_values in zip(columns, values)
+    ]
+    body = [ROW.format(cells=''.join(CELL.format(cell) for cell in row_cells)) for row_cells in zip(*cells)]
+    return ''.join([TABLE_START, ''.join(headers), TABLE_BODY, ''.join(body), TABLE_END])
@@ -0,0 +1,13 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from revenue_app.tables import render_dynamic_table
+
+register = template.Library()
+
+
+@register.simple_tag(name='dynamic_table', takes_context=True)
+def dynamic_table(context, transactions, currency=None, int=False):
+    request = context.get('request')
+    groupby = request.GET.get('groupby') if request is not None else None
+    return mark_safe(render_dynamic_table(transactions, groupby, currency, int))
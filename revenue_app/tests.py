@@ -1,45 +1,175 @@
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from decimal import Decimal
+from functools import reduce
+import glob
+import gzip
+from io import StringIO
 import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+import zlib
 from datetime import (
     date,
     datetime,
 )
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.template import (
     Context,
     Template,
 )
+from django.template.loader import render_to_string
+from django.conf import settings
 from django.test import (
     Client,
+    RequestFactory,
     TestCase,
+    override_settings,
 )
 from django.urls import reverse
-from unittest.mock import patch
+from tempfile import TemporaryDirectory
+from unittest.mock import (
+    call,
+    Mock,
+    patch,
+)
 
 from freezegun import freeze_time
-from pandas import read_csv
+import numpy as np
+from pandas import (
+    Grouper,
+    read_csv,
+    to_datetime,
+)
 from pandas.core.frame import DataFrame
 from pandas.testing import assert_frame_equal
 from parameterized import parameterized
-
-
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+
+
+from revenue_app.cache import (
+    bump_dataset_version,
+    chart_cache,
+    get_dataset_version,
+    LRUCache,
+    profiles_cache,
+    transactions_cache,
+    value_bytes,
+)
+from revenue_app.columnar import (
+    gzip_stream,
+    stream_columnar,
+)
 from revenue_app.const import (
     ARS,
     BRL,
 )
-from revenue_app.presto_connection import read_sql
+from revenue_app.imports import (
+    HEAVY_MODULES,
+    import_times,
+    lazy_import,
+    LazyModule,
+    parse_import_times,
+)
+from revenue_app.pdf import (
+    fit_text,
+    PDFDocument,
+    text_width,
+    wrap_text,
+)
+from revenue_app.performance import (
+    current_metrics,
+    finish_request,
+    registry,
+    RollingHistogram,
+    start_request,
+    timed,
+    timer,
+)
+from revenue_app.presto_connection import (
+    check_query_access,
+    ColumnBuffer,
+    fetch_dataframe,
+    make_aggregate_query,
+    make_query,
+    PrestoConnectionPool,
+    PrestoError,
+    pyhive_dataframe,
+    query_presto,
+    read_sql,
+)
+from revenue_app.presto_standin import (
+    generate_dataset,
+    PrestoStandin,
+    translate_sql,
+)
+from revenue_app.profiling import list_profiles
+from revenue_app.queries import (
+    DAILY_COLUMNS,
+    get_query_columns,
+    get_view_columns,
+    projected_sql,
+    SUMMARY_COLUMNS,
+    TOTALS_COLUMNS,
+)
+from revenue_app.prewarm import prewarm_range
+from revenue_app.progress import (
+    get_channel,
+    progress_channel,
+    query_progress,
+    report_progress,
+    stream_events,
+)
+from revenue_app.reports import range_months
+from revenue_app.search import build_search_index
+from revenue_app.shared_datasets import (
+    get_dataset,
+    SharedDataset,
+    SharedDatasetStore,
+    shared_frames,
+)
+from revenue_app.sketches import (
+    build_distinct_sketches,
+    count_distinct,
+    DistinctSketch,
+    REGISTERS,
+)
+from revenue_app.single_flight import SingleFlight
+from revenue_app.tables import render_dynamic_table
 from revenue_app.utils import (
+    build_profile,
+    build_profiles,
     calc_perc_take_rate,
+    cents_to_money,
+    clean_aggregates,
     clean_corrections,
     clean_organizer_refunds,
     clean_organizer_sales,
     clean_transactions,
     dataframe_to_usd,
-    event_details,
+    EVENT_COLUMNS,
     filter_transactions,
     generate_transactions_consolidation,
+    get_all_charts_data,
     get_charts_data,
     get_event_transactions,
+    get_managed_transactions,
     get_organizer_transactions,
+    get_page_derived,
+    get_profiles,
+    get_search_index,
     get_summarized_data,
+    get_top_chart_data,
     get_top_events,
     get_top_organizers,
     get_top_organizers_refunds,
@@ -47,10 +177,23 @@ from revenue_app.utils import (
     manage_transactions,
     merge_corrections,
     merge_transactions,
+    MONEY_COLUMNS,
+    money_to_cents,
+    month_range,
+    month_to_date_range,
     payment_processor_summary,
+    PERIOD_COLUMNS,
+    previous_month_range,
+    profile_details,
     restore_currency,
     sales_flag_summary,
     summarize_dataframe,
+    top_organizers,
+    TOP_ORGANIZERS,
+    TRANSACTIONS_COLUMNS,
+    TRANSACTIONS_PARAMS,
+    transactions_params,
+    warm_derived,
 )
 
 from revenue_app.views import (
@@ -59,6 +202,8 @@ from revenue_app.views import (
     MakeQuery,
     OrganizerTransactions,
     OrganizersTransactions,
+    PdfReport,
+    ProfilePdf,
     TopEventsLatam,
     TopOrganizersLatam,
     TransactionsEvent,
@@ -159,6 +304,12 @@ TOTAL_TRANSACTIONS_COLUMNS = [
     'refund__ap_organizer__gts__epp',
     'refund__ap_organizer__royalty__epp',
     'eb_perc_take_rate',
+    'period_day',
+    'period_week',
+    'period_semi_month',
+    'period_month',
+    'period_quarter',
+    'period_year',
 ]
 
 NEW_EXCHANGE_COLUMNS = [
@@ -177,6 +328,13 @@ NEW_EXCHANGE_COLUMNS = [
 ]
 
 
+def pdf_text(content):
+    # The strings shown by the (deflated) content streams, in drawing order
+    streams = re.findall(rb'stream\n(.*?)\nendstream', content, re.S)
+    shown = re.findall(rb'\(((?:\\.|[^\\)])*)\) Tj', b''.join(zlib.decompress(stream) for stream in streams))
+    return [re.sub(rb'\\(.)', rb'\1', text).decode('cp1252') for text in shown]
+
+
 class UtilsTestCase(TestCase):
 
     @property
@@ -200,7 +358,7 @@ class UtilsTestCase(TestCase):
         total = merge_corrections(self.transactions, self.corrections)
         merged = merge_transactions(total, self.organizer_sales, self.organizer_refunds)
         merged = calc_perc_take_rate(merged)
-        return merged.round(2)
+        return money_to_cents(merged)
 
     def test_clean_transactions(self):
         transactions = self.transactions
@@ -275,12 +433,30 @@ class UtilsTestCase(TestCase):
         )
         self.assertEqual(len(transactions), 27)
 
+    def test_generate_transactions_consolidation_keeps_money_in_cents(self):
+        transactions = generate_transactions_consolidation(
+            self.transactions,
+            self.corrections,
+            self.organizer_sales,
+            self.organizer_refunds,
+        )
+        total = merge_corrections(self.transactions, self.corrections)
+        rounded = merge_transactions(total, self.organizer_sales, self.organizer_refunds).round(2)
+        for column in MONEY_COLUMNS:
+            self.assertEqual(transactions[column].dtype, np.int64)
+            self.assertEqual(transactions[column].sum() / 100, round(rounded[column].sum(), 2))
+        self.assertListEqual(
+            cents_to_money(transactions)['sale__gtf_esf__epp'].tolist(),
+            rounded['sale__gtf_esf__epp'].tolist(),
+        )
+
     @parameterized.expand([
         ('day', 22),
         ('week', 5),
         ('semi_month', 3),
         ('month', 2),
         ('quarter', 2),
+        ('year', 2),
         ('eventholder_user_id', 5),
         (['eventholder_user_id', 'email'], 5),
         ('event_id', 5),
@@ -299,6 +475,27 @@ class UtilsTestCase(TestCase):
         )
         self.assertEqual(len(grouped), expected_length)
 
+    @parameterized.expand([
+        ('day', 'D'),
+        ('week', 'W'),
+        ('semi_month', 'SMS'),
+        ('month', 'M'),
+        ('quarter', 'Q'),
+        ('year', 'A'),
+    ])
+    def test_group_transactions_by_period_matches_resampling(self, by, freq):
+        transactions = generate_dataset(date(2019, 11, 1), date(2020, 3, 31), rows_per_day=2)
+        consolidation = generate_transactions_consolidation(**transactions).iloc[::7]
+        resampled = consolidation.drop(columns=list(PERIOD_COLUMNS.values())).set_index(
+            'transaction_created_date',
+        ).groupby(['currency', Grouper(freq=freq)]).sum().reset_index()
+        assert_frame_equal(group_transactions(consolidation, by), resampled)
+        # Frames consolidated before the period keys existed
+        assert_frame_equal(
+            group_transactions(consolidation.drop(columns=list(PERIOD_COLUMNS.values())), by),
+            resampled,
+        )
+
     @parameterized.expand([
         ({}, 27),
         ({'eventholder_user_id': '634364434'}, 7),
@@ -357,6 +554,22 @@ class UtilsTestCase(TestCase):
         self.assertIsInstance(organizer_transactions, DataFrame)
         self.assertEqual(len(organizer_transactions), expected_length)
 
+    @parameterized.expand([
+        ({}, {}),
+        ({'page': '2', 'currency': ''}, {}),
+        ({'groupby': 'month', 'currency': ' ARS '}, {'currency': 'ARS', 'groupby': 'month'}),
+        ({'end_date': '2018-08-05'}, {}),
+        (
+            {'end_date': '2018-08-05', 'start_date': '2018-08-02'},
+            {'start_date': '2018-08-02', 'end_date': '2018-08-05'},
+        ),
+        ({'groupby': ['eventholder_user_id', 'email']}, {'groupby': ['eventholder_user_id', 'email']}),
+    ])
+    def test_transactions_params(self, params, expected):
+        normalized = transactions_params(params)
+        self.assertEqual(normalized, expected)
+        self.assertEqual(list(normalized), [key for key in TRANSACTIONS_PARAMS if key in expected])
+
     @parameterized.expand([
         ('66220941', 5, 10500),
         ('98415193', 6, 13608),
@@ -389,6 +602,47 @@ class UtilsTestCase(TestCase):
         self.assertEqual(len(transactions), transactions_qty)
         self.assertEqual(details['PaidTix'], tickets_qty)
 
+    @parameterized.expand([
+        ('eventholder_user_id', '506285738', {}),
+        ('eventholder_user_id', '634364434', {'start_date': '2018-08-02', 'end_date': '2018-08-04'}),
+        ('event_id', '88128252', {}),
+        ('event_id', '66220941', {'start_date': '2018-08-03'}),
+    ])
+    def test_profile_transactions_match_a_scan(self, key, value, kwargs):
+        get_transactions = get_organizer_transactions if key == 'eventholder_user_id' else get_event_transactions
+        profile = build_profiles(self.transactions_consolidation)[key]
+        scanned = get_transactions(self.transactions_consolidation, value, **kwargs)
+        profiled = get_transactions(self.transactions_consolidation, value, profile, **kwargs)
+        assert_frame_equal(profiled[0], scanned[0])
+        self.assertEqual(profiled[1:], scanned[1:])
+
+    def test_organizer_paidtix_per_day_counts_days_with_transactions(self):
+        transactions = self.transactions_consolidation
+        transactions = transactions[~transactions['transaction_created_date'].isin(['2018-08-02', '2018-08-03'])]
+        profile = build_profiles(transactions)['eventholder_user_id']
+        organizer, details, _, _ = get_organizer_transactions(transactions, '497321858', profile)
+        self.assertEqual(len(group_transactions(organizer, 'day')), 3)
+        self.assertEqual(details['AVG PaidTix/Day'], round(details['PaidTix'] / 3, 2))
+
+    def test_organizer_details_are_the_organizer_ones(self):
+        _, details, _, _ = get_organizer_transactions(self.transactions_consolidation, '506285738')
+        self.assertEqual(details['Organizer Name'], 'Br Fake')
+
+    def test_net_detail_pairs_each_sale_with_its_refund(self):
+        _, _, sales_refunds, net_sales_refunds = get_event_transactions(self.transactions_consolidation, '88128252')
+        self.assertEqual(sales_refunds['Total Sales Detail']['sale__gtf_esf__epp'], 1363.05)
+        self.assertEqual(sales_refunds['Total Refunds Detail']['refund__gtf_epp__gtf_esf__epp'], -272.61)
+        self.assertEqual(net_sales_refunds['Total Net Detail']['net__gtf_esf__epp'], 1090.44)
+
+    def test_unknown_organizer_has_no_details(self):
+        transactions, details, _, _ = get_organizer_transactions(
+            self.transactions_consolidation,
+            '1',
+            build_profiles(self.transactions_consolidation)['eventholder_user_id'],
+        )
+        self.assertIsNone(details)
+        self.assertEqual(len(transactions), 0)
+
     def test_get_top_ten_organizers(self):
         trx = self.transactions_consolidation
         top_ars = get_top_organizers(
@@ -534,7 +788,7 @@ class UtilsTestCase(TestCase):
         self.assertEqual(total_organizer, expected_total)
 
     @parameterized.expand([
-        ('66220941', '497321858', {
+        ('66220941', {
             'Event ID': '66220941',
             'Event Title': 'Event Name 2',
             'Organizer ID': '497321858',
@@ -543,16 +797,16 @@ class UtilsTestCase(TestCase):
             'Sales Flag': 'sales',
             'Sales Vertical': 'Argentina',
         }),
-        ('98415193', '98415193', {
+        ('98415193', {
             'Event ID': '98415193',
             'Event Title': 'Event Name 4',
-            'Organizer ID': '98415193',
+            'Organizer ID': '696421958',
             'Organizer Name': 'Fake 2',
             'Email': 'another_fake_mail@gmail.com',
             'Sales Flag': 'SSO',
             'Sales Vertical': 'Brazil',
         }),
-        ('17471621', '434444537', {
+        ('17471621', {
             'Event ID': '17471621',
             'Event Title': 'Event Name 3',
             'Organizer ID': '434444537',
@@ -561,7 +815,7 @@ class UtilsTestCase(TestCase):
             'Sales Flag': 'sales',
             'Sales Vertical': 'Brazil',
         }),
-        ('35210860', '506285738', {
+        ('35210860', {
             'Event ID': '35210860',
             'Event Title': 'Event Name 5',
             'Organizer ID': '506285738',
@@ -570,7 +824,7 @@ class UtilsTestCase(TestCase):
             'Sales Flag': 'SSO',
             'Sales Vertical': 'Brazil',
         }),
-        ('88128252', '634364434', {
+        ('88128252', {
             'Event ID': '88128252',
             'Event Title': 'Event Name 1',
             'Organizer ID': '634364434',
@@ -580,9 +834,9 @@ class UtilsTestCase(TestCase):
             'Sales Vertical': 'Argentina',
         }),
     ])
-    def test_event_details(self, event_id, eventholder_user_id, details_organizer):
-        response = event_details(self.transactions_consolidation, event_id, eventholder_user_id)
-        self.assertEqual(response, details_organizer)
+    def test_event_profile_details(self, event_id, details_organizer):
+        profile = build_profile(self.transactions_consolidation, 'event_id')
+        self.assertEqual(profile_details(profile, 'event_id', event_id), details_organizer)
 
     @parameterized.expand([
         ('Argentina', 'Totals', 'Organizers', 2),
@@ -664,8 +918,34 @@ class UtilsTestCase(TestCase):
         self.assertIsInstance(response['Brazil']['data'], list)
 
     @parameterized.expand([
-        (60.01, 5, 2848.99),
-        (59.95, 4.90, 2899.71),
+        (None,),
+        ({'August': {'ars_to_usd': 60.01, 'brl_to_usd': 5.02}},),
+    ])
+    def test_get_all_charts_data_matches_single_charts(self, exchange_data):
+        trx = self.transactions_consolidation
+        if exchange_data:
+            trx = dataframe_to_usd(trx, exchange_data)
+        charts = get_all_charts_data(trx.copy())
+        for type, filters in [('payment_processor', ['gtv', 'gtf']), ('sales_flag', ['organizers', 'gtv', 'gtf'])]:
+            for filter in filters:
+                self.assertEqual(charts[type][filter], get_charts_data(trx.copy(), type, filter))
+        for name in ['top_organizers', 'top_organizers_refunds', 'top_events']:
+            self.assertEqual(charts[name], get_top_chart_data(trx.copy(), name))
+
+    @parameterized.expand([
+        ('top_organizers', 'some_fake_mail@gmail.com'),
+        ('top_organizers_refunds', 'Others'),
+        ('top_events', '[] Others'),
+    ])
+    def test_get_top_chart_data(self, name, expected_name):
+        charts = get_top_chart_data(self.transactions_consolidation, name)
+        self.assertEqual(charts['ars_data']['unit'], ARS)
+        self.assertEqual(charts['brl_data']['unit'], BRL)
+        self.assertIn(expected_name, [item['name'] for item in charts['ars_data']['data']])
+
+    @parameterized.expand([
+        (60.01, 5, 284899),
+        (59.95, 4.90, 289971),
     ])
     def test_dataframe_to_usd(self, ars, brl, expected_sum_gtv):
         trx = self.transactions_consolidation
@@ -680,7 +960,7 @@ class UtilsTestCase(TestCase):
             self.assertNotIn(column, trx.columns)
             self.assertIn(column, converted.columns)
         self.assertIsInstance(converted, DataFrame)
-        self.assertEqual(converted.sale__payment_amount__epp.sum().round(2), expected_sum_gtv)
+        self.assertEqual(round(converted.sale__payment_amount__epp.sum()), expected_sum_gtv)
 
     def test_restore_currency(self):
         TEST_VALUE = 1
@@ -810,6 +1090,11 @@ class ViewsTest(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, reverse('make-query'))
 
+    def test_organizer_transactions_view_returns_404_if_organizer_is_unknown(self):
+        self.load_dataframes()
+        response = self.client.get(reverse('organizer-transactions', kwargs={'eventholder_user_id': 1}))
+        self.assertEqual(response.status_code, 404)
+
     def test_top_organizers_view_returns_200(self):
         URL = reverse('top-organizers')
         self.load_dataframes()
@@ -819,6 +1104,12 @@ class ViewsTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.template_name[0], TopOrganizersLatam.template_name)
 
+    def test_top_organizers_view_renders_tables(self):
+        self.load_dataframes()
+        response = self.client.get(reverse('top-organizers'))
+        self.assertContains(response, '<td>Others</td>', count=2)
+        self.assertContains(response, reverse('organizer-transactions', kwargs={'eventholder_user_id': 497321858}))
+
     def test_top_organizers_view_returns_302_if_doesnt_have_queries(self):
         URL = reverse('top-organizers')
         response = self.client.get(URL)
@@ -935,6 +1226,110 @@ class ViewsTest(TestCase):
         self.assertIn('.xls', response['Content-Disposition'])
         self.assertEqual(response.status_code, 200)
 
+    @parameterized.expand([
+        (reverse('organizers-transactions'), 'transactions', 'parquet'),
+        (reverse('organizer-transactions', kwargs={'eventholder_user_id': 497321858}), 'organizer_497321858', 'arrow'),
+        (reverse('transactions-grouped') + '?groupby=week', 'transactions_grouped_by_week', 'parquet'),
+        (reverse('transactions-grouped') + '?groupby=sales_flag', 'transactions_grouped_by_sales_flag', 'arrow'),
+        (reverse('event-details', kwargs={'event_id': 98415193}), 'event_98415193', 'parquet'),
+    ])
+    def test_download_columnar(self, url_from, name, export_format):
+        URL = reverse(f'download-{export_format}', kwargs={f'{export_format}_name': name})
+        self.load_dataframes()
+        self.client.get(url_from)
+        response = self.client.get(URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(name, response['Content-Disposition'])
+        content = pa.py_buffer(b''.join(response.streaming_content))
+        if export_format == 'parquet':
+            self.assertEqual(response['Content-Type'], 'application/vnd.apache.parquet')
+            table = pq.read_table(pa.BufferReader(content))
+        else:
+            self.assertEqual(response['Content-Type'], 'application/vnd.apache.arrow.stream')
+            table = pa.ipc.open_stream(content).read_all()
+        expected = self.client.session['export_transactions']
+        self.assertEqual(table.schema.names, expected.columns.tolist())
+        self.assertEqual(table.schema.field_by_name('sale__gtf_esf__epp').type, pa.decimal128(18, 2))
+        self.assertEqual(table.schema.field_by_name('currency').type.value_type, pa.string())
+        exported = table.to_pandas()
+        for column in expected.columns:
+            if column in MONEY_COLUMNS:
+                exported[column] = exported[column].astype(float)
+            elif column == 'transaction_created_date':
+                exported[column] = to_datetime(exported[column])
+            elif exported[column].dtype.name == 'category':
+                exported[column] = exported[column].astype(object)
+        assert_frame_equal(exported, expected.reset_index(drop=True))
+
+    def test_download_arrow_gzipped(self):
+        self.load_dataframes()
+        self.client.get(reverse('organizers-transactions'))
+        URL = reverse('download-arrow', kwargs={'arrow_name': 'transactions'})
+        plain = b''.join(self.client.get(URL).streaming_content)
+        response = self.client.get(URL, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        compressed = b''.join(response.streaming_content)
+        self.assertEqual(gzip.decompress(compressed), plain)
+        self.assertLess(len(compressed), len(plain))
+
+    @parameterized.expand([
+        (reverse('pdf-dashboard'), 'Gross Avg EB Take Rate'),
+        (reverse('pdf-dashboard') + '?type=sales_flag&filter=gtf', 'Sales Flag referred to GTF for Brazil'),
+        (reverse('pdf-top-organizers'), 'Top 10 Argentina Organizers'),
+        (reverse('pdf-top-organizers-refunds'), 'Top 10 Brazil Organizers with most refunds'),
+        (reverse('pdf-top-events'), 'Top 10 Brazil Events'),
+        (reverse('pdf-organizer', kwargs={'eventholder_user_id': 497321858}), 'Total Net Detail'),
+        (reverse('pdf-event', kwargs={'event_id': 98415193}) + '?start_date=2018-08-01', 'Total Sales Detail'),
+    ])
+    def test_pdf_report(self, URL, text):
+        self.load_dataframes()
+        response = self.client.get(URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('.pdf"', response['Content-Disposition'])
+        self.assertTrue(response.content.startswith(b'%PDF-1.4'))
+        self.assertIn(text, pdf_text(response.content))
+
+    def test_pdf_report_without_get_report_fails_in_the_urlconf(self):
+        class IncompletePdf(PdfReport):
+            name = 'incomplete'
+
+        with self.assertRaisesRegex(TypeError, 'IncompletePdf does not implement get_report'):
+            IncompletePdf.as_view()
+
+        class IncompleteProfilePdf(ProfilePdf):
+            name = 'incomplete'
+
+        with self.assertRaisesRegex(TypeError, 'get_title, get_transactions'):
+            IncompleteProfilePdf.as_view()
+
+    def test_pdf_report_not_found(self):
+        self.load_dataframes()
+        response = self.client.get(reverse('pdf-organizer', kwargs={'eventholder_user_id': 1}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_pdf_report_in_background_job(self):
+        self.load_dataframes()
+        with TemporaryDirectory() as jobs_dir, override_settings(JOBS_DIR=jobs_dir, PDF_BACKGROUND_ROWS=0):
+            response = self.client.get(reverse('pdf-event', kwargs={'event_id': 98415193}))
+            self.assertEqual(response.status_code, 202)
+            job = response.json()
+            for _ in range(200):
+                status = self.client.get(job['status_url']).json()
+                if status['status'] in ('done', 'failed'):
+                    break
+                time.sleep(0.05)
+            self.assertEqual(status['status'], 'done')
+            # Jobs belong to the session that started them
+            self.assertEqual(Client().get(job['status_url']).status_code, 404)
+            self.assertEqual(Client().get(status['download_url']).status_code, 404)
+            download = self.client.get(status['download_url'])
+            self.assertEqual(download['Content-Type'], 'application/pdf')
+            content = b''.join(download.streaming_content)
+            download.close()
+            self.assertIn('Event Title', pdf_text(content))
+
     def test_dashboard_summary_with_no_data_returns_400(self):
         URL = reverse('json_dashboard_summary')
         self.load_dataframes()
@@ -1010,6 +1405,116 @@ class ViewsTest(TestCase):
             "('Content-Type', 'application/json')",
         )
 
+    @parameterized.expand([
+        (reverse('json_top_events'),),
+        (reverse('json_top_organizers'),),
+        (reverse('json_top_organizers_refunds'),),
+        (reverse('json_dashboard_summary') + '?type=sales_flag&filter=gtf',),
+    ])
+    def test_json_charts_use_conditional_get(self, URL):
+        self.load_dataframes()
+        response = self.client.get(URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+        not_modified = self.client.get(URL, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertEqual(not_modified.content, b'')
+
+    def test_dashboard_charts_returns_all_series(self):
+        URL = reverse('json_dashboard_charts')
+        self.load_dataframes()
+        response = self.client.get(URL)
+        charts = json.loads(response.content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(charts),
+            ['payment_processor', 'sales_flag', 'top_events', 'top_organizers', 'top_organizers_refunds'],
+        )
+        self.assertEqual(sorted(charts['payment_processor']), ['gtf', 'gtv'])
+        self.assertEqual(sorted(charts['sales_flag']), ['gtf', 'gtv', 'organizers'])
+        summary = self.client.get(reverse('json_dashboard_summary'), {'type': 'sales_flag', 'filter': 'organizers'})
+        self.assertEqual(charts['sales_flag']['organizers'], json.loads(summary.content))
+        top_events = self.client.get(reverse('json_top_events'))
+        self.assertEqual(charts['top_events'], json.loads(top_events.content))
+
+    def test_dashboard_summary_is_memoized_per_type_and_filter(self):
+        URL = reverse('json_dashboard_summary')
+        self.load_dataframes()
+        with patch('revenue_app.views.get_charts_data', wraps=get_charts_data) as charts_data:
+            first = self.client.get(URL, {'type': 'sales_flag', 'filter': 'gtv'})
+            second = self.client.get(URL, {'type': 'sales_flag', 'filter': 'gtv'})
+            self.client.get(URL, {'type': 'sales_flag', 'filter': 'gtf'})
+        self.assertEqual(charts_data.call_count, 2)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_exchange_invalidates_memoized_charts(self):
+        URL = reverse('json_top_organizers')
+        self.load_dataframes()
+        local = self.client.get(URL)
+        self.client.post(reverse('exchange'), {'August-ars_to_usd': 60.01, 'August-brl_to_usd': 5.02})
+        converted = self.client.get(URL, HTTP_IF_NONE_MATCH=local['ETag'])
+        self.assertEqual(converted.status_code, 200)
+        self.assertNotEqual(converted['ETag'], local['ETag'])
+        self.assertEqual(json.loads(converted.content)['ars_data']['unit'], 'USD')
+        self.client.get(reverse('restore-currency'))
+        restored = self.client.get(URL)
+        self.assertEqual(restored['ETag'], local['ETag'])
+        self.assertEqual(json.loads(restored.content)['ars_data']['unit'], 'ARS')
+
+    def test_session_dataset_is_neither_copied_nor_changed(self):
+        transactions = generate_transactions_consolidation(
+            read_csv(TRANSACTIONS_EXAMPLE_PATH),
+            read_csv(CORRECTIONS_EXAMPLE_PATH),
+            read_csv(ORGANIZER_SALES_EXAMPLE_PATH),
+            read_csv(ORGANIZER_REFUNDS_EXAMPLE_PATH),
+        )
+        expected = transactions.copy()
+        session = {'transactions': transactions}
+        self.assertIs(get_dataset(session), transactions)
+        warm_derived(session)
+        get_managed_transactions(session, {'groupby': 'month', 'currency': 'ARS'})
+        for chart_type in ['payment_processor', 'sales_flag']:
+            get_charts_data(transactions, chart_type, 'gtv')
+        assert_frame_equal(transactions, expected)
+
+    def test_grouped_pages_are_cached_without_a_shared_dataset(self):
+        transactions = generate_transactions_consolidation(
+            read_csv(TRANSACTIONS_EXAMPLE_PATH),
+            read_csv(CORRECTIONS_EXAMPLE_PATH),
+            read_csv(ORGANIZER_SALES_EXAMPLE_PATH),
+            read_csv(ORGANIZER_REFUNDS_EXAMPLE_PATH),
+        )
+        session = {'transactions': transactions}
+        top = Mock(side_effect=top_organizers)
+        with patch('revenue_app.utils.group_transactions', wraps=group_transactions) as grouped:
+            results = [get_page_derived(session, 'transactions_grouped', None, {'groupby': 'month'}) for _ in range(3)]
+            self.assertEqual(grouped.call_count, 1)
+        tops = [get_page_derived(session, 'top_organizers', top, {}) for _ in range(3)]
+        self.assertEqual(top.call_count, 1)
+        self.assertIs(results[2], results[0])
+        self.assertIs(tops[2], tops[0])
+        self.assertEqual(len([key for key in transactions_cache.entries if key[0] == session['dataset_version']]), 2)
+
+    def test_filtered_transactions_are_cached_until_exchange(self):
+        URL = reverse('transactions-grouped')
+        self.load_dataframes()
+        with patch('revenue_app.utils.manage_transactions', wraps=manage_transactions) as managed:
+            first = self.client.get(URL, {'groupby': 'month', 'currency': 'ARS'})
+            second = self.client.get(URL, {'currency': ' ARS ', 'groupby': 'month', 'page': '2'})
+            self.assertEqual(managed.call_count, 1)
+            self.client.post(reverse('exchange'), {'August-ars_to_usd': 60.01, 'August-brl_to_usd': 5.02})
+            self.client.get(URL, {'groupby': 'month', 'currency': 'ARS'})
+            self.assertEqual(managed.call_count, 2)
+            self.client.get(reverse('restore-currency'))
+            self.client.get(URL, {'groupby': 'month', 'currency': 'ARS'})
+            self.assertEqual(managed.call_count, 3)
+        self.assertTrue(first.context['transactions'].equals(second.context['transactions']))
+        self.assertGreater(transactions_cache.stats()['hits'], 0)
+
     def test_make_query_view_returns_200_but_does_not_make_query(self):
         URL = reverse('make-query')
         response = self.client.get(URL)
@@ -1091,6 +1596,16 @@ class ViewsTest(TestCase):
             },
             'Time between End and Start date can&#39;t be over 3 months.',
         ),
+        (
+            {
+                'okta_username': 'fakename',
+                'okta_password': 'fakepass',
+                'start_date': '2017-08-01',
+                'end_date': '2018-08-05',
+                'report': 'pushdown',
+            },
+            'Time between End and Start date can&#39;t be over a year.',
+        ),
         (
             {
                 'okta_username': 'fakename',
@@ -1194,6 +1709,535 @@ class ViewsTest(TestCase):
         for column in NEW_EXCHANGE_COLUMNS:
             self.assertIn(column, session['transactions'].columns)
 
+    def test_views_set_server_timing_header(self):
+        URL = reverse('dashboard')
+        self.load_dataframes()
+        response = self.client.get(URL)
+        self.assertEqual(response.status_code, 200)
+        for metric in ['total', 'session', 'utils', 'render']:
+            self.assertIn(f'{metric};dur=', response['Server-Timing'])
+
+    def test_performance_metrics_requires_staff(self):
+        URL = reverse('performance-metrics')
+        response = self.client.get(URL)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('admin:login'), response.url)
+
+    def test_performance_metrics_returns_view_histograms(self):
+        registry.reset()
+        self.load_dataframes()
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('top-events'))
+        user = User.objects.create_user('admin', password='fakepass', is_staff=True)
+        self.client.force_login(user)
+        response = self.client.get(reverse('performance-metrics'))
+        self.assertEqual(response.status_code, 200)
+        metrics = json.loads(response.content)
+        for view_name in ['dashboard', 'top-events']:
+            self.assertEqual(metrics['views'][view_name]['total']['count'], 1)
+            self.assertIn('p95', metrics['views'][view_name]['utils'])
+            self.assertGreater(metrics['views'][view_name]['size']['p50'], 0)
+        self.assertIn('charts', metrics['caches'])
+        self.assertIn('reused', metrics['presto_pool'])
+
+
+    @parameterized.expand([
+        ('cprofile', '.prof'),
+        ('sample', '.stacks'),
+    ])
+    def test_staff_can_profile_a_request(self, mode, extension):
+        self.load_dataframes()
+        user = User.objects.create_user('admin', password='fakepass', is_staff=True)
+        self.client.force_login(user)
+        with TemporaryDirectory() as profiles_dir, self.settings(PROFILES_DIR=profiles_dir):
+            response = self.client.get(reverse('top-events'), {'profile': mode, 'currency': 'ARS'})
+            profiles = list_profiles()
+            self.assertEqual(len(profiles), 1)
+            self.assertEqual(profiles[0]['id'], response['X-Profile-Id'])
+            self.assertEqual(profiles[0]['view'], 'top-events')
+            self.assertEqual(profiles[0]['filters'], {'currency': 'ARS'})
+            self.assertEqual(profiles[0]['start_date'], '2018-08-01')
+            self.assertEqual(len(profiles[0]['dataset_fingerprint']), 16)
+            self.assertTrue(profiles[0]['file'].endswith(extension))
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile_header_is_accepted(self):
+        self.load_dataframes()
+        user = User.objects.create_user('admin', password='fakepass', is_staff=True)
+        self.client.force_login(user)
+        with TemporaryDirectory() as profiles_dir, self.settings(PROFILES_DIR=profiles_dir):
+            response = self.client.get(reverse('dashboard'), HTTP_X_PROFILE='cprofile')
+            self.assertEqual(len(list_profiles()), 1)
+        self.assertIn('X-Profile-Id', response)
+
+    def test_profile_is_ignored_for_non_staff_users(self):
+        self.load_dataframes()
+        with TemporaryDirectory() as profiles_dir, self.settings(PROFILES_DIR=profiles_dir):
+            response = self.client.get(reverse('dashboard'), {'profile': 'cprofile'})
+            self.assertEqual(list_profiles(), [])
+        self.assertNotIn('X-Profile-Id', response)
+
+    def test_profiles_command_lists_and_dumps_profiles(self):
+        self.load_dataframes()
+        user = User.objects.create_user('admin', password='fakepass', is_staff=True)
+        self.client.force_login(user)
+        with TemporaryDirectory() as profiles_dir, self.settings(PROFILES_DIR=profiles_dir):
+            response = self.client.get(reverse('transactions-grouped'), {'profile': 'cprofile', 'groupby': 'week'})
+            profile_id = response['X-Profile-Id']
+            listed = StringIO()
+            call_command('profiles', 'list', stdout=listed)
+            dumped = StringIO()
+            call_command('profiles', 'dump', profile_id, '--limit', '5', stdout=dumped)
+            with self.assertRaises(CommandError):
+                call_command('profiles', 'dump', 'missing')
+        self.assertIn(profile_id, listed.getvalue())
+        self.assertIn('?groupby=week', listed.getvalue())
+        self.assertIn('function calls', dumped.getvalue())
+
+
+class ImportsTest(TestCase):
+    def test_lazy_module_imports_on_first_use(self):
+        module = LazyModule('colorsys')
+        self.assertNotIn('rgb_to_hsv', module.__dict__)
+        self.assertEqual(module.rgb_to_hsv(1, 0, 0), (0, 1, 1))
+        self.assertIn('rgb_to_hsv', module.__dict__)
+
+    def test_lazy_import_returns_imported_modules(self):
+        self.assertIs(lazy_import('json'), json)
+
+    def test_parse_import_times(self):
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       150 |        150 |     revenue_app.const\n'
+            'import time:      1000 |       1250 |   revenue_app.views\n'
+        )
+        self.assertEqual(parse_import_times(output), [
+            {'module': 'revenue_app.const', 'depth': 2, 'self': 0.15, 'cumulative': 0.15},
+            {'module': 'revenue_app.views', 'depth': 1, 'self': 1, 'cumulative': 1.25},
+        ])
+
+    def test_cold_start_stays_under_budget(self):
+        times = import_times(settings.ROOT_URLCONF)
+        imported = [entry['module'] for entry in times]
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, imported)
+        urlconf = next(entry for entry in times if entry['module'] == settings.ROOT_URLCONF)
+        self.assertLess(urlconf['cumulative'], settings.COLD_START_BUDGET_MS)
+
+    @parameterized.expand([
+        ('revenue_app.reports',),
+        ('revenue_app.prewarm',),
+    ])
+    def test_module_does_not_import_the_views(self, module):
+        imported = [entry['module'] for entry in import_times(module)]
+        self.assertNotIn('revenue_app.views', imported)
+
+
+class BuildReportsTest(TestCase):
+    def setUp(self):
+        self.output_dir = TemporaryDirectory()
+        self.environ = patch.dict(os.environ, {'OKTA_PASSWORD': 'fakepass'})
+        self.environ.start()
+        self.transactions = generate_transactions_consolidation(
+            read_csv(TRANSACTIONS_EXAMPLE_PATH),
+            read_csv(CORRECTIONS_EXAMPLE_PATH),
+            read_csv(ORGANIZER_SALES_EXAMPLE_PATH),
+            read_csv(ORGANIZER_REFUNDS_EXAMPLE_PATH),
+        )
+
+    def tearDown(self):
+        self.environ.stop()
+        self.output_dir.cleanup()
+
+    def fake_query(self, query_name, **kwargs):
+        return read_csv({
+            'transactions': TRANSACTIONS_EXAMPLE_PATH,
+            'corrections': CORRECTIONS_EXAMPLE_PATH,
+            'organizer_sales': ORGANIZER_SALES_EXAMPLE_PATH,
+            'organizer_refunds': ORGANIZER_REFUNDS_EXAMPLE_PATH,
+        }[query_name])
+
+    def build_reports(self, *args, side_effect=None, stderr=None):
+        stdout = StringIO()
+        with patch('revenue_app.reports.make_query', side_effect=side_effect or self.fake_query):
+            call_command(
+                'build_reports', *args, '--okta-username', 'fakename', '--output-dir', self.output_dir.name,
+                stdout=stdout, stderr=stderr or StringIO(),
+            )
+        return stdout.getvalue()
+
+    def output_path(self, name):
+        return os.path.join(self.output_dir.name, name)
+
+    @parameterized.expand([
+        (2018, 8, date(2018, 8, 1), date(2018, 8, 31)),
+        (2020, 2, date(2020, 2, 1), date(2020, 2, 29)),
+    ])
+    def test_month_range(self, year, month, start_date, end_date):
+        self.assertEqual(month_range(year, month), (start_date, end_date))
+
+    def test_range_months(self):
+        self.assertEqual(range_months(date(2018, 11, 15), date(2019, 1, 2)), ['November', 'December', 'January'])
+
+    def test_ranges_are_built_in_parallel(self):
+        output = self.build_reports(
+            '--month', '2018-08', '--range', '2018-08-01:2018-08-15', '--workers', '2',
+            '--format', 'csv', '--format', 'xls', '--organizer', '497321858',
+        )
+        for name in ('2018-08-01_2018-08-31', '2018-08-01_2018-08-15'):
+            for path in (f'transactions_{name}.csv', f'transactions_{name}.xls', f'organizer_497321858_{name}.csv'):
+                self.assertIn(self.output_path(path), output)
+                self.assertTrue(os.path.exists(self.output_path(path)))
+        exported = read_csv(self.output_path('transactions_2018-08-01_2018-08-31.csv'))
+        self.assertEqual(len(exported), len(self.transactions))
+        organizer = read_csv(self.output_path('organizer_497321858_2018-08-01_2018-08-31.csv'))
+        self.assertEqual(
+            len(organizer),
+            len(self.transactions[self.transactions['eventholder_user_id'] == '497321858']),
+        )
+
+    def test_rates_convert_to_usd(self):
+        with TemporaryDirectory() as rates_dir:
+            rates_path = os.path.join(rates_dir, 'rates.json')
+            with open(rates_path, 'w') as rates_file:
+                json.dump({'August': {'ars_to_usd': 60.01, 'brl_to_usd': 5.02}}, rates_file)
+            self.build_reports('--month', '2018-08', '--rates', rates_path, '--workers', '1')
+            with self.assertRaisesMessage(CommandError, 'No rates for September'):
+                self.build_reports('--month', '2018-09', '--rates', rates_path)
+        exported = read_csv(self.output_path('transactions_2018-08-01_2018-08-31.csv'))
+        self.assertEqual(exported['currency'].unique().tolist(), ['USD'])
+
+    @parameterized.expand([
+        (PrestoError('Access Denied'), 'Access Denied'),
+        (OSError(28, 'No space left on device'), 'OSError: [Errno 28] No space left on device'),
+        (KeyError('August'), "KeyError: 'August'"),
+    ])
+    def test_failed_ranges_are_reported(self, error, message):
+        def fake_query(query_name, start_date, **kwargs):
+            if start_date == '2018-08-16':
+                raise error
+            return self.fake_query(query_name)
+        stderr = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 of 2 ranges failed'):
+            self.build_reports(
+                '--range', '2018-08-01:2018-08-15', '--range', '2018-08-16:2018-08-31',
+                side_effect=fake_query, stderr=stderr,
+            )
+        self.assertEqual(stderr.getvalue(), f'2018-08-16 - 2018-08-31: {message}\n')
+        self.assertTrue(os.path.exists(self.output_path('transactions_2018-08-01_2018-08-15.csv')))
+
+    def test_missing_export_engine(self):
+        with patch('revenue_app.reports.importlib.util.find_spec', return_value=None):
+            with self.assertRaisesMessage(CommandError, 'parquet exports need pyarrow or fastparquet installed'):
+                self.build_reports('--month', '2018-08', '--format', 'parquet')
+
+
+class ColumnarTest(TestCase):
+    def setUp(self):
+        self.transactions = DataFrame({
+            'transaction_created_date': to_datetime(['2019-08-01', '2019-08-02', None, '2019-08-04', '2019-08-05']),
+            'currency': ['ARS', 'BRL', 'ARS', None, 'ARS'],
+            'event_id': ['1', '2', '3', '4', None],
+            'PaidTix': [1, 2, 3, 4, 5],
+            'sale__gtf_esf__epp': [1.1, -0.05, float('nan'), 12345678.99, 0.0],
+            'local_sale__gtf_esf__epp': [19.03, -0.87, float('nan'), 213580246.53, 0.0],
+        })
+
+    @parameterized.expand([
+        ('parquet',),
+        ('arrow',),
+    ])
+    def test_stream_columnar_in_batches(self, export_format):
+        chunks = list(stream_columnar(self.transactions, export_format, batch_rows=2))
+        # One chunk per batch and the closing one
+        self.assertEqual(len(chunks), 4)
+        content = pa.py_buffer(b''.join(chunks))
+        if export_format == 'parquet':
+            reader = pq.ParquetFile(pa.BufferReader(content))
+            self.assertEqual(reader.num_row_groups, 3)
+            table = reader.read()
+        else:
+            table = pa.ipc.open_stream(content).read_all()
+        self.assertEqual(table.schema.field_by_name('transaction_created_date').type, pa.date32())
+        self.assertEqual(
+            table.column('sale__gtf_esf__epp').to_pylist(),
+            [Decimal('1.10'), Decimal('-0.05'), None, Decimal('12345678.99'), Decimal('0.00')],
+        )
+        self.assertEqual(
+            table.column('local_sale__gtf_esf__epp').to_pylist(),
+            [Decimal('19.03'), Decimal('-0.87'), None, Decimal('213580246.53'), Decimal('0.00')],
+        )
+        self.assertEqual(table.column('currency').to_pylist(), ['ARS', 'BRL', 'ARS', None, 'ARS'])
+        self.assertEqual(table.column('event_id').to_pylist(), ['1', '2', '3', '4', None])
+        self.assertEqual(table.column('transaction_created_date').to_pylist()[2], None)
+
+    def test_stream_columnar_keeps_times(self):
+        transactions = DataFrame({'run_time': to_datetime(['2019-08-01 10:30:00', '2019-08-02'])})
+        table = pa.ipc.open_stream(pa.py_buffer(b''.join(stream_columnar(transactions, 'arrow')))).read_all()
+        self.assertEqual(table.schema.field_by_name('run_time').type, pa.timestamp('ms'))
+
+    def test_stream_columnar_empty(self):
+        table = pq.read_table(pa.BufferReader(b''.join(stream_columnar(self.transactions.iloc[:0], 'parquet'))))
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(table.schema.names, self.transactions.columns.tolist())
+
+    def test_gzip_stream(self):
+        chunks = [b'revenue' * 100, b'', b'latam' * 100]
+        self.assertEqual(gzip.decompress(b''.join(gzip_stream(iter(chunks)))), b''.join(chunks))
+
+
+class PDFTest(TestCase):
+    def test_document_structure(self):
+        document = PDFDocument('Report (ARS)', 'From 2019-08-01')
+        document.heading('Organizador de São Paulo')
+        document.key_values([('GTF', 'ARS 1,234.50'), ('Path', 'C:\\reports')])
+        content = document.render()
+        self.assertTrue(content.startswith(b'%PDF-1.4'))
+        self.assertTrue(content.endswith(b'%%EOF\n'))
+        self.assertIn(b'/Count 1 ', content)
+        startxref = int(content.rsplit(b'startxref\n', 1)[1].split(b'\n')[0])
+        xref = content[startxref:].split(b'trailer')[0].split(b'\n')
+        self.assertEqual(xref[0], b'xref')
+        # Every offset points to its object
+        for object_id, entry in enumerate(xref[3:-1], start=1):
+            self.assertTrue(content[int(entry[:10]):].startswith(f'{object_id} 0 obj'.encode()))
+        self.assertEqual(
+            pdf_text(content),
+            ['Report (ARS)', 'From 2019-08-01', 'Organizador de São Paulo', 'GTF', 'ARS 1,234.50', 'Path',
+             'C:\\reports', 'Page 1 of 1'],
+        )
+
+    def test_long_tables_repeat_the_header_on_every_page(self):
+        document = PDFDocument('Transactions')
+        document.table(['Organizer', 'PaidTix'], [[f'Organizer {row}', str(row)] for row in range(300)])
+        content = document.render()
+        pages = int(re.search(rb'/Count (\d+)', content).group(1))
+        self.assertGreater(pages, 1)
+        text = pdf_text(content)
+        self.assertEqual(text.count('Organizer'), pages)
+        self.assertEqual(text.count('Transactions'), pages)
+        self.assertIn(f'Page {pages} of {pages}', text)
+        self.assertEqual([row for row in text if row.startswith('Organizer ')][-1], 'Organizer 299')
+
+    def test_fit_text(self):
+        fitted = fit_text('Top 10 Argentina Organizers with most refunds', 100, 8)
+        self.assertTrue(fitted.endswith('…'))
+        self.assertLessEqual(text_width(fitted, 8), 100)
+        self.assertEqual(fit_text('GTF', 100, 8), 'GTF')
+
+    @parameterized.expand([
+        ('refund__gtf_epp__gtf_esf__epp', 60),
+        ('Avg EB Take Rate', 30),
+    ])
+    def test_wrap_text(self, text, width):
+        lines = wrap_text(text, width, 7, True)
+        self.assertGreater(len(lines), 1)
+        self.assertTrue(all(text_width(line, 7, True) <= width for line in lines))
+        self.assertEqual(''.join(lines).replace(' ', ''), text.replace(' ', ''))
+
+
+class CacheTest(TestCase):
+    def test_lru_cache_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set(('v1', 'a'), 1)
+        cache.set(('v1', 'b'), 2)
+        cache.get(('v1', 'a'))
+        cache.set(('v1', 'c'), 3)
+        self.assertEqual(cache.get(('v1', 'a')), 1)
+        self.assertIsNone(cache.get(('v1', 'b')))
+        self.assertEqual(cache.get(('v1', 'c')), 3)
+
+    def test_lru_cache_get_or_set_computes_once(self):
+        cache = LRUCache(2)
+        compute = Mock(return_value='value')
+        self.assertEqual(cache.get_or_set(('v1', 'a'), compute), 'value')
+        self.assertEqual(cache.get_or_set(('v1', 'a'), compute), 'value')
+        compute.assert_called_once_with()
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['hit_rate'], 0.5)
+
+    def test_lru_cache_evicts_to_stay_under_max_bytes(self):
+        cache = LRUCache(10, max_bytes=10, weigh=len)
+        cache.set(('v1', 'a'), 'aaaa')
+        cache.set(('v1', 'b'), 'bbbb')
+        cache.get(('v1', 'a'))
+        cache.set(('v1', 'c'), 'cccc')
+        self.assertIsNone(cache.get(('v1', 'b')))
+        cache.set(('v1', 'd'), 'd' * 11)
+        self.assertIsNone(cache.get(('v1', 'd')))
+        self.assertEqual(cache.get(('v1', 'a')), 'aaaa')
+        self.assertEqual(cache.get(('v1', 'c')), 'cccc')
+        self.assertEqual(cache.stats()['bytes'], 8)
+        cache.invalidate('v1')
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_lru_cache_invalidates_dataset_version(self):
+        cache = LRUCache(10)
+        cache.set(('v1', 'a'), 1)
+        cache.set(('v1', 'b'), 2)
+        cache.set(('v2', 'a'), 3)
+        cache.invalidate('v1')
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(('v2', 'a')), 3)
+
+    def test_bump_dataset_version_invalidates_caches(self):
+        session = {}
+        version = get_dataset_version(session)
+        self.assertEqual(get_dataset_version(session), version)
+        chart_cache.set((version, 'charts'), 'cached')
+        new_version = bump_dataset_version(session)
+        self.assertNotEqual(new_version, version)
+        self.assertEqual(session['dataset_version'], new_version)
+        self.assertIsNone(chart_cache.get((version, 'charts')))
+
+    def test_profiles_and_search_index_are_cached_by_size(self):
+        transactions = generate_transactions_consolidation(
+            read_csv(TRANSACTIONS_EXAMPLE_PATH),
+            read_csv(CORRECTIONS_EXAMPLE_PATH),
+            read_csv(ORGANIZER_SALES_EXAMPLE_PATH),
+            read_csv(ORGANIZER_REFUNDS_EXAMPLE_PATH),
+        )
+        session = {'transactions': transactions}
+        profiles = get_profiles(session)
+        index = get_search_index(session)
+        version = get_dataset_version(session)
+        self.assertIs(profiles_cache.get((version, 'profiles')), profiles)
+        self.assertIs(profiles_cache.get((version, 'search_index')), index)
+        self.assertIsNone(chart_cache.get((version, 'profiles')))
+        rows = sum(indices.nbytes for indices in profiles['event_id']['rows'].values())
+        self.assertGreater(value_bytes(profiles), rows)
+        self.assertGreater(value_bytes(index), sum(sys.getsizeof(posting) for posting in index.trigrams.values()))
+        cache = LRUCache(10, max_bytes=value_bytes(profiles), weigh=value_bytes)
+        cache.set(('v1', 'profiles'), profiles)
+        cache.set(('v2', 'profiles'), profiles)
+        self.assertIsNone(cache.get(('v1', 'profiles')))
+        self.assertEqual(cache.stats()['bytes'], value_bytes(profiles))
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.transactions = generate_transactions_consolidation(
+            read_csv(TRANSACTIONS_EXAMPLE_PATH),
+            read_csv(CORRECTIONS_EXAMPLE_PATH),
+            read_csv(ORGANIZER_SALES_EXAMPLE_PATH),
+            read_csv(ORGANIZER_REFUNDS_EXAMPLE_PATH),
+        )
+        self.index = build_search_index(build_profiles(self.transactions))
+
+    @parameterized.expand([
+        ('Br', [('organizer', '506285738'), ('event', '35210860')]),
+        ('event name 3', [('event', '17471621')]),
+        ('4973', [('organizer', '497321858')]),
+        ('ake 2', [('organizer', '696421958')]),
+        ('zzz', []),
+        ('  ', []),
+    ])
+    def test_search(self, query, expected):
+        self.assertEqual([(result['type'], result['id']) for result in self.index.search(query)], expected)
+
+    def test_search_ranks_prefixes_first(self):
+        results = self.index.search('fake')
+        self.assertEqual([result['label'] for result in results[:2]], ['Fake 2', 'Fake 1'])
+        self.assertEqual(len(self.index.search('fake', limit=3)), 3)
+
+    def test_search_view(self):
+        session = self.client.session
+        session['transactions'] = self.transactions
+        session.save()
+        response = self.client.get(reverse('json_search'), {'q': 'wow such'})
+        self.assertEqual(response.json(), {'results': [{
+            'type': 'organizer',
+            'id': '434444537',
+            'label': 'Wow Such Fake',
+            'detail': 'wow_fake_mail@hotmail.com',
+            'url': reverse('organizer-transactions', kwargs={'eventholder_user_id': 434444537}),
+        }]})
+
+    def test_search_view_without_dataset(self):
+        response = self.client.get(reverse('json_search'), {'q': 'fake'})
+        self.assertEqual(response.json(), {'results': []})
+
+
+class SketchesTest(TestCase):
+    def setUp(self):
+        self.transactions = generate_transactions_consolidation(
+            read_csv(TRANSACTIONS_EXAMPLE_PATH),
+            read_csv(CORRECTIONS_EXAMPLE_PATH),
+            read_csv(ORGANIZER_SALES_EXAMPLE_PATH),
+            read_csv(ORGANIZER_REFUNDS_EXAMPLE_PATH),
+        )
+
+    def test_small_sketches_are_exact(self):
+        sketch = DistinctSketch.from_values(['1', '2', '2', '3'])
+        self.assertTrue(sketch.exact)
+        merged = sketch.merge(DistinctSketch.from_values(['3', '4']))
+        self.assertTrue(merged.exact)
+        self.assertEqual(merged.count(), 4)
+
+    def test_merged_sketches_estimate_within_error_bounds(self):
+        values = [str(value) for value in range(20000)]
+        sketches = [DistinctSketch.from_values(values[start:start + 1000]) for start in range(0, 20000, 500)]
+        merged = reduce(DistinctSketch.merge, sketches)
+        self.assertFalse(merged.exact)
+        # Three standard errors
+        self.assertLess(abs(merged.count() - 20000), 20000 * 3 * 1.04 / math.sqrt(REGISTERS))
+
+    @parameterized.expand([
+        ('eventholder_user_id', ARS, None, None),
+        ('event_id', BRL, None, None),
+        ('event_id', None, '2018-08-03', '2018-08-04'),
+        ('eventholder_user_id', BRL, '2018-08-05', '2018-08-30'),
+    ])
+    def test_count_distinct_matches_nunique(self, column, currency, start_date, end_date):
+        sketches = build_distinct_sketches(self.transactions)
+        filtered = filter_transactions(self.transactions, currency=currency, start_date=start_date, end_date=end_date)
+        self.assertEqual(
+            count_distinct(sketches, column, currency, start_date, end_date),
+            filtered[column].nunique(),
+        )
+
+
+class PerformanceTest(TestCase):
+    @parameterized.expand([
+        (50, 50),
+        (95, 95),
+        (99, 99),
+    ])
+    def test_rolling_histogram_percentiles(self, percent, expected):
+        histogram = RollingHistogram(size=100)
+        for value in range(1, 101):
+            histogram.add(value)
+        self.assertEqual(histogram.summary()[f'p{percent}'], expected)
+
+    def test_rolling_histogram_keeps_last_samples(self):
+        histogram = RollingHistogram(size=10)
+        for value in range(100):
+            histogram.add(value)
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual(summary['p50'], 94)
+
+    def test_nested_timers_are_not_counted_twice(self):
+        @timed('utils')
+        def inner():
+            return 'inner'
+
+        @timed('utils')
+        def outer():
+            return inner()
+
+        metrics = start_request()
+        with patch('revenue_app.performance.time.perf_counter', side_effect=[1, 3]):
+            self.assertEqual(outer(), 'inner')
+        finish_request()
+        self.assertEqual(metrics.timings['utils'], 2000)
+
+    def test_timer_without_request_does_nothing(self):
+        with timer('utils'):
+            pass
+        self.assertIsNone(current_metrics())
+
 
 class TemplateTagsTest(TestCase):
     def render_template(self, string, context=None):
@@ -1332,6 +2376,92 @@ class TemplateTagsTest(TestCase):
         self.assertEqual(rendered, expected)
 
 
+class DynamicTableTest(TestCase):
+    def setUp(self):
+        self.transactions = generate_transactions_consolidation(
+            read_csv(TRANSACTIONS_EXAMPLE_PATH),
+            read_csv(CORRECTIONS_EXAMPLE_PATH),
+            read_csv(ORGANIZER_SALES_EXAMPLE_PATH),
+            read_csv(ORGANIZER_REFUNDS_EXAMPLE_PATH),
+        )
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+
+    def render_template(self, transactions, groupby=None, currency=None, int=False):
+        if groupby:
+            self.request.GET = self.request.GET.copy()
+            self.request.GET['groupby'] = groupby
+        return render_to_string(
+            'revenue_app/_dynamic_table.html',
+            {'transactions': transactions, 'currency': currency, 'int': int},
+            request=self.request,
+        )
+
+    @parameterized.expand([
+        (None,),
+        ('day',),
+        ('week',),
+        ('semi_month',),
+        ('month',),
+        ('quarter',),
+        ('event_id',),
+        ('eventholder_user_id',),
+        ('payment_processor',),
+        ('sales_flag',),
+        ('sub_vertical',),
+    ])
+    def test_render_dynamic_table_matches_template(self, groupby):
+        trx = manage_transactions(self.transactions.copy(), groupby=groupby)
+        if not groupby:
+            trx = trx[TRANSACTIONS_COLUMNS]
+        self.assertEqual(render_dynamic_table(trx, groupby), self.render_template(trx, groupby))
+
+    def test_render_dynamic_table_matches_template_in_usd(self):
+        trx = manage_transactions(
+            dataframe_to_usd(self.transactions.copy(), {'August': {'ars_to_usd': 60.01, 'brl_to_usd': 5.02}}),
+            groupby='week',
+        )
+        self.assertEqual(render_dynamic_table(trx, 'week'), self.render_template(trx, 'week'))
+
+    def test_render_dynamic_table_matches_template_for_event(self):
+        transactions, _, _, _ = get_event_transactions(self.transactions.copy(), '66220941')
+        trx = transactions[EVENT_COLUMNS]
+        self.assertEqual(render_dynamic_table(trx), self.render_template(trx))
+
+    @parameterized.expand([
+        ('ARS', True),
+        ('USD', False),
+    ])
+    def test_render_dynamic_table_matches_template_for_top_organizers(self, currency, integer):
+        top = get_top_organizers(
+            self.transactions[self.transactions['currency'] == ARS],
+        )[:10][TOP_ORGANIZERS['columns']].rename(columns=TOP_ORGANIZERS['labels'])
+        # The template can't reverse the url of the "Others" row
+        top = top[top['Organizer'].notnull()]
+        self.assertEqual(
+            render_dynamic_table(top, currency=currency, integer=integer),
+            self.render_template(top, currency=currency, int=integer),
+        )
+
+    def test_render_dynamic_table_others_row_without_link(self):
+        top = get_top_organizers(
+            self.transactions[self.transactions['currency'] == ARS],
+        )[:10][TOP_ORGANIZERS['columns']].rename(columns=TOP_ORGANIZERS['labels'])
+        rendered = render_dynamic_table(top, currency='ARS', integer=True)
+        self.assertIn('<td>Others</td>', rendered)
+        self.assertIn(reverse('organizer-transactions', kwargs={'eventholder_user_id': 497321858}), rendered)
+
+    def test_dynamic_table_tag_uses_groupby_from_request(self):
+        trx = manage_transactions(self.transactions.copy(), groupby='month')
+        self.request.GET = self.request.GET.copy()
+        self.request.GET['groupby'] = 'month'
+        rendered = Template(
+            '{% load table_filters %}{% dynamic_table transactions %}'
+        ).render(Context({'transactions': trx, 'request': self.request}))
+        self.assertEqual(rendered, render_dynamic_table(trx, 'month'))
+        self.assertIn('August, 2018', rendered)
+
+
 class PrestoQueriesTestCase(TestCase):
     def test_read_sql(self):
         expected = '''SELECT
@@ -1349,3 +2479,997 @@ ORDER BY 1, 2
         with patch("revenue_app.presto_connection.open", return_value=open(TRANSACTIONS_SQL_EXAMPLE_PATH)):
             readed = read_sql('transactions')
         self.assertEqual(readed, expected)
+
+
+class HandshakeCountingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.handshakes += 1
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.send_json(self.server.info_status, {'coordinator': True})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(self.server.latency)
+        self.send_json(200, {
+            'id': 'query',
+            'columns': [{'name': 'value', 'type': 'bigint'}],
+            'data': [[1], [2]],
+            'stats': {'state': 'FINISHED'},
+        })
+
+    def log_message(self, *args):
+        pass
+
+
+class PrestoConnectionPoolTest(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), HandshakeCountingHandler)
+        self.server.lock = threading.Lock()
+        self.server.handshakes = 0
+        self.server.info_status = 200
+        self.server.latency = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.settings = override_settings(
+            PRESTO_HOST='127.0.0.1',
+            PRESTO_PORT=self.server.server_address[1],
+            PRESTO_PROTOCOL='http',
+        )
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def run_queries(self, pool, count, user='user'):
+        with patch('revenue_app.presto_connection.presto_pool', pool):
+            return [query_presto('2019-01-01', '2019-01-31', user, 'password', 'SELECT 1', 'q') for _ in range(count)]
+
+    def make_pool(self, **kwargs):
+        options = {'max_size': 2, 'idle_timeout': 300, 'health_check_interval': 30, 'timeout': 5}
+        options.update(kwargs)
+        return PrestoConnectionPool(**options)
+
+    def test_queries_reuse_the_connection(self):
+        pool = self.make_pool()
+        dataframes = self.run_queries(pool, 4)
+        self.assertEqual(dataframes[0]['value'].tolist(), [1, 2])
+        self.assertEqual(self.server.handshakes, 1)
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['reused'], 3)
+        pool.clear()
+
+    def test_sessions_are_keyed_by_user(self):
+        pool = self.make_pool()
+        self.run_queries(pool, 2, 'first')
+        self.run_queries(pool, 2, 'second')
+        self.assertEqual(self.server.handshakes, 2)
+        self.assertEqual(pool.stats()['idle'], 2)
+        pool.clear()
+
+    def test_parallel_queries_are_bounded_by_pool_size(self):
+        pool = self.make_pool()
+        self.server.latency = 0.05
+        # Different statements, identical ones would share a single fetch
+        threads = [
+            threading.Thread(target=query_presto, args=('2019-01-01', '2019-01-31', 'user', None, f'SELECT {i}', 'q'))
+            for i in range(8)
+        ]
+        with patch('revenue_app.presto_connection.presto_pool', pool):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(self.server.handshakes, 2)
+        self.assertEqual(pool.stats()['reused'], 6)
+        self.assertEqual(pool.stats()['in_use'], 0)
+        pool.clear()
+
+    def test_idle_sessions_expire(self):
+        pool = self.make_pool(idle_timeout=0)
+        self.run_queries(pool, 3)
+        self.assertEqual(self.server.handshakes, 3)
+        self.assertEqual(pool.stats()['expired'], 2)
+
+    def test_unhealthy_sessions_are_discarded(self):
+        pool = self.make_pool(health_check_interval=0)
+        self.run_queries(pool, 1)
+        self.server.info_status = 503
+        self.run_queries(pool, 1)
+        self.assertEqual(pool.stats()['discarded'], 1)
+        self.assertEqual(pool.stats()['created'], 2)
+        pool.clear()
+
+    def test_acquire_times_out_when_pool_is_exhausted(self):
+        pool = self.make_pool(max_size=1, timeout=0.01)
+        key = ('127.0.0.1', 8443, 'https', 'user')
+        pooled = pool.acquire(key)
+        with self.assertRaises(PrestoError):
+            pool.acquire(key)
+        pool.release(key, pooled)
+        pool.release(key, pool.acquire(key))
+        self.assertEqual(pool.stats()['reused'], 1)
+        pool.clear()
+
+    def test_release_wakes_the_waiters_of_its_key(self):
+        pool = self.make_pool(max_size=1, timeout=2)
+        first = ('127.0.0.1', 8443, 'https', 'first')
+        second = ('127.0.0.1', 8443, 'https', 'second')
+        held = {key: pool.acquire(key) for key in (first, second)}
+        acquired = []
+
+        def waiter(key):
+            acquired.append((key, pool.acquire(key)))
+
+        # The waiter of the second key waits first, a single notify would only wake it
+        threads = [threading.Thread(target=waiter, args=(key,)) for key in (second, first)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.1)
+        start = time.monotonic()
+        pool.release(first, held[first])
+        threads[1].join()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual([key for key, _ in acquired], [first])
+        pool.release(second, held[second])
+        threads[0].join()
+        for key, pooled in acquired:
+            pool.release(key, pooled)
+        self.assertEqual(pool.stats()['in_use'], 0)
+        pool.clear()
+
+
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.single_flight = SingleFlight(self.directory.name, result_ttl=60)
+        self.fetches = 0
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def slow_fetch(self, value, fail=False):
+        def fetch():
+            self.fetches += 1
+            time.sleep(0.1)
+            if fail:
+                raise PrestoError('Access Denied')
+            return DataFrame({'value': [value]})
+        return fetch
+
+    def run_threads(self, targets):
+        threads = [threading.Thread(target=target) for target in targets]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+
+    def test_threads_share_one_fetch(self):
+        results = []
+        self.run_threads([
+            lambda: results.append(self.single_flight.run('key', self.slow_fetch(1)))
+            for _ in range(4)
+        ])
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual([result['value'][0] for result in results], [1, 1, 1, 1])
+        self.assertEqual(self.single_flight.stats()['hit_rate'], 0.75)
+
+    def test_different_keys_are_not_shared(self):
+        self.run_threads([
+            lambda: self.single_flight.run('first', self.slow_fetch(1)),
+            lambda: self.single_flight.run('second', self.slow_fetch(2)),
+        ])
+        self.assertEqual(self.fetches, 2)
+        self.assertEqual(self.single_flight.stats()['shared'], 0)
+
+    def test_processes_share_the_result_through_the_lock_file(self):
+        # Another worker process is another SingleFlight over the same directory
+        other_process = SingleFlight(self.directory.name, result_ttl=60)
+        results = []
+        self.run_threads([
+            lambda: results.append(self.single_flight.run('key', self.slow_fetch(1))),
+            lambda: results.append(other_process.run('key', self.slow_fetch(2))),
+        ])
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual([result['value'][0] for result in results], [1, 1])
+        self.assertEqual(other_process.stats()['shared'], 1)
+        # Finished flights are not shared with later calls
+        other_process.run('key', self.slow_fetch(3))
+        self.assertEqual(self.fetches, 2)
+        # Results are removed once read
+        self.assertEqual(glob.glob(os.path.join(self.directory.name, '*.pkl*')), [])
+
+    def test_results_nobody_waits_for_are_not_written(self):
+        with patch.object(DataFrame, 'to_pickle') as to_pickle:
+            self.single_flight.run('key', self.slow_fetch(1))
+        to_pickle.assert_not_called()
+
+    def test_shared_results_are_verified_for_every_waiter(self):
+        other_process = SingleFlight(self.directory.name, result_ttl=60)
+        results = []
+        errors = []
+
+        def denied():
+            raise PrestoError('Access Denied')
+
+        def waiter(single_flight):
+            try:
+                results.append(single_flight.run('key', self.slow_fetch(2), verify=denied))
+            except PrestoError as exception:
+                errors.append(exception)
+
+        self.run_threads([
+            lambda: results.append(self.single_flight.run('key', self.slow_fetch(1), verify=denied)),
+            lambda: waiter(self.single_flight),
+            lambda: waiter(other_process),
+        ])
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual([result['value'][0] for result in results], [1])
+        self.assertEqual(len(errors), 2)
+
+    def test_query_presto_checks_the_access_of_waiters(self):
+        def check_access(sql, okta_username, okta_password, query_name):
+            if okta_password != 'right':
+                raise PrestoError('Access Denied')
+
+        results = []
+        errors = []
+
+        def query(password):
+            try:
+                results.append(query_presto('2018-08-01', '2018-08-02', 'user', password, 'SELECT {} {}', 'test'))
+            except PrestoError as exception:
+                errors.append(exception)
+
+        with override_settings(PRESTO_SINGLE_FLIGHT_DIR=self.directory.name), \
+                patch('revenue_app.presto_connection.run_query', side_effect=lambda *args: self.slow_fetch(1)()), \
+                patch('revenue_app.presto_connection.check_access', side_effect=check_access):
+            self.run_threads([lambda: query('right'), lambda: query('wrong')])
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(len(errors), 1)
+
+    def test_failures_are_not_shared(self):
+        errors = []
+
+        def failing():
+            try:
+                self.single_flight.run('key', self.slow_fetch(1, fail=True))
+            except PrestoError as exception:
+                errors.append(exception)
+
+        results = []
+        self.run_threads([failing, lambda: results.append(self.single_flight.run('key', self.slow_fetch(2)))])
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(results[0]['value'][0], 2)
+        self.assertEqual(self.single_flight.stats()['shared'], 0)
+
+
+class SharedDatasetTest(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.store = SharedDatasetStore(self.directory.name, ttl=60)
+        self.transactions = generate_transactions_consolidation(
+            read_csv(TRANSACTIONS_EXAMPLE_PATH),
+            read_csv(CORRECTIONS_EXAMPLE_PATH),
+            read_csv(ORGANIZER_SALES_EXAMPLE_PATH),
+            read_csv(ORGANIZER_REFUNDS_EXAMPLE_PATH),
+        )
+        self.client = Client()
+        self.settings = override_settings(
+            SHARED_DATASET_DIR=self.directory.name,
+            PRESTO_SQL_DIR='revenue_app/tests/sql',
+        )
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.directory.cleanup()
+
+    def test_read_returns_the_written_dataset_mapped(self):
+        key = self.store.write(self.transactions)
+        transactions = self.store.read(key)
+        assert_frame_equal(transactions, self.transactions)
+        self.assertIsInstance(transactions['sale__payment_amount__epp'].values.base, np.memmap)
+
+    def test_reads_are_decoded_once_per_process(self):
+        key = self.store.write(self.transactions)
+        self.assertIs(self.store.read(key), self.store.read(key))
+        self.assertIs(SharedDatasetStore(self.directory.name, ttl=60).read(key), self.store.read(key))
+
+    def test_changes_to_a_read_stay_in_the_process(self):
+        key = self.store.write(self.transactions)
+        transactions = self.store.read(key)
+        transactions['sale__payment_amount__epp'] *= 2
+        transactions.loc[0, 'email'] = 'changed@example.com'
+        # What another worker reads
+        shared_frames.clear()
+        assert_frame_equal(self.store.read(key), self.transactions)
+
+    def test_references_of_sessions_still_reading_are_kept(self):
+        self.make_query()
+        key = self.client.session['transactions'].key
+        reference_path = self.store.reference_path(key, self.client.session['dataset_owner'])
+        day_ago = time.time() - 24 * 60 * 60
+        os.utime(reference_path, (day_ago, day_ago))
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        self.store.ttl = 60 * 60
+        self.store.expire()
+        self.assertEqual(self.store.references(key), 1)
+        os.utime(reference_path, (day_ago, day_ago))
+        self.store.expire()
+        self.assertEqual(self.store.references(key), 0)
+
+    def test_unsupported_dtypes_stay_in_the_session(self):
+        transactions = self.transactions.astype({'currency': 'category'})
+        self.assertFalse(self.store.supports(transactions))
+        self.assertTrue(self.store.supports(self.transactions))
+
+    def test_expired_datasets_are_removed(self):
+        key = self.store.write(self.transactions)
+        self.store.ttl = -1
+        self.store.expire()
+        self.assertIsNone(self.store.read(key))
+
+    def make_query(self, client=None, end_date='2018-08-05'):
+        with patch('revenue_app.views.make_query', side_effect=(
+            read_csv(TRANSACTIONS_EXAMPLE_PATH),
+            read_csv(CORRECTIONS_EXAMPLE_PATH),
+            read_csv(ORGANIZER_SALES_EXAMPLE_PATH),
+            read_csv(ORGANIZER_REFUNDS_EXAMPLE_PATH),
+        )):
+            (client or self.client).post(reverse('make-query'), {
+                'start_date': '2018-08-02',
+                'end_date': end_date,
+                'okta_username': 'fakename',
+                'okta_password': 'fakepass',
+            })
+
+    def test_views_read_the_shared_dataset(self):
+        self.make_query()
+        shared = self.client.session['transactions']
+        self.assertIsInstance(shared, SharedDataset)
+        assert_frame_equal(self.store.read(shared.key), self.transactions)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_views_redirect_to_make_query_if_the_dataset_expired(self):
+        self.make_query()
+        self.store.ttl = -1
+        self.store.expire()
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(reverse('make-query')))
+
+    def test_identical_queries_share_one_dataset(self):
+        other_client = Client()
+        self.make_query()
+        with patch('revenue_app.views.generate_transactions_consolidation') as consolidation:
+            self.make_query(other_client)
+        consolidation.assert_not_called()
+        key = self.client.session['transactions'].key
+        self.assertEqual(other_client.session['transactions'].key, key)
+        self.assertEqual(other_client.session['dataset_version'], self.client.session['dataset_version'])
+        self.assertEqual(self.store.references(key), 2)
+        # A different range is another dataset, the last session referencing the first one evicts it
+        self.make_query(end_date='2018-08-06')
+        self.assertNotEqual(self.client.session['transactions'].key, key)
+        self.assertEqual(self.store.references(key), 1)
+        self.make_query(other_client, end_date='2018-08-06')
+        self.assertFalse(self.store.exists(key))
+
+    def test_exchange_is_layered_on_the_shared_dataset(self):
+        other_client = Client()
+        self.make_query()
+        self.make_query(other_client)
+        base_key = self.client.session['transactions'].key
+        for client in (self.client, other_client):
+            client.post(reverse('exchange'), {'August-ars_to_usd': 60.01, 'August-brl_to_usd': 5.02})
+        converted = self.client.session['transactions']
+        self.assertEqual(converted.base.key, base_key)
+        self.assertEqual(other_client.session['transactions'].key, converted.key)
+        self.assertEqual(self.store.read(converted.key)['currency'].unique().tolist(), ['USD'])
+        self.client.get(reverse('restore-currency'))
+        self.assertEqual(self.client.session['transactions'].key, base_key)
+        other_client.get(reverse('restore-currency'))
+        self.assertFalse(self.store.exists(converted.key))
+        assert_frame_equal(self.store.read(base_key), self.transactions)
+
+
+class PrewarmCacheTest(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.store = SharedDatasetStore(self.directory.name, ttl=60)
+        self.client = Client()
+        self.settings = override_settings(
+            SHARED_DATASET_DIR=self.directory.name,
+            PRESTO_SQL_DIR='revenue_app/tests/sql',
+        )
+        self.settings.enable()
+        self.environ = patch.dict(os.environ, {'OKTA_USERNAME': 'fakename', 'OKTA_PASSWORD': 'fakepass'})
+        self.environ.start()
+
+    def tearDown(self):
+        self.environ.stop()
+        self.settings.disable()
+        self.directory.cleanup()
+
+    def fake_query(self, query_name, **kwargs):
+        return read_csv({
+            'transactions': TRANSACTIONS_EXAMPLE_PATH,
+            'corrections': CORRECTIONS_EXAMPLE_PATH,
+            'organizer_sales': ORGANIZER_SALES_EXAMPLE_PATH,
+            'organizer_refunds': ORGANIZER_REFUNDS_EXAMPLE_PATH,
+        }[query_name])
+
+    def prewarm(self, start_date, end_date):
+        with patch('revenue_app.reports.make_query', side_effect=self.fake_query):
+            return prewarm_range(start_date, end_date, 'fakename', 'fakepass')
+
+    def make_query(self, end_date='2018-08-31', report='full'):
+        with patch('revenue_app.views.check_query_access') as check_query_access, \
+                patch('revenue_app.views.make_query', side_effect=self.fake_query) as make_query:
+            response = self.client.post(reverse('make-query'), {
+                'start_date': '2018-08-01',
+                'end_date': end_date,
+                'okta_username': 'fakename',
+                'okta_password': 'fakepass',
+                'report': report,
+            })
+        return response, check_query_access, make_query
+
+    @parameterized.expand([
+        (date(2019, 9, 15), (date(2019, 8, 1), date(2019, 8, 31)), (date(2019, 9, 1), date(2019, 9, 14))),
+        (date(2020, 1, 1), (date(2019, 12, 1), date(2019, 12, 31)), None),
+        (date(2020, 3, 2), (date(2020, 2, 1), date(2020, 2, 29)), (date(2020, 3, 1), date(2020, 3, 1))),
+    ])
+    def test_prewarm_ranges(self, today, previous_month, month_to_date):
+        self.assertEqual(previous_month_range(today), previous_month)
+        self.assertEqual(month_to_date_range(today), month_to_date)
+
+    def test_command_prewarms_the_previous_month(self):
+        stdout = StringIO()
+        with patch('revenue_app.reports.make_query', side_effect=self.fake_query):
+            call_command('prewarm_cache', '--range', 'previous_month', stdout=stdout)
+        start_date, end_date = previous_month_range(date.today())
+        key = self.store.get_alias(f'{start_date}_{end_date}')['key']
+        self.assertIn(key, stdout.getvalue())
+        self.assertTrue(self.store.exists(key))
+        self.assertIsNotNone(self.store.read_derived(key, 'summarized_data'))
+        self.assertIsNotNone(self.store.read_derived(key, 'transactions_grouped:month'))
+
+    def test_command_needs_the_shared_dataset_dir(self):
+        with override_settings(SHARED_DATASET_DIR=None):
+            with self.assertRaisesMessage(CommandError, 'SHARED_DATASET_DIR must be set'):
+                call_command('prewarm_cache')
+
+    def test_make_query_uses_the_prewarmed_dataset(self):
+        key = self.prewarm('2018-08-01', '2018-08-31')
+        response, check_query_access, make_query = self.make_query()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(check_query_access.call_args_list, [
+            call('2018-08-01', '2018-08-31', 'fakename', 'fakepass', name)
+            for name in ['transactions', 'corrections', 'organizer_sales', 'organizer_refunds']
+        ])
+        make_query.assert_not_called()
+        self.assertEqual(self.client.session['transactions'].key, key)
+        self.assertEqual(self.store.references(key), 2)
+        with patch('revenue_app.utils.get_summarized_data') as get_summarized_data:
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        get_summarized_data.assert_not_called()
+
+    def test_prewarmed_dataset_is_only_used_for_its_range_and_report(self):
+        self.prewarm('2018-08-01', '2018-08-31')
+        for end_date, report in (('2018-08-30', 'full'), ('2018-08-31', 'summary')):
+            _, check_query_access, make_query = self.make_query(end_date, report)
+            check_query_access.assert_not_called()
+            self.assertEqual(make_query.call_count, 4)
+
+    def test_prewarmed_dataset_needs_access_to_the_tables(self):
+        self.prewarm('2018-08-01', '2018-08-31')
+        with patch('revenue_app.views.check_query_access', side_effect=PrestoError('Access Denied')):
+            response = self.client.post(reverse('make-query'), {
+                'start_date': '2018-08-01',
+                'end_date': '2018-08-31',
+                'okta_username': 'fakename',
+                'okta_password': 'wrong',
+            })
+        self.assertContains(response, 'Access Denied')
+        self.assertIsNone(self.client.session.get('transactions'))
+
+
+class PrestoStandinTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.dataset = generate_dataset(date(2019, 8, 1), date(2019, 8, 31), rows_per_day=10)
+
+    def setUp(self):
+        self.standin = PrestoStandin(dataset=self.dataset, page_size=50).start()
+        self.settings = override_settings(
+            PRESTO_HOST='127.0.0.1',
+            PRESTO_PORT=self.standin.port,
+            PRESTO_PROTOCOL='http',
+            PRESTO_SQL_DIR='revenue_app/tests/sql',
+        )
+        self.settings.enable()
+        self.pool = PrestoConnectionPool(max_size=2, idle_timeout=300, health_check_interval=30, timeout=5)
+        self.patched_pool = patch('revenue_app.presto_connection.presto_pool', self.pool)
+        self.patched_pool.start()
+
+    def tearDown(self):
+        self.patched_pool.stop()
+        self.pool.clear()
+        self.settings.disable()
+        self.standin.stop()
+
+    @parameterized.expand([
+        ("WHERE d >= CAST('2019-08-01' AS DATE)", "WHERE d >= DATE('2019-08-01')"),
+        ("WHERE d <= cast(t.other as date)", "WHERE d <= DATE(t.other)"),
+        ("WHERE d = DATE '2019-08-01'", "WHERE d = '2019-08-01'"),
+        ("FROM hive.revenue.transactions t JOIN hive.other o", "FROM transactions t JOIN other o"),
+        ("SELECT o.id FROM transactions", "SELECT o.id FROM transactions"),
+    ])
+    def test_translate_sql(self, sql, expected):
+        self.assertEqual(translate_sql(sql), expected)
+
+    def test_generate_dataset_is_deterministic(self):
+        dataset = generate_dataset(date(2019, 8, 1), date(2019, 8, 31), rows_per_day=10)
+        for name, dataframe in self.dataset.items():
+            assert_frame_equal(dataframe, dataset[name])
+        self.assertEqual(len(dataset['transactions']), 310)
+
+    def test_make_query_fetches_all_pages(self):
+        transactions = make_query('2019-08-01', '2019-08-15', 'user', 'password', 'transactions')
+        expected = self.dataset['transactions']
+        expected = expected[expected['transaction_created_date'] <= '2019-08-15']
+        self.assertEqual(len(transactions), len(expected))
+        self.assertEqual(transactions['sale__gtf_esf__epp'].sum(), expected['sale__gtf_esf__epp'].sum())
+        stats = self.standin.stats()
+        self.assertEqual(stats['statements'], 1)
+        self.assertEqual(stats['pages'], 3)
+        self.assertEqual(stats['handshakes'], 1)
+
+    @parameterized.expand([
+        ('error', 'Access Denied: Cannot select from table (injected failure)'),
+        ('http', 'Unexpected status code 503'),
+    ])
+    def test_make_query_injected_failures(self, failure_mode, message):
+        self.standin.failure_rate = 1
+        self.standin.failure_mode = failure_mode
+        with self.assertRaises(PrestoError) as context:
+            make_query('2019-08-01', '2019-08-15', 'user', 'password', 'transactions')
+        self.assertIn(message, context.exception.args[0])
+        self.assertEqual(self.standin.stats()['failures'], 1)
+
+    def test_query_presto_sql_error(self):
+        with self.assertRaises(PrestoError) as context:
+            query_presto('2019-08-01', '2019-08-15', 'user', 'password', 'SELECT * FROM missing', 'missing')
+        self.assertIn('no such table: missing', context.exception.args[0])
+
+    def test_make_query_view_end_to_end(self):
+        response = self.client.post(reverse('make-query'), {
+            'okta_username': 'user',
+            'okta_password': 'password',
+            'start_date': '2019-08-01',
+            'end_date': '2019-08-31',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['queries_status']), 4)
+        transactions = self.client.session['transactions']
+        self.assertEqual(transactions['transaction_created_date'].min(), datetime(2019, 8, 1))
+        self.assertEqual(transactions['transaction_created_date'].max(), datetime(2019, 8, 31))
+        self.assertEqual(set(transactions['currency']), {ARS, BRL})
+        self.assertEqual(self.standin.stats()['statements'], 4)
+
+    def stream_progress(self, data):
+        progress_id = '0123456789abcdef0123456789abcdef'
+        with TemporaryDirectory() as progress_dir, override_settings(PROGRESS_DIR=progress_dir):
+            self.client.post(reverse('make-query'), dict(data, progress_id=progress_id))
+            response = self.client.get(reverse('progress-events', args=[progress_id]))
+            content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['X-Accel-Buffering'], 'no')
+        return [json.loads(line[len('data: '):]) for line in content.splitlines() if line.startswith('data: ')]
+
+    @override_settings(PROGRESS_STREAM_TIMEOUT=0.05)
+    def test_progress_is_only_streamed_to_the_session_running_the_queries(self):
+        progress_id = '0123456789abcdef0123456789abcdef'
+        with TemporaryDirectory() as progress_dir, override_settings(PROGRESS_DIR=progress_dir):
+            self.client.post(reverse('make-query'), {
+                'okta_username': 'user',
+                'okta_password': 'password',
+                'start_date': '2019-08-01',
+                'end_date': '2019-08-31',
+                'progress_id': progress_id,
+            })
+            response = Client().get(reverse('progress-events', args=[progress_id]))
+            self.assertEqual(response.status_code, 404)
+            response = self.client.get(reverse('progress-events', args=[progress_id]), HTTP_LAST_EVENT_ID='1000000')
+            content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(content, 'retry: 1000\n\n')
+
+    @override_settings(PRESTO_FAST_FETCH=True)
+    def test_make_query_view_streams_progress(self):
+        events = self.stream_progress({
+            'okta_username': 'user',
+            'okta_password': 'password',
+            'start_date': '2019-08-01',
+            'end_date': '2019-08-31',
+        })
+        queries = ['transactions', 'corrections', 'organizer_sales', 'organizer_refunds']
+        self.assertEqual([(event['name'], event['state']) for event in events[:4]], [
+            (name, 'queued') for name in queries
+        ])
+        transactions = [event for event in events if event['event'] == 'query' and event['name'] == 'transactions']
+        # 310 rows in pages of 50
+        self.assertEqual(
+            [event['state'] for event in transactions],
+            ['queued', 'running'] + ['fetching'] * 7 + ['done'],
+        )
+        self.assertEqual([event['rows'] for event in transactions[2:]], [50, 100, 150, 200, 250, 300, 310, 310])
+        self.assertGreater(transactions[-1]['bytes'], transactions[2]['bytes'])
+        self.assertEqual(transactions[-1]['bytes'], transactions[-2]['bytes'])
+        stages = [event['name'] for event in events if event['event'] == 'stage']
+        self.assertEqual(stages[0], 'clean_transactions')
+        self.assertEqual(stages[-1], 'add_period_keys')
+        # Consolidation only starts once every query is done
+        first_stage = next(position for position, event in enumerate(events) if event['event'] == 'stage')
+        self.assertEqual(
+            [event['name'] for event in events[:first_stage] if event.get('state') == 'done'],
+            queries,
+        )
+        self.assertEqual(events[-1]['event'], 'done')
+        self.assertTrue(events[-1]['ok'])
+
+    def test_make_query_view_streams_failures(self):
+        self.standin.failure_rate = 1
+        events = self.stream_progress({
+            'okta_username': 'user',
+            'okta_password': 'password',
+            'start_date': '2019-08-01',
+            'end_date': '2019-08-31',
+        })
+        failed = [event for event in events if event.get('state') == 'failed']
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(failed[0]['name'], 'transactions')
+        self.assertIn('injected failure', failed[0]['error'])
+        self.assertNotIn('stage', [event['event'] for event in events])
+        self.assertEqual(events[-1]['event'], 'done')
+        self.assertFalse(events[-1]['ok'])
+
+    @parameterized.expand([
+        ('transactions', None),
+        ('corrections', None),
+        ('organizer_sales', None),
+        ('organizer_refunds', None),
+        (None, 'SELECT event_id, NULLIF(is_refund, 1) AS refund, NULLIF(sale__gtf_esf__epp, 0) AS gtf FROM transactions'),
+        (None, 'SELECT * FROM transactions WHERE 1 = 0'),
+    ])
+    def test_fetch_dataframe_matches_pyhive(self, query_name, sql):
+        if query_name:
+            sql = read_sql(query_name).format('2019-08-01', '2019-08-31')
+        with requests.Session() as session:
+            expected = pyhive_dataframe(session, sql, '127.0.0.1', self.standin.port, 'http', 'user')
+            dataframe = fetch_dataframe(session, sql, '127.0.0.1', self.standin.port, 'http', 'user')
+        assert_frame_equal(dataframe, expected)
+
+    def test_identical_concurrent_queries_share_one_fetch(self):
+        self.standin.latency = 0.05
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                make_query('2019-08-01', '2019-08-15', 'user', 'password', 'transactions'),
+            ))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # One fetch, the other three only check their access (EXPLAIN)
+        self.assertEqual(self.standin.stats()['statements'], 4)
+        for result in results[1:]:
+            assert_frame_equal(result, results[0])
+
+    def test_shared_fetch_is_refused_to_users_without_table_access(self):
+        self.standin.denied_tables = {'intruder': {'transactions'}}
+        self.standin.latency = 0.1
+        results = []
+        errors = []
+
+        def query(okta_username):
+            try:
+                results.append(make_query('2019-08-01', '2019-08-15', okta_username, 'password', 'transactions'))
+            except PrestoError as exception:
+                errors.append(exception)
+
+        owner = threading.Thread(target=query, args=('user',))
+        intruder = threading.Thread(target=query, args=('intruder',))
+        owner.start()
+        time.sleep(0.05)
+        intruder.start()
+        owner.join()
+        intruder.join()
+        self.assertEqual(len(results), 1)
+        self.assertEqual(len(errors), 1)
+        self.assertIn('Access Denied: Cannot select from table transactions', errors[0].args[0])
+        # The intruder can log in, only the table is out of reach
+        logged_in = query_presto('2019-08-01', '2019-08-15', 'intruder', 'password', 'SELECT 1', 'test')
+        self.assertEqual(logged_in.shape, (1, 1))
+
+    def test_check_query_access_plans_the_query_with_the_users_permissions(self):
+        self.standin.denied_tables = {'intruder': {'organizer_refunds'}}
+        check_query_access('2019-08-01', '2019-08-15', 'intruder', 'password', 'transactions')
+        with self.assertRaises(PrestoError) as context:
+            check_query_access('2019-08-01', '2019-08-15', 'intruder', 'password', 'organizer_refunds')
+        self.assertIn('Cannot select from table organizer_refunds', context.exception.args[0])
+        self.assertEqual(self.standin.stats()['statements'], 2)
+
+    @override_settings(PRESTO_FAST_FETCH=True)
+    def test_make_query_with_fast_fetch(self):
+        transactions = make_query('2019-08-01', '2019-08-15', 'user', 'password', 'transactions')
+        self.assertEqual(transactions['event_id'].dtype, 'int64')
+        self.assertEqual(transactions['sale__gtf_esf__epp'].dtype, 'float64')
+        self.assertEqual(self.standin.stats()['pages'], 3)
+        self.standin.failure_rate = 1
+        with self.assertRaises(PrestoError) as context:
+            make_query('2019-08-01', '2019-08-15', 'user', 'password', 'transactions')
+        self.assertIn('injected failure', context.exception.args[0])
+
+    def test_column_buffer_falls_back_to_list_on_nulls(self):
+        buffer = ColumnBuffer('value', 'bigint')
+        buffer.extend((1, 2))
+        self.assertEqual(buffer.to_array().dtype, 'int64')
+        buffer.extend((3, None, 5))
+        self.assertEqual(buffer.to_array(), [1, 2, 3, None, 5])
+
+    def test_make_query_projects_columns(self):
+        organizer_sales = make_query(
+            '2019-08-01', '2019-08-15', 'user', 'password', 'organizer_sales', columns=SUMMARY_COLUMNS,
+        )
+        self.assertEqual(
+            organizer_sales.columns.tolist(),
+            ['trx_date', 'organizer_email', 'event_id', 'event_title', 'sales_flag', 'PaidTix'],
+        )
+        full = make_query('2019-08-01', '2019-08-15', 'user', 'password', 'organizer_sales')
+        assert_frame_equal(organizer_sales, full[organizer_sales.columns])
+
+    def test_summary_report_backfills_full_columns(self):
+        kwargs = {
+            'okta_username': 'user',
+            'okta_password': 'password',
+            'start_date': '2019-08-01',
+            'end_date': '2019-08-31',
+        }
+        self.client.post(reverse('make-query'), dict(kwargs, report='summary'))
+        self.assertEqual(self.client.session['dataset_columns'], SUMMARY_COLUMNS)
+        self.assertNotIn('sale__eb_tax__epp', self.client.session['transactions'].columns)
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('top-events')).status_code, 200)
+
+        response = self.client.get(reverse('organizers-transactions'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, reverse('make-query') + '?next=%2Ftransactions%2F')
+        response = self.client.get(response.url)
+        self.assertEqual(str(response.context['form'].initial['start_date']), '2019-08-01')
+        self.assertContains(response, 'action="/queries/?next=/transactions/"')
+
+        response = self.client.post(reverse('make-query') + '?next=/transactions/', kwargs)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, reverse('organizers-transactions'))
+        self.assertIsNone(self.client.session['dataset_columns'])
+        self.assertEqual(self.client.get(response.url).status_code, 200)
+        self.assertEqual(self.standin.stats()['statements'], 8)
+
+    def test_aggregate_queries_match_local_computation(self):
+        full = generate_transactions_consolidation(**{
+            name: make_query('2019-08-01', '2019-08-31', 'user', 'password', name)
+            for name in ['transactions', 'corrections', 'organizer_sales', 'organizer_refunds']
+        })
+        totals = clean_aggregates(make_aggregate_query('2019-08-01', '2019-08-31', 'user', 'password', 'totals'))
+        daily = clean_aggregates(make_aggregate_query('2019-08-01', '2019-08-31', 'user', 'password', 'daily'))
+        self.assertLess(len(totals), len(full))
+        for groupby in ['day', 'week', 'month', 'quarter']:
+            assert_frame_equal(manage_transactions(daily, groupby=groupby), manage_transactions(full, groupby=groupby))
+        for groupby in ['event_id', 'payment_processor', 'sales_flag', 'sub_vertical', 'currency']:
+            assert_frame_equal(manage_transactions(totals, groupby=groupby), manage_transactions(full, groupby=groupby))
+        for currency in [ARS, BRL]:
+            assert_frame_equal(
+                get_top_events(totals[totals['currency'] == currency]),
+                get_top_events(full[full['currency'] == currency]),
+            )
+        for column in MONEY_COLUMNS:
+            self.assertEqual(totals[column].dtype, np.int64)
+            self.assertEqual(totals[column].sum(), full[column].sum())
+        self.assertEqual(get_summarized_data(totals), get_summarized_data(full))
+
+    def test_pushdown_report_end_to_end(self):
+        response = self.client.post(reverse('make-query'), {
+            'okta_username': 'user',
+            'okta_password': 'password',
+            'start_date': '2019-08-01',
+            'end_date': '2019-08-31',
+            'report': 'pushdown',
+        })
+        self.assertContains(response, 'totals aggregates ran successfully.')
+        self.assertEqual(self.standin.stats()['statements'], 2)
+        self.assertNotIn('transaction_created_date', self.client.session['transactions'].columns)
+        for url in [
+            reverse('dashboard'),
+            reverse('top-organizers'),
+            reverse('top-events') + '?currency=ARS',
+            reverse('transactions-grouped') + '?groupby=month',
+            reverse('transactions-grouped') + '?groupby=sales_flag',
+            reverse('json_dashboard_charts'),
+        ]:
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+        # Row level data is needed for date ranges, exchange rates and the detail pages
+        for url in [
+            reverse('top-organizers') + '?start_date=2019-08-01&end_date=2019-08-15',
+            reverse('transactions-grouped') + '?groupby=month&event_id=1',
+            reverse('exchange'),
+            reverse('organizers-transactions'),
+        ]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 302, url)
+            self.assertTrue(response.url.startswith(reverse('make-query') + '?next='))
+
+    def test_make_query_ignores_unsafe_next(self):
+        response = self.client.post(reverse('make-query') + '?next=https://example.com/', {
+            'okta_username': 'user',
+            'okta_password': 'password',
+            'start_date': '2019-08-01',
+            'end_date': '2019-08-31',
+        })
+        self.assertEqual(response.status_code, 200)
+
+
+class ProgressTest(TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.settings = override_settings(PROGRESS_DIR=self.directory.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.directory.cleanup()
+
+    @parameterized.expand([
+        (None,),
+        ('',),
+        ('../../etc/passwd',),
+        ('0123456789ABCDEF0123456789ABCDEF',),
+    ])
+    def test_get_channel_rejects_invalid_ids(self, progress_id):
+        self.assertIsNone(get_channel(progress_id, 'owner'))
+
+    def test_channel_is_only_open_to_its_owner(self):
+        self.assertIsNotNone(get_channel('d' * 32, 'owner'))
+        self.assertIsNotNone(get_channel('d' * 32, 'owner'))
+        self.assertIsNone(get_channel('d' * 32, 'another'))
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['d' * 32 + '.owner'])
+
+    def test_reporting_without_channel_does_nothing(self):
+        report_progress('stage', name='clean_transactions', ms=1)
+        with query_progress('transactions') as progress:
+            progress['rows'] = 10
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_channel_reads_complete_lines(self):
+        channel = get_channel('a' * 32, 'owner')
+        channel.emit('query', name='transactions', state='running')
+        with open(channel.path, 'a') as channel_file:
+            channel_file.write('{"event": "st')
+        events, offset = channel.read()
+        self.assertEqual([(event['event'], event['state']) for event in events], [('query', 'running')])
+        self.assertEqual(channel.read(offset), ([], offset))
+
+    def test_stream_events(self):
+        progress_id = 'b' * 32
+        with progress_channel(progress_id, 'owner'):
+            with query_progress('transactions') as progress:
+                progress['rows'] = 10
+            report_progress('done', ok=True)
+            report_progress('stage', name='after_done', ms=1)
+        events = list(stream_events(get_channel(progress_id, 'owner'), timeout=1, poll_interval=0.01))
+        self.assertEqual(events[0], 'retry: 1000\n\n')
+        self.assertTrue(events[1].startswith('event: query\ndata: {'))
+        self.assertEqual(
+            [event.split('\n')[0] for event in events[1:]],
+            ['event: query', 'event: query', 'event: done'],
+        )
+        self.assertEqual(json.loads(events[2].split('\n')[1][len('data: '):])['rows'], 10)
+
+    def test_stream_events_ends_before_the_run(self):
+        events = list(stream_events(get_channel('c' * 32, 'owner'), timeout=0.05, poll_interval=0.01))
+        self.assertEqual(events, ['retry: 1000\n\n'])
+
+    def test_stream_events_resumes_from_the_last_event_id(self):
+        channel = get_channel('e' * 32, 'owner')
+        channel.emit('query', name='transactions', state='queued')
+        channel.emit('query', name='corrections', state='queued')
+        offset = os.path.getsize(channel.path)
+        first = list(stream_events(channel, timeout=0.05, poll_interval=0.01))
+        self.assertEqual([event.split('\n')[0] for event in first[1:]], ['event: query', f'id: {offset}'])
+        channel.emit('done', ok=True)
+        second = list(stream_events(channel, offset=offset, timeout=1, poll_interval=0.01))
+        self.assertEqual(second[1].split('\n')[:2], [f'id: {os.path.getsize(channel.path)}', 'event: done'])
+        self.assertEqual(len(second), 2)
+
+    def test_progress_url_needs_an_id(self):
+        self.assertEqual(self.client.get('/progress/not-an-id/').status_code, 404)
+
+
+class QueriesTest(TestCase):
+    @parameterized.expand([
+        ('transactions', None, None),
+        ('organizer_refunds', ['email', 'sub_vertical'], ['trx_date', 'organizer_email', 'event_id', 'sub_vertical', 'PaidTix']),
+        (
+            'corrections',
+            ['eb_perc_take_rate'],
+            [
+                'eventholder_user_id',
+                'transaction_created_date',
+                'payment_processor',
+                'currency',
+                'event_id',
+                'email',
+                'is_refund',
+                'is_sale',
+                'sale__payment_amount__epp',
+                'sale__gtf_esf__epp',
+            ],
+        ),
+    ])
+    def test_get_query_columns(self, query_name, columns, expected):
+        self.assertEqual(get_query_columns(query_name, columns), expected)
+
+    @parameterized.expand([
+        ('dashboard', {}, TOTALS_COLUMNS),
+        ('top-organizers', {'start_date': '2019-08-01'}, TOTALS_COLUMNS + ['transaction_created_date']),
+        ('transactions-grouped', {'groupby': 'week', 'currency': 'ARS'}, DAILY_COLUMNS),
+        ('transactions-grouped', {'groupby': 'week', 'email': 'a@b.com'}, DAILY_COLUMNS + ['email']),
+        ('transactions-grouped', {}, None),
+        ('organizers-transactions', {}, None),
+    ])
+    def test_get_view_columns(self, view_name, params, expected):
+        self.assertEqual(get_view_columns(view_name, params), expected)
+
+    def test_projected_sql(self):
+        self.assertEqual(
+            projected_sql('SELECT a, b, c FROM t ORDER BY 1;\n', ['a', 'c']),
+            'SELECT "a", "c"\nFROM (\nSELECT a, b, c FROM t ORDER BY 1\n) AS projected',
+        )
+
+    def test_summary_consolidation_matches_full(self):
+        dataframes = {
+            'transactions': read_csv(TRANSACTIONS_EXAMPLE_PATH),
+            'corrections': read_csv(CORRECTIONS_EXAMPLE_PATH),
+            'organizer_sales': read_csv(ORGANIZER_SALES_EXAMPLE_PATH),
+            'organizer_refunds': read_csv(ORGANIZER_REFUNDS_EXAMPLE_PATH),
+        }
+        full = generate_transactions_consolidation(**dataframes)
+        summary = generate_transactions_consolidation(**{
+            name: dataframe[get_query_columns(name, SUMMARY_COLUMNS)]
+            for name, dataframe in dataframes.items()
+        })
+        self.assertEqual(set(summary.columns), set(SUMMARY_COLUMNS) | set(PERIOD_COLUMNS.values()))
+        assert_frame_equal(summary[SUMMARY_COLUMNS], full[SUMMARY_COLUMNS])
+        self.assertEqual(get_summarized_data(summary), get_summarized_data(full))
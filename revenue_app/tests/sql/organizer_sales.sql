@@ -0,0 +1,18 @@
+SELECT
+trx_date,
+organizer_email,
+organizer_name,
+event_id,
+event_title,
+sales_flag,
+sales_vertical,
+vertical,
+sub_vertical,
+sum(GTSntv) AS GTSntv,
+sum(GTFntv) AS GTFntv,
+sum(PaidTix) AS PaidTix
+FROM standin.revenue.organizer_sales
+WHERE trx_date >= CAST('{}' AS DATE)
+AND trx_date <= CAST('{}' AS DATE)
+GROUP BY 1, 2, 3, 4, 5, 6, 7, 8, 9
+ORDER BY 1, 2, 4
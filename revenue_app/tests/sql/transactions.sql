@@ -0,0 +1,23 @@
+SELECT
+eventholder_user_id,
+transaction_created_date,
+payment_processor,
+currency,
+event_id,
+email,
+is_refund,
+is_sale,
+sale__payment_amount__epp,
+sale__eb_tax__epp,
+sale__ap_organizer__gts__epp,
+sale__ap_organizer__royalty__epp,
+sale__gtf_esf__epp,
+refund__payment_amount__epp,
+refund__gtf_epp__gtf_esf__epp,
+refund__eb_tax__epp,
+refund__ap_organizer__gts__epp,
+refund__ap_organizer__royalty__epp
+FROM standin.revenue.transactions
+WHERE transaction_created_date >= CAST('{}' AS DATE)
+AND transaction_created_date <= CAST('{}' AS DATE)
+ORDER BY transaction_created_date, eventholder_user_id, event_id
@@ -2,22 +2,36 @@ from django.conf.urls import url
 
 from revenue_app.views import (
     Dashboard,
+    dashboard_charts,
     dashboard_summary,
+    DashboardPdf,
+    download_arrow,
     download_csv,
     download_excel,
+    download_parquet,
+    EventPdf,
     Exchange,
+    job_result,
+    job_status,
     MakeQuery,
+    OrganizerPdf,
     OrganizerTransactions,
     OrganizersTransactions,
+    performance_metrics,
+    progress_events,
     restore_local_currency,
+    search,
     TransactionsEvent,
     TransactionsGrouped,
     top_events_json_data,
     TopEventsLatam,
+    TopEventsPdf,
     top_organizers_json_data,
     TopOrganizersLatam,
+    TopOrganizersPdf,
     top_organizers_refunds_json_data,
     TopOrganizersRefundsLatam,
+    TopOrganizersRefundsPdf,
 )
 
 
@@ -39,8 +53,22 @@ urlpatterns = [
     url(r'^events/top/$', TopEventsLatam.as_view(), name='top-events'),
     url(r'^download/csv/(?P<csv_name>\w+)$', download_csv, name='download-csv'),
     url(r'^download/xls/(?P<xls_name>\w+)$', download_excel, name='download-excel'),
+    url(r'^download/parquet/(?P<parquet_name>\w+)$', download_parquet, name='download-parquet'),
+    url(r'^download/arrow/(?P<arrow_name>\w+)$', download_arrow, name='download-arrow'),
+    url(r'^pdf/dashboard/$', DashboardPdf.as_view(), name='pdf-dashboard'),
+    url(r'^pdf/organizers/top/$', TopOrganizersPdf.as_view(), name='pdf-top-organizers'),
+    url(r'^pdf/organizers/top/refunds/$', TopOrganizersRefundsPdf.as_view(), name='pdf-top-organizers-refunds'),
+    url(r'^pdf/events/top/$', TopEventsPdf.as_view(), name='pdf-top-events'),
+    url(r'^pdf/organizer/(?P<eventholder_user_id>[0-9]+)/$', OrganizerPdf.as_view(), name='pdf-organizer'),
+    url(r'^pdf/event/(?P<event_id>[0-9]+)/$', EventPdf.as_view(), name='pdf-event'),
+    url(r'^jobs/(?P<job_id>[0-9a-f]{32})/$', job_status, name='job-status'),
+    url(r'^jobs/(?P<job_id>[0-9a-f]{32})/result/$', job_result, name='job-result'),
     url(r'^json/top_org_arg/$', top_organizers_json_data, name='json_top_organizers'),
     url(r'^json/top_org_ref_arg/$', top_organizers_refunds_json_data, name='json_top_organizers_refunds'),
     url(r'^json/top_events_arg/$', top_events_json_data, name='json_top_events'),
     url(r'^json/dashboard_summary/$', dashboard_summary, name='json_dashboard_summary'),
+    url(r'^json/dashboard_charts/$', dashboard_charts, name='json_dashboard_charts'),
+    url(r'^json/search/$', search, name='json_search'),
+    url(r'^progress/(?P<progress_id>[0-9a-f]{32})/$', progress_events, name='progress-events'),
+    url(r'^metrics/performance/$', performance_metrics, name='performance-metrics'),
 ]
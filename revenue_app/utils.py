@@ -1,12 +1,37 @@
+import calendar
+from datetime import (
+    date,
+    timedelta,
+)
 from functools import reduce
-import numpy as np
-import pandas as pd
 
+from revenue_app.cache import (
+    chart_cache,
+    get_dataset_version,
+    profiles_cache,
+    transactions_cache,
+)
 from revenue_app.const import (
     ARS,
     BRL,
     USD,
 )
+from revenue_app.imports import lazy_import
+from revenue_app.performance import timed
+from revenue_app.progress import stage
+from revenue_app.search import build_search_index
+from revenue_app.shared_datasets import (
+    get_dataset,
+    get_dataset_key,
+    get_derived,
+)
+from revenue_app.sketches import (
+    build_distinct_sketches,
+    count_distinct,
+)
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
 
 
 MONEY_COLUMNS = [
@@ -46,6 +71,260 @@ NUMBER_COLUMNS = [
     # 'eb_perc_take_rate',
 ]
 
+DESCRIPTIVE_COLUMNS = [
+    'email',
+    'organizer_name',
+    'event_id',
+    'event_title',
+    'sales_flag',
+    'sales_vertical',
+    'vertical',
+    'sub_vertical',
+]
+
+TIME_GROUPBY = {
+    'day': 'D',
+    'week': 'W',
+    'semi_month': 'SMS',  # quincena del 1 al 14 y del 15 a fin de mes, consultar con finanzas
+    'month': 'M',
+    'quarter': 'Q',  # trimestre
+    'year': 'A',
+}
+
+# Integer period of each transaction for the time groupings, consecutive periods have consecutive keys
+PERIOD_COLUMNS = {by: f'period_{by}' for by in TIME_GROUPBY}
+
+# Page details taken from the first transaction, and what the paid tickets per day are averaged over
+PROFILES = {
+    'eventholder_user_id': {
+        'details': {
+            'Organizer ID': 'eventholder_user_id',
+            'Organizer Name': 'organizer_name',
+            'Email': 'email',
+            'Sales Flag': 'sales_flag',
+            'Sales Vertical': 'sales_vertical',
+        },
+        'per_day': 'days',
+    },
+    'event_id': {
+        'details': {
+            'Event ID': 'event_id',
+            'Event Title': 'event_title',
+            'Organizer ID': 'eventholder_user_id',
+            'Organizer Name': 'organizer_name',
+            'Email': 'email',
+            'Sales Flag': 'sales_flag',
+            'Sales Vertical': 'sales_vertical',
+        },
+        'per_day': 'rows',
+    },
+}
+
+CUSTOM_GROUPBY = {
+    'event_id': ['eventholder_user_id', 'email', 'event_id', 'event_title', 'currency'],
+    'eventholder_user_id': ['eventholder_user_id', 'email', 'currency'],
+    'payment_processor': ['payment_processor', 'currency'],
+    'sales_flag': ['sales_flag', 'currency'],
+    'sales_vertical': ['sales_vertical', 'currency'],
+    'vertical': ['vertical', 'currency'],
+    'sub_vertical': ['vertical', 'sub_vertical', 'currency'],
+    'currency': ['currency'],
+}
+
+FILTER_COLUMNS = ['event_id', 'email', 'currency', 'eventholder_user_id']
+TRANSACTIONS_PARAMS = FILTER_COLUMNS + ['start_date', 'end_date', 'groupby']
+
+FULL_COLUMNS = [
+    'transaction_created_date',
+    'eventholder_user_id',
+    'email',
+    'sales_flag',
+    'payment_processor',
+    'currency',
+    'PaidTix',
+    'sales_vertical',
+    'vertical',
+    'sub_vertical',
+    'event_id',
+    'event_title',
+    'eb_perc_take_rate',
+    'sale__payment_amount__epp',
+    'sale__gtf_esf__epp',
+    'sale__eb_tax__epp',
+    'sale__ap_organizer__gts__epp',
+    'sale__ap_organizer__royalty__epp',
+    'refund__payment_amount__epp',
+    'refund__gtf_epp__gtf_esf__epp',
+    'refund__eb_tax__epp',
+    'refund__ap_organizer__gts__epp',
+    'refund__ap_organizer__royalty__epp',
+]
+
+TRANSACTIONS_COLUMNS = [
+    'transaction_created_date',
+    'eventholder_user_id',
+    'email',
+    'sales_flag',
+    'payment_processor',
+    'currency',
+    'PaidTix',
+    'sales_vertical',
+    'vertical',
+    'sub_vertical',
+    'event_id',
+    'event_title',
+    'eb_perc_take_rate',
+    'sale__payment_amount__epp',
+    'sale__gtf_esf__epp',
+    'sale__eb_tax__epp',
+    'sale__ap_organizer__gts__epp',
+    'sale__ap_organizer__royalty__epp',
+    'refund__payment_amount__epp',
+    'refund__gtf_epp__gtf_esf__epp',
+    'refund__eb_tax__epp',
+    'refund__ap_organizer__gts__epp',
+    'refund__ap_organizer__royalty__epp',
+]
+
+ORGANIZER_COLUMNS = [
+    'transaction_created_date',
+    'event_id',
+    'event_title',
+    'payment_processor',
+    'currency',
+    'PaidTix',
+    'vertical',
+    'sub_vertical',
+    'eb_perc_take_rate',
+    'sale__payment_amount__epp',
+    'sale__gtf_esf__epp',
+    'sale__eb_tax__epp',
+    'sale__ap_organizer__gts__epp',
+    'sale__ap_organizer__royalty__epp',
+    'refund__payment_amount__epp',
+    'refund__gtf_epp__gtf_esf__epp',
+    'refund__eb_tax__epp',
+    'refund__ap_organizer__gts__epp',
+    'refund__ap_organizer__royalty__epp',
+]
+
+EVENT_COLUMNS = [
+    'transaction_created_date',
+    'eventholder_user_id',
+    'payment_processor',
+    'currency',
+    'PaidTix',
+    'vertical',
+    'sub_vertical',
+    'eb_perc_take_rate',
+    'sale__payment_amount__epp',
+    'sale__gtf_esf__epp',
+    'sale__eb_tax__epp',
+    'sale__ap_organizer__gts__epp',
+    'sale__ap_organizer__royalty__epp',
+    'refund__payment_amount__epp',
+    'refund__gtf_epp__gtf_esf__epp',
+    'refund__eb_tax__epp',
+    'refund__ap_organizer__gts__epp',
+    'refund__ap_organizer__royalty__epp',
+]
+
+TOP_ORGANIZERS = {
+    'columns': [
+        'eventholder_user_id',
+        'email',
+        'eb_perc_take_rate',
+        'sale__gtf_esf__epp',
+    ],
+    'labels': {
+        'eventholder_user_id': 'Organizer',
+        'email': 'Email',
+        'eb_perc_take_rate': 'Take Rate',
+        'sale__gtf_esf__epp': 'SalesGTF',
+    }
+}
+
+TOP_ORGANIZERS_REFUNDS = {
+    'columns': [
+        'eventholder_user_id',
+        'email',
+        'refund__gtf_epp__gtf_esf__epp',
+    ],
+    'labels': {
+        'eventholder_user_id': 'Organizer',
+        'email': 'Email',
+        'refund__gtf_epp__gtf_esf__epp': 'RefundGTF'
+    }
+}
+
+TOP_EVENTS_COLUMNS = {
+    'columns': [
+        'eventholder_user_id',
+        'email',
+        'event_id',
+        'event_title',
+        'eb_perc_take_rate',
+        'sale__gtf_esf__epp',
+    ],
+    'labels': {
+        'eventholder_user_id': 'Organizer',
+        'email': 'Email',
+        'event_title': 'Event Title',
+        'eb_perc_take_rate': 'Take Rate',
+        'sale__gtf_esf__epp': 'SalesGTF',
+    }
+}
+
+
+def present_columns(dataframe, columns):
+    # Projected queries only bring some of the columns
+    return [column for column in columns if column in dataframe.columns]
+
+
+# Consolidated datasets keep money in integer cents: sums are exact and nothing has to be rounded again.
+# Converted (USD) amounts keep the fractions of a cent as floats, so their totals are rounded only once.
+# Amounts come out where they are shown or exported, see cents_to_money.
+CENTS = 100
+
+
+def to_cents(values):
+    # Half cents away from zero, like round() in Presto where the aggregates are summed (see aggregate_sql)
+    cents = np.asarray(values, dtype=np.float64) * CENTS
+    return (np.sign(cents) * np.floor(np.abs(cents) + 0.5)).astype(np.int64)
+
+
+def from_cents(cents):
+    return np.round(cents / CENTS, 2)
+
+
+def money_columns_in(dataframe):
+    # The local_ copies of a converted dataset too
+    return [
+        column for column in dataframe.columns
+        if column in MONEY_COLUMNS or (column.startswith('local_') and column[len('local_'):] in MONEY_COLUMNS)
+    ]
+
+
+def money_to_cents(dataframe):
+    for column in present_columns(dataframe, MONEY_COLUMNS):
+        dataframe[column] = to_cents(dataframe[column].values)
+    return dataframe
+
+
+def whole_cents(dataframe):
+    # Converted amounts rounded to the cent, where rows are listed next to their totals
+    float_columns = [column for column in money_columns_in(dataframe) if dataframe[column].dtype.kind == 'f']
+    if not float_columns:
+        return dataframe
+    return dataframe.assign(**{column: np.rint(dataframe[column].values).astype(np.int64) for column in float_columns})
+
+
+def cents_to_money(dataframe):
+    cents_columns = money_columns_in(dataframe)
+    if not cents_columns:
+        return dataframe
+    return dataframe.assign(**{column: from_cents(dataframe[column].values) for column in cents_columns})
+
 
 def clean_transactions(transactions):
     transactions = transactions.replace(np.nan, '', regex=True)
@@ -54,7 +333,8 @@ def clean_transactions(transactions):
     )
     transactions['eventholder_user_id'] = transactions['eventholder_user_id'].apply(str)
     transactions['event_id'] = transactions['event_id'].apply(str)
-    transactions[MONEY_COLUMNS] = transactions[MONEY_COLUMNS].astype(float)
+    money_columns = present_columns(transactions, MONEY_COLUMNS)
+    transactions[money_columns] = transactions[money_columns].astype(float)
     return transactions
 
 
@@ -65,7 +345,8 @@ def clean_corrections(corrections):
     )
     corrections['eventholder_user_id'] = corrections['eventholder_user_id'].apply(str)
     corrections['event_id'] = corrections['event_id'].apply(str)
-    corrections[MONEY_COLUMNS] = corrections[MONEY_COLUMNS].astype(float)
+    money_columns = present_columns(corrections, MONEY_COLUMNS)
+    corrections[money_columns] = corrections[money_columns].astype(float)
     return corrections
 
 
@@ -79,7 +360,8 @@ def clean_organizer_sales(organizer_sales):
         organizer_sales['transaction_created_date'],
     )
     organizer_sales['event_id'] = organizer_sales['event_id'].apply(str)
-    organizer_sales[['GTSntv', 'GTFntv']] = organizer_sales[['GTSntv', 'GTFntv']].astype(float)
+    native_columns = present_columns(organizer_sales, ['GTSntv', 'GTFntv'])
+    organizer_sales[native_columns] = organizer_sales[native_columns].astype(float)
     organizer_sales = organizer_sales[organizer_sales['PaidTix'] != 0]
     return organizer_sales
 
@@ -94,7 +376,8 @@ def clean_organizer_refunds(organizer_refunds):
         organizer_refunds['transaction_created_date'],
     )
     organizer_refunds['event_id'] = organizer_refunds['event_id'].apply(str)
-    organizer_refunds[['GTSntv', 'GTFntv']] = organizer_refunds[['GTSntv', 'GTFntv']].astype(float)
+    native_columns = present_columns(organizer_refunds, ['GTSntv', 'GTFntv'])
+    organizer_refunds[native_columns] = organizer_refunds[native_columns].astype(float)
     organizer_refunds = organizer_refunds[organizer_refunds['PaidTix'] != 0]
     return organizer_refunds
 
@@ -117,32 +400,15 @@ def merge_corrections(transactions, corrections):
 def merge_transactions(transactions, organizer_sales, organizer_refunds):
     sales = transactions[transactions['is_sale'] == 1]
     refunds = transactions[transactions['is_refund'] == 1]
+    descriptive_columns = present_columns(organizer_sales, DESCRIPTIVE_COLUMNS)
 
     sales = sales.merge(
-        organizer_sales[[
-            'email',
-            'organizer_name',
-            'event_id',
-            'event_title',
-            'sales_flag',
-            'sales_vertical',
-            'vertical',
-            'sub_vertical',
-        ]].drop_duplicates(),
+        organizer_sales[descriptive_columns].drop_duplicates(),
         on=['email', 'event_id'],
         how='left',
     )
     refunds = refunds.merge(
-        organizer_refunds[[
-            'email',
-            'organizer_name',
-            'event_id',
-            'event_title',
-            'sales_flag',
-            'sales_vertical',
-            'vertical',
-            'sub_vertical',
-        ]].drop_duplicates(),
+        organizer_refunds[descriptive_columns].drop_duplicates(),
         on=['email', 'event_id'],
         how='left',
     )
@@ -190,7 +456,7 @@ def filter_transactions(transactions, **kwargs):
     conditions = [
         transactions[key] == kwargs.get(key).strip()
         for key in kwargs
-        if key in ['event_id', 'email', 'currency', 'eventholder_user_id'] and kwargs.get(key)
+        if key in FILTER_COLUMNS and kwargs.get(key)
     ]
     if kwargs.get('start_date'):
         start_date = np.datetime64(kwargs['start_date'], 'D')
@@ -214,142 +480,193 @@ def filter_transactions(transactions, **kwargs):
     return transactions[reduce(np.logical_and, conditions)]
 
 
-def group_transactions(transactions, by):
-    time_groupby = {
-        'day': 'D',
-        'week': 'W',
-        'semi_month': 'SMS',  # quincena del 1 al 14 y del 15 a fin de mes, consultar con finanzas
-        'month': 'M',
-        'quarter': 'Q',  # trimestre
-    }
-    custom_groupby = {
-        'event_id': ['eventholder_user_id', 'email', 'event_id', 'event_title', 'currency'],
-        'eventholder_user_id': ['eventholder_user_id', 'email', 'currency'],
-        'payment_processor': ['payment_processor', 'currency'],
-        'sales_flag': ['sales_flag', 'currency'],
-        'sales_vertical': ['sales_vertical', 'currency'],
-        'vertical': ['vertical', 'currency'],
-        'sub_vertical': ['vertical', 'sub_vertical', 'currency'],
-        'currency': ['currency'],
+def period_keys(dates):
+    days = dates.astype('datetime64[D]').astype(np.int64)
+    months = dates.astype('datetime64[M]').astype(np.int64)
+    month_starts = months.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+    # 1970-01-01 was a Thursday, weeks run from Monday to Sunday
+    return {
+        'day': days,
+        'week': (days + 3) // 7,
+        'semi_month': months * 2 + (days - month_starts >= 14),
+        'month': months,
+        'quarter': months // 3,
+        'year': dates.astype('datetime64[Y]').astype(np.int64),
     }
+
+
+def period_labels(keys, by):
+    # The dates pd.Grouper labels the periods with: the day, the week's Sunday, the 1st or 15th for semi
+    # months and the last day of months, quarters and years
+    if by == 'day':
+        labels = keys.astype('datetime64[D]')
+    elif by == 'week':
+        labels = (keys * 7 + 3).astype('datetime64[D]')
+    elif by == 'semi_month':
+        labels = (keys // 2).astype('datetime64[M]').astype('datetime64[D]') + (keys % 2) * 14
+    elif by == 'month':
+        labels = (keys + 1).astype('datetime64[M]').astype('datetime64[D]') - 1
+    elif by == 'quarter':
+        labels = (keys * 3 + 3).astype('datetime64[M]').astype('datetime64[D]') - 1
+    else:
+        labels = (keys + 1).astype('datetime64[Y]').astype('datetime64[D]') - 1
+    return labels.astype('datetime64[ns]')
+
+
+def add_period_keys(transactions):
+    keys = period_keys(transactions['transaction_created_date'].values)
+    for by, column in PERIOD_COLUMNS.items():
+        transactions[column] = keys[by].astype(np.int32)
+    return transactions
+
+
+def group_periods(transactions, by):
+    column = PERIOD_COLUMNS[by]
+    if column in transactions.columns:
+        keys = transactions[column].values.astype(np.int64)
+    else:
+        keys = period_keys(transactions['transaction_created_date'].values)[by]
+    values = transactions.drop(
+        columns=['transaction_created_date'] + present_columns(transactions, PERIOD_COLUMNS.values()),
+    )
+    grouped = values.groupby([values['currency'], pd.Series(keys, index=values.index, name=column)]).sum()
+    grouped = grouped.reset_index()
+    grouped.insert(1, 'transaction_created_date', period_labels(grouped.pop(column).values, by))
+    return grouped
+
+
+def group_transactions(transactions, by):
     if isinstance(by, str):
-        if by in time_groupby:
-            grouped = transactions.set_index("transaction_created_date").groupby(
-                ['currency', pd.Grouper(freq=time_groupby[by])]
-            ).sum().reset_index()
-        elif by in custom_groupby:
-            grouped = transactions.groupby(custom_groupby[by], as_index=False).sum()
+        if by in TIME_GROUPBY:
+            grouped = group_periods(transactions, by)
+        elif by in CUSTOM_GROUPBY:
+            grouped = transactions.groupby(CUSTOM_GROUPBY[by], as_index=False).sum()
     else:
         grouped = transactions.groupby(by, as_index=False).sum()
-    columns_to_drop = [column for column in grouped.columns if 'local_' in column]
-    return grouped.drop(columns_to_drop, axis=1)
+    columns_to_drop = [
+        column for column in grouped.columns
+        if 'local_' in column or column in PERIOD_COLUMNS.values()
+    ]
+    grouped = grouped.drop(columns_to_drop, axis=1)
+    # Cents add up exactly, the rates are still floats
+    rate_columns = present_columns(grouped, ['eb_perc_take_rate', 'exchange_rate'])
+    grouped[rate_columns] = grouped[rate_columns].round(2)
+    return grouped
 
 
+@timed('utils')
 def generate_transactions_consolidation(transactions, corrections, organizer_sales, organizer_refunds):
-    transactions = clean_transactions(transactions)
-    corrections = clean_corrections(corrections)
-    trx_total = merge_corrections(transactions, corrections)
-    organizers_sales = clean_organizer_sales(organizer_sales)
-    organizers_refunds = clean_organizer_refunds(organizer_refunds)
-    merged = merge_transactions(trx_total, organizers_sales, organizers_refunds)
-    merged = calc_perc_take_rate(merged)
-    return merged.round(2)
+    with stage('clean_transactions'):
+        transactions = clean_transactions(transactions)
+    with stage('clean_corrections'):
+        corrections = clean_corrections(corrections)
+    with stage('merge_corrections'):
+        trx_total = merge_corrections(transactions, corrections)
+    with stage('clean_organizer_sales'):
+        organizers_sales = clean_organizer_sales(organizer_sales)
+    with stage('clean_organizer_refunds'):
+        organizers_refunds = clean_organizer_refunds(organizer_refunds)
+    with stage('merge_transactions'):
+        merged = merge_transactions(trx_total, organizers_sales, organizers_refunds)
+    if 'sale__payment_amount__epp' in merged.columns and 'sale__gtf_esf__epp' in merged.columns:
+        with stage('calc_perc_take_rate'):
+            merged = calc_perc_take_rate(merged)
+    with stage('money_to_cents'):
+        merged = money_to_cents(merged)
+    with stage('add_period_keys'):
+        return add_period_keys(merged)
 
 
+def clean_aggregates(aggregates):
+    if 'transaction_created_date' in aggregates.columns:
+        aggregates['transaction_created_date'] = pd.to_datetime(aggregates['transaction_created_date'])
+    for column in present_columns(aggregates, ['eventholder_user_id', 'event_id']):
+        aggregates[column] = aggregates[column].apply(str)
+    # Already in cents
+    money_columns = present_columns(aggregates, MONEY_COLUMNS)
+    aggregates[money_columns] = aggregates[money_columns].astype(np.int64)
+    if 'eb_perc_take_rate' in aggregates.columns:
+        aggregates['eb_perc_take_rate'] = aggregates['eb_perc_take_rate'].astype(float).round(2)
+    aggregates['PaidTix'] = aggregates['PaidTix'].astype(int)
+    if 'transaction_created_date' in aggregates.columns:
+        aggregates = add_period_keys(aggregates)
+    return aggregates
+
+
+def transactions_params(params):
+    # What manage_transactions uses of a query string, always in the same order and stripped
+    normalized = {}
+    for key in TRANSACTIONS_PARAMS:
+        value = params.get(key)
+        if isinstance(value, str):
+            value = value.strip()
+        if value:
+            normalized[key] = value
+    if 'start_date' not in normalized:
+        normalized.pop('end_date', None)
+    return normalized
+
+
+@timed('utils')
 def manage_transactions(transactions, **kwargs):
     filtered = filter_transactions(transactions, **kwargs)
     if kwargs.get('groupby'):
         filtered = group_transactions(filtered, kwargs.get('groupby'))
-    return filtered.round(2)
-
-
-def event_details(transactions, event_id, eventholder_user_id):
-    transactions = transactions[transactions['event_id'] == event_id]
-    details = {
-        'Event ID': event_id,
-        'Event Title': transactions.iloc[0]['event_title'] if len(transactions) > 0 else '',
-        'Organizer ID': eventholder_user_id,
-        'Organizer Name': transactions.iloc[0]['organizer_name'] if len(transactions) > 0 else '',
-        'Email': transactions.iloc[0]['email'] if len(transactions) > 0 else '',
-        'Sales Flag': transactions.iloc[0]['sales_flag'] if len(transactions) > 0 else '',
-        'Sales Vertical': transactions.iloc[0]['sales_vertical'] if len(transactions) > 0 else '',
-    }
-    return details
+    return filtered
 
 
 def summarize_dataframe(dataframe):
     return {
-        column: dataframe[column].sum().round(2)
+        column: from_cents(dataframe[column].sum()) if column in MONEY_COLUMNS else dataframe[column].sum()
         for column in dataframe.columns.tolist()
         if column in NUMBER_COLUMNS
     }
 
 
-def get_event_transactions(transactions, event_id, **kwargs):
-    event_transactions = manage_transactions(
+def count_days(transactions):
+    # Days with transactions of each currency, like grouping by day does
+    return int(transactions.groupby('currency')['transaction_created_date'].nunique().sum())
+
+
+@timed('utils')
+def build_profile(transactions, key):
+    # One row per organizer or event, and where its transactions are, so a page doesn't rescan the dataset
+    transactions = whole_cents(transactions)
+    grouped = transactions.groupby(key, sort=False)
+    detail_columns = present_columns(
         transactions,
-        event_id=event_id,
+        [column for column in PROFILES[key]['details'].values() if column != key],
     )
-    filtered = filter_transactions(event_transactions, **kwargs)
-    event_total = summarize_dataframe(filtered)
-    if len(event_transactions) > 0:
-        details = event_details(
-            transactions,
-            event_id,
-            event_transactions.iloc[0]['eventholder_user_id'],
-        )
-        details['PaidTix'] = event_total['PaidTix']
-        details['AVG Ticket Value'] = round(event_total['sale__payment_amount__epp'] / event_total['PaidTix'], 2) \
-            if event_total['PaidTix'] > 0 else 0
-        details['AVG PaidTix/Day'] = round(event_total['PaidTix'] / len(filtered), 2) \
-            if len(filtered) > 0 else 0
-    sales_refunds = {
-        'Total Sales Detail': {
-            k: v for k, v in event_total.items() if 'sale' in k
-        },
-        'Total Refunds Detail': {
-            k: v for k, v in event_total.items() if 'refund' in k
-        },
+    return {
+        'details': grouped[detail_columns].first(),
+        'totals': cents_to_money(grouped[present_columns(transactions, NUMBER_COLUMNS)].sum()),
+        'rows': grouped.indices,
+        'days': transactions.groupby([key, 'currency'])['transaction_created_date'].nunique().groupby(level=0).sum(),
     }
-    net_sales_refunds = {
-        'Total Net Detail': {
-            net: sale + refund
-            for net, sale, refund in zip(
-                NET_COLUMNS,
-                sales_refunds['Total Sales Detail'].values(),
-                sales_refunds['Total Refunds Detail'].values(),
-            )
-        }
+
+
+def build_profiles(transactions):
+    return {key: build_profile(transactions, key) for key in PROFILES if key in transactions.columns}
+
+
+def profile_details(profile, key, value):
+    return {
+        label: value if column == key else (
+            profile['details'].at[value, column] if column in profile['details'].columns else ''
+        )
+        for label, column in PROFILES[key]['details'].items()
     }
-    return filtered, details, sales_refunds, net_sales_refunds
 
 
-def get_organizer_transactions(transactions, eventholder_user_id, **kwargs):
-    organizer_transactions = manage_transactions(
-        transactions,
-        eventholder_user_id=eventholder_user_id,
-    )
-    filtered = filter_transactions(organizer_transactions, **kwargs)
-    event_total = summarize_dataframe(filtered)
-    if len(organizer_transactions) > 0:
-        details = {
-            'Organizer ID': eventholder_user_id,
-            'Organizer Name': transactions.iloc[0]['organizer_name'] if len(transactions) > 0 else '',
-            'Email': organizer_transactions.iloc[0]['email'],
-            'Sales Flag': organizer_transactions.iloc[0]['sales_flag'],
-            'Sales Vertical': organizer_transactions.iloc[0]['sales_vertical'],
-            'PaidTix': event_total['PaidTix'],
-            'AVG Ticket Value': round(event_total['sale__payment_amount__epp'] / event_total['PaidTix'], 2)
-            if event_total['PaidTix'] > 0 else 0,
-            'AVG PaidTix/Day':  round(event_total['PaidTix'] / len(group_transactions(filtered, 'day')), 2)
-            if len(group_transactions(filtered, 'day')) > 0 else 0,
-        }
+def sales_refunds_detail(total):
+    # In NUMBER_COLUMNS order whatever the order of the frame, the net pairs each sale with its refund
+    total = {column: total[column] for column in NUMBER_COLUMNS if column in total}
     sales_refunds = {
         'Total Sales Detail': {
-            k: v for k, v in event_total.items() if 'sale' in k
+            k: v for k, v in total.items() if 'sale' in k
         },
         'Total Refunds Detail': {
-            k: v for k, v in event_total.items() if 'refund' in k
+            k: v for k, v in total.items() if 'refund' in k
         },
     }
     net_sales_refunds = {
@@ -362,9 +679,45 @@ def get_organizer_transactions(transactions, eventholder_user_id, **kwargs):
             )
         }
     }
-    return filtered, details, sales_refunds, net_sales_refunds
+    return sales_refunds, net_sales_refunds
+
+
+def get_profile_transactions(transactions, key, value, profile=None, **kwargs):
+    if profile is None:
+        transactions = transactions[transactions[key] == value]
+        profile = build_profile(transactions, key)
+    rows = profile['rows'].get(value)
+    if rows is None:
+        filtered = transactions.iloc[:0]
+        return (cents_to_money(filtered), None, *sales_refunds_detail(summarize_dataframe(filtered)))
+    profile_transactions = whole_cents(transactions.take(rows))
+    filtered = filter_transactions(profile_transactions, **kwargs)
+    if filtered is profile_transactions:
+        totals = profile['totals']
+        total = {column: totals.at[value, column] for column in totals.columns}
+        days = profile['days'].at[value] if PROFILES[key]['per_day'] == 'days' else len(rows)
+    else:
+        total = summarize_dataframe(filtered)
+        days = count_days(filtered) if PROFILES[key]['per_day'] == 'days' else len(filtered)
+    details = profile_details(profile, key, value)
+    details['PaidTix'] = total['PaidTix']
+    details['AVG Ticket Value'] = round(total['sale__payment_amount__epp'] / total['PaidTix'], 2) \
+        if total['PaidTix'] > 0 else 0
+    details['AVG PaidTix/Day'] = round(total['PaidTix'] / days, 2) if days > 0 else 0
+    return (cents_to_money(filtered), details, *sales_refunds_detail(total))
+
 
+@timed('utils')
+def get_event_transactions(transactions, event_id, profile=None, **kwargs):
+    return get_profile_transactions(transactions, 'event_id', event_id, profile, **kwargs)
 
+
+@timed('utils')
+def get_organizer_transactions(transactions, eventholder_user_id, profile=None, **kwargs):
+    return get_profile_transactions(transactions, 'eventholder_user_id', eventholder_user_id, profile, **kwargs)
+
+
+@timed('utils')
 def get_top_organizers(filtered_transactions):
     ordered = filtered_transactions.groupby(
         ['eventholder_user_id', 'email'],
@@ -374,17 +727,18 @@ def get_top_organizers(filtered_transactions):
     }).sort_values(
         by='sale__gtf_esf__epp',
         ascending=False,
-    ).round(2).reset_index()
+    ).reset_index()
     ordered = calc_perc_take_rate(ordered)
-    top = ordered.head(10).copy()
+    top = cents_to_money(ordered.head(10))
     top.loc[len(top), ['email', 'sale__gtf_esf__epp', 'sale__payment_amount__epp']] = [
         'Others',
-        ordered[10:].sale__gtf_esf__epp.sum().round(2),
-        ordered[10:].sale__payment_amount__epp.sum().round(2),
+        from_cents(ordered[10:].sale__gtf_esf__epp.sum()),
+        from_cents(ordered[10:].sale__payment_amount__epp.sum()),
     ]
     return top
 
 
+@timed('utils')
 def get_top_organizers_refunds(filtered_transactions):
     ordered = filtered_transactions.groupby(
         ['eventholder_user_id', 'email'],
@@ -393,15 +747,16 @@ def get_top_organizers_refunds(filtered_transactions):
     }).sort_values(
         by='refund__gtf_epp__gtf_esf__epp',
         ascending=True,
-    ).round(2).reset_index()
-    top = ordered.head(10).copy()
+    ).reset_index()
+    top = cents_to_money(ordered.head(10))
     top.loc[len(top), ['email', 'refund__gtf_epp__gtf_esf__epp']] = [
         'Others',
-        ordered[10:].refund__gtf_epp__gtf_esf__epp.sum().round(2),
+        from_cents(ordered[10:].refund__gtf_epp__gtf_esf__epp.sum()),
     ]
     return top
 
 
+@timed('utils')
 def get_top_events(filtered_transactions):
     ordered = filtered_transactions.groupby(
         ['event_id', 'event_title', 'eventholder_user_id', 'email'],
@@ -411,57 +766,50 @@ def get_top_events(filtered_transactions):
     }).sort_values(
         by='sale__gtf_esf__epp',
         ascending=False,
-    ).round(2).reset_index()
+    ).reset_index()
     ordered = calc_perc_take_rate(ordered)
-    top = ordered.head(10).copy()
+    top = cents_to_money(ordered.head(10))
     top.loc[len(top), ['event_title', 'event_id', 'sale__gtf_esf__epp', 'sale__payment_amount__epp']] = [
         'Others',
         '',
-        ordered[10:].sale__gtf_esf__epp.sum().round(2),
-        ordered[10:].sale__payment_amount__epp.sum().round(2),
+        from_cents(ordered[10:].sale__gtf_esf__epp.sum()),
+        from_cents(ordered[10:].sale__payment_amount__epp.sum()),
     ]
     return top
 
 
-def get_summarized_data(transactions):
+@timed('utils')
+def get_summarized_data(transactions, sketches=None):
     currencies = {'Argentina': ARS, 'Brazil': BRL}
     summarized_data = {}
     ref_currency = 'local_currency' if 'local_currency' in transactions.columns else 'currency'
+    if sketches is None:
+        sketches = build_distinct_sketches(transactions)
     for country, currency in currencies.items():
         filtered = transactions[transactions[ref_currency] == currency]
+        paid_tix = filtered.PaidTix.sum()
+        gross_gtf = filtered.sale__gtf_esf__epp.sum()
+        gross_gtv = filtered.sale__payment_amount__epp.sum()
+        net_gtf = gross_gtf + filtered.refund__gtf_epp__gtf_esf__epp.sum()
+        net_gtv = gross_gtv + filtered.refund__payment_amount__epp.sum()
         summarized_data[country] = {
             'currency': filtered.iloc[0]['currency'],
             'Totals': {
-                'Organizers': filtered.eventholder_user_id.nunique(),
-                'Events': filtered.event_id.nunique(),
-                'PaidTix': filtered.PaidTix.sum(),
+                'Organizers': count_distinct(sketches, 'eventholder_user_id', currency),
+                'Events': count_distinct(sketches, 'event_id', currency),
+                'PaidTix': paid_tix,
             },
             'Gross': {
-                'GTF': round(filtered.sale__gtf_esf__epp.sum(), 2),
-                'GTV': round(filtered.sale__payment_amount__epp.sum(), 2),
-                'ATV': round(
-                    (filtered.sale__payment_amount__epp.sum() - filtered.sale__gtf_esf__epp.sum()) / filtered.PaidTix.sum(),
-                    2,
-                ),
-                'Avg EB Take Rate': round(
-                    filtered.sale__gtf_esf__epp.sum() / filtered.sale__payment_amount__epp.sum() * 100,
-                    2,
-                ),
+                'GTF': from_cents(gross_gtf),
+                'GTV': from_cents(gross_gtv),
+                'ATV': round((gross_gtv - gross_gtf) / CENTS / paid_tix, 2),
+                'Avg EB Take Rate': round(gross_gtf / gross_gtv * 100, 2),
             },
             'Net': {
-                'GTF': round(filtered.sale__gtf_esf__epp.sum() + filtered.refund__gtf_epp__gtf_esf__epp.sum(), 2),
-                'GTV': round(filtered.sale__payment_amount__epp.sum() + filtered.refund__payment_amount__epp.sum(), 2),
-                'ATV': round(
-                    (filtered.sale__payment_amount__epp.sum() - filtered.sale__gtf_esf__epp.sum() +
-                     filtered.refund__payment_amount__epp.sum() - filtered.refund__gtf_epp__gtf_esf__epp.sum()
-                     ) / filtered.PaidTix.sum(),
-                    2,
-                ),
-                'Avg EB Take Rate': round(
-                    (filtered.sale__gtf_esf__epp.sum() + filtered.refund__gtf_epp__gtf_esf__epp.sum()) /
-                    (filtered.sale__payment_amount__epp.sum() + filtered.refund__payment_amount__epp.sum()) * 100,
-                    2,
-                ),
+                'GTF': from_cents(net_gtf),
+                'GTV': from_cents(net_gtv),
+                'ATV': round((net_gtv - net_gtf) / CENTS / paid_tix, 2),
+                'Avg EB Take Rate': round(net_gtf / net_gtv * 100, 2),
             },
         }
     return summarized_data
@@ -479,10 +827,10 @@ def payment_processor_summary(trx_currencies, filter):
     for country, trx_currency in trx_currencies.items():
         currency = trx_currency.currency.iloc[0]
         trx_currency.payment_processor.replace('', 'n/a', regex=True, inplace=True)
-        filtered = trx_currency.groupby(['payment_processor']).agg({column: sum}).reset_index().round(2)
+        filtered = trx_currency.groupby(['payment_processor']).agg({column: sum}).reset_index()
         filtered = filtered[filtered[column] != 0]
         filtered_names = filtered.payment_processor.tolist()
-        filtered_quantities = filtered[column].tolist()
+        filtered_quantities = from_cents(filtered[column].values).tolist()
         filtered_data, filtered_legend = get_chart_json_data(filtered_names, filtered_quantities)
         json[country] = {
             'unit': currency,
@@ -510,9 +858,9 @@ def sales_flag_summary(trx_currencies, filter):
     elif filter == 'gtf':
         for country, trx_currency in trx_currencies.items():
             currency = trx_currency.currency.iloc[0]
-            gtf = trx_currency.groupby(['sales_flag']).agg({'sale__gtf_esf__epp': sum}).reset_index().round(2)
+            gtf = trx_currency.groupby(['sales_flag']).agg({'sale__gtf_esf__epp': sum}).reset_index()
             gtf_names = gtf.sales_flag.to_list()
-            gtf_quantities = gtf.sale__gtf_esf__epp.tolist()
+            gtf_quantities = from_cents(gtf.sale__gtf_esf__epp.values).tolist()
             gtf_data, gtf_legend = get_chart_json_data(gtf_names, gtf_quantities)
             json[country] = {
                 'unit': currency,
@@ -522,9 +870,9 @@ def sales_flag_summary(trx_currencies, filter):
     elif filter == 'gtv':
         for country, trx_currency in trx_currencies.items():
             currency = trx_currency.currency.iloc[0]
-            gtv = trx_currency.groupby(['sales_flag']).agg({'sale__payment_amount__epp': sum}).reset_index().round(2)
+            gtv = trx_currency.groupby(['sales_flag']).agg({'sale__payment_amount__epp': sum}).reset_index()
             gtv_names = gtv.sales_flag.to_list()
-            gtv_quantities = gtv.sale__payment_amount__epp.tolist()
+            gtv_quantities = from_cents(gtv.sale__payment_amount__epp.values).tolist()
             gtv_data, gtv_legend = get_chart_json_data(gtv_names, gtv_quantities)
             json[country] = {
                 'unit': currency,
@@ -534,6 +882,7 @@ def sales_flag_summary(trx_currencies, filter):
     return json
 
 
+@timed('utils')
 def get_chart_json_data(names, quantities):
     percent = [str(round(qty/sum(quantities) * 100, 1)) + '% ' for qty in quantities]
     ids = list(range(0, 11))
@@ -549,6 +898,7 @@ def get_chart_json_data(names, quantities):
 
 
 
+@timed('utils')
 def get_charts_data(transactions, type, filter):
     ref_currency = 'local_currency' if 'local_currency' in transactions.columns else 'currency'
     trx_currencies = {
@@ -563,10 +913,78 @@ def get_charts_data(transactions, type, filter):
     return json
 
 
+def split_by_currency(transactions):
+    ref_currency = 'local_currency' if 'local_currency' in transactions.columns else 'currency'
+    return {
+        currency: transactions[transactions[ref_currency] == currency]
+        for currency in (ARS, BRL)
+    }
+
+
+@timed('utils')
+def get_top_chart_data(transactions, name, trx_currencies=None):
+    get_top, column = TOP_CHARTS[name]
+    trx_currencies = trx_currencies or split_by_currency(transactions)
+    json = {}
+    for key, currency in (('ars_data', ARS), ('brl_data', BRL)):
+        top = get_top(trx_currencies[currency])
+        if name == 'top_events':
+            names = [f'[{id}] {title[:20]}' for id, title in zip(top['event_id'], top['event_title'])]
+        else:
+            names = top['email'].tolist()
+        data, legend = get_chart_json_data(names, top[column].tolist())
+        json[key] = {
+            'unit': USD if 'local_currency' in transactions.columns else currency,
+            'data': data,
+            'legend': legend,
+        }
+    return json
+
+
+@timed('utils')
+def get_all_charts_data(transactions):
+    ref_currency = 'local_currency' if 'local_currency' in transactions.columns else 'currency'
+    keys = list(dict.fromkeys([ref_currency, 'currency', 'payment_processor', 'sales_flag', 'eventholder_user_id']))
+    # Every dashboard series is derived from this single aggregation
+    aggregated = transactions.groupby(keys).agg({
+        'sale__payment_amount__epp': sum,
+        'sale__gtf_esf__epp': sum,
+    }).reset_index()
+    trx_currencies = {
+        'Argentina': aggregated[aggregated[ref_currency] == ARS].copy(),
+        'Brazil': aggregated[aggregated[ref_currency] == BRL].copy(),
+    }
+    charts = {}
+    for type, filters in CHART_SERIES.items():
+        summary = payment_processor_summary if type == 'payment_processor' else sales_flag_summary
+        charts[type] = {filter: summary(trx_currencies, filter) for filter in filters}
+    top_currencies = split_by_currency(transactions)
+    for name in TOP_CHARTS:
+        charts[name] = get_top_chart_data(transactions, name, top_currencies)
+    return charts
+
+
+CHART_SERIES = {
+    'payment_processor': ['gtv', 'gtf'],
+    'sales_flag': ['organizers', 'gtv', 'gtf'],
+}
+
+TOP_CHARTS = {
+    'top_organizers': (get_top_organizers, 'sale__gtf_esf__epp'),
+    'top_organizers_refunds': (get_top_organizers_refunds, 'refund__gtf_epp__gtf_esf__epp'),
+    'top_events': (get_top_events, 'sale__gtf_esf__epp'),
+}
+
+
+@timed('utils')
 def dataframe_to_usd(transactions, exchange_data):
     trx = []
+    if PERIOD_COLUMNS['month'] in transactions.columns:
+        months = transactions[PERIOD_COLUMNS['month']].values % 12 + 1
+    else:
+        months = transactions['transaction_created_date'].dt.month.values
     for month, values in exchange_data.items():
-        trx_month = transactions[transactions['transaction_created_date'].dt.month_name() == month]
+        trx_month = transactions[months == list(calendar.month_name).index(month)]
         ars = trx_month[trx_month['currency'] == ARS]
         brl = trx_month[trx_month['currency'] == BRL]
         ars['exchange_rate'] = values['ars_to_usd']
@@ -577,16 +995,158 @@ def dataframe_to_usd(transactions, exchange_data):
         by=['transaction_created_date', 'eventholder_user_id', 'event_id'],
         inplace=True,
     )
-    renamed_columns = {column: f'local_{column}' for column in (MONEY_COLUMNS + ['currency'])}
+    money_columns = present_columns(converted, MONEY_COLUMNS)
+    renamed_columns = {column: f'local_{column}' for column in (money_columns + ['currency'])}
     converted.rename(columns=renamed_columns, inplace=True)
-    for column in MONEY_COLUMNS:
-        converted[column] = converted[f'local_{column}'] / converted['exchange_rate']
+    for column in money_columns:
+        converted[column] = converted[f'local_{column}'].values / converted['exchange_rate'].values
     converted['currency'] = USD
     return converted
 
+@timed('utils')
 def restore_currency(transactions):
-    deleted_columns = MONEY_COLUMNS + ['currency', 'exchange_rate']
+    money_columns = present_columns(transactions, MONEY_COLUMNS)
+    deleted_columns = money_columns + ['currency', 'exchange_rate']
     restored = transactions.drop(deleted_columns, axis=1)
-    restored_columns = {f'local_{column}': column for column in (MONEY_COLUMNS + ['currency'])}
+    restored_columns = {f'local_{column}': column for column in (money_columns + ['currency'])}
     restored.rename(columns=restored_columns, inplace=True)
     return restored
+
+
+def month_range(year, month):
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def previous_month_range(today):
+    previous_month_end = date(today.year, today.month, 1) - timedelta(days=1)
+    return month_range(previous_month_end.year, previous_month_end.month)
+
+
+def month_to_date_range(today):
+    # Complete days only, there's none on the first of the month
+    start_date = date(today.year, today.month, 1)
+    end_date = today - timedelta(days=1)
+    return (start_date, end_date) if end_date >= start_date else None
+
+
+def top_organizers(trx):
+    ref_currency = 'local_currency' if 'local_currency' in trx.columns else 'currency'
+    return {
+        'top_ars': get_top_organizers(
+            trx[trx[ref_currency] == ARS],
+        )[:10][TOP_ORGANIZERS['columns']].rename(columns=TOP_ORGANIZERS['labels']),
+        'top_brl': get_top_organizers(
+            trx[trx[ref_currency] == BRL],
+        )[:10][TOP_ORGANIZERS['columns']].rename(columns=TOP_ORGANIZERS['labels']),
+    }
+
+
+def top_organizers_refunds(trx):
+    ref_currency = 'local_currency' if 'local_currency' in trx.columns else 'currency'
+    return {
+        'top_ars': get_top_organizers_refunds(
+            trx[trx[ref_currency] == ARS],
+        )[:10][TOP_ORGANIZERS_REFUNDS['columns']].rename(columns=TOP_ORGANIZERS_REFUNDS['labels']),
+        'top_brl': get_top_organizers_refunds(
+            trx[trx[ref_currency] == BRL],
+        )[:10][TOP_ORGANIZERS_REFUNDS['columns']].rename(columns=TOP_ORGANIZERS_REFUNDS['labels']),
+    }
+
+
+def top_events(trx):
+    ref_currency = 'local_currency' if 'local_currency' in trx.columns else 'currency'
+    return {
+        'top_event_ars': get_top_events(
+            trx[trx[ref_currency] == ARS],
+        )[:10][TOP_EVENTS_COLUMNS['columns']].rename(columns=TOP_EVENTS_COLUMNS['labels']),
+        'top_event_brl': get_top_events(
+            trx[trx[ref_currency] == BRL],
+        )[:10][TOP_EVENTS_COLUMNS['columns']].rename(columns=TOP_EVENTS_COLUMNS['labels']),
+    }
+
+
+JSON_CHARTS = {
+    'top_organizers': lambda trx: get_top_chart_data(trx, 'top_organizers'),
+    'top_organizers_refunds': lambda trx: get_top_chart_data(trx, 'top_organizers_refunds'),
+    'top_events': lambda trx: get_top_chart_data(trx, 'top_events'),
+    'dashboard_charts': get_all_charts_data,
+}
+
+
+def transactions_key(session, params, dataset):
+    return (get_dataset_version(session), dataset) + tuple(
+        (name, tuple(value) if isinstance(value, list) else value) for name, value in params.items()
+    )
+
+
+def get_managed_transactions(session, params, dataset='transactions'):
+    # Users go back and forth between the same few filters, each is applied once per dataset version
+    params = transactions_params(params)
+    if not params:
+        return get_dataset(session, dataset)
+    return transactions_cache.get_or_set(
+        transactions_key(session, params, dataset),
+        lambda: manage_transactions(get_dataset(session, dataset), **params),
+    )
+
+
+def get_page_derived(session, name, compute, params, dataset='transactions'):
+    # Pages that are only grouped (not filtered) are the same for every session on a shared dataset
+    params = transactions_params(params.dict() if hasattr(params, 'dict') else params)
+
+    def compute_page(trx):
+        trx = manage_transactions(trx, **params)
+        return compute(trx) if compute is not None else trx
+
+    if set(params) - {'groupby'} or get_dataset_key(session, dataset) is None:
+        if compute is None:
+            return get_managed_transactions(session, params, dataset)
+        return transactions_cache.get_or_set(
+            transactions_key(session, params, dataset) + (name,),
+            lambda: compute(get_managed_transactions(session, params, dataset)),
+        )
+    return get_derived(session, f'{name}:{params.get("groupby")}', compute_page, dataset)
+
+
+def get_profiles(session):
+    # Built once per dataset version, organizer and event pages only slice their rows
+    return profiles_cache.get_or_set(
+        (get_dataset_version(session), 'profiles'),
+        lambda: get_derived(session, 'profiles', build_profiles),
+    )
+
+
+def get_distinct_sketches(session):
+    return chart_cache.get_or_set(
+        (get_dataset_version(session), 'distinct_sketches'),
+        lambda: get_derived(session, 'distinct_sketches', build_distinct_sketches),
+    )
+
+
+def get_dashboard_summary(session):
+    return get_derived(
+        session,
+        'summarized_data',
+        lambda trx: get_summarized_data(trx, get_distinct_sketches(session)),
+    )
+
+
+def get_search_index(session):
+    return profiles_cache.get_or_set(
+        (get_dataset_version(session), 'search_index'),
+        lambda: build_search_index(get_profiles(session)),
+    )
+
+
+def warm_derived(session):
+    # What the first visit of every page computes, done ahead for a shared dataset
+    get_derived(session, 'distinct_sketches', build_distinct_sketches)
+    get_dashboard_summary(session)
+    get_derived(session, 'profiles', build_profiles)
+    for name, compute in JSON_CHARTS.items():
+        get_derived(session, f'{name}:None:None', compute)
+    get_page_derived(session, 'top_organizers', top_organizers, {})
+    get_page_derived(session, 'top_organizers_refunds', top_organizers_refunds, {})
+    get_page_derived(session, 'top_events', top_events, {})
+    for groupby in TIME_GROUPBY:
+        get_page_derived(session, 'transactions_grouped', None, {'groupby': groupby})
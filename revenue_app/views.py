@@ -1,203 +1,165 @@
+from abc import (
+    ABCMeta,
+    abstractmethod,
+)
 import csv
 from datetime import (
     date,
     datetime,
+    timedelta,
 )
-from dateutil.relativedelta import relativedelta
+from functools import partial
+import hashlib
+import inspect
 import json
-import xlwt
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.serializers.json import DjangoJSONEncoder
 from django.http import (
+    FileResponse,
+    Http404,
     HttpResponse,
+    HttpResponseNotModified,
     HttpResponseRedirect,
     JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import (
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import (
+    is_safe_url,
+    parse_etags,
+    quote_etag,
+    urlencode,
 )
 from django.views.generic import (
     FormView,
     TemplateView,
+    View,
 )
 from django.shortcuts import resolve_url, redirect
 
-from revenue_app.const import (
-    ARS,
-    BRL,
-    USD,
+from revenue_app.cache import (
+    bump_dataset_version,
+    caches_stats,
+    chart_cache,
+    get_dataset_version,
+)
+from revenue_app.columnar import (
+    COLUMNAR_FORMATS,
+    gzip_stream,
+    stream_columnar,
 )
+from revenue_app.const import USD
 from revenue_app.forms import (
     ExchangeForm,
     QueryForm,
 )
+from revenue_app.imports import lazy_import
+from revenue_app.jobs import (
+    DONE,
+    FAILED,
+    job_pool,
+)
+from revenue_app.pdf_reports import (
+    dashboard_pdf,
+    detail_pdf,
+    top_pdf,
+)
+from revenue_app.performance import registry
 from revenue_app.presto_connection import (
+    aggregate_query_sql,
+    check_query_access,
+    consolidation_parts,
+    make_aggregate_query,
     make_query,
+    presto_pool,
     PrestoError,
+    single_flight,
+)
+from revenue_app.progress import (
+    get_channel,
+    progress_channel,
+    query_progress,
+    report_progress,
+    stream_events,
+)
+from revenue_app.queries import (
+    AGGREGATES,
+    get_view_columns,
+    has_columns,
+    PUSHDOWN_REPORT,
+    REPORTS,
+)
+from revenue_app.search import SEARCH_LIMIT
+from revenue_app.shared_datasets import (
+    get_dataset,
+    get_dataset_key,
+    get_derived,
+    get_owner,
+    get_prewarmed_dataset,
+    has_dataset,
+    layer_dataset,
+    replace_dataset,
+    restore_base_dataset,
+    set_content_dataset,
+    set_dataset,
 )
 from revenue_app.utils import (
+    cents_to_money,
+    clean_aggregates,
     dataframe_to_usd,
+    EVENT_COLUMNS,
     generate_transactions_consolidation,
     get_charts_data,
+    get_dashboard_summary,
     get_event_transactions,
+    get_managed_transactions,
     get_organizer_transactions,
-    get_summarized_data,
-    get_top_events,
-    get_top_organizers,
-    get_top_organizers_refunds,
-    get_chart_json_data,
-    manage_transactions,
+    get_page_derived,
+    get_profiles,
+    get_search_index,
+    JSON_CHARTS,
+    ORGANIZER_COLUMNS,
+    previous_month_range,
     restore_currency,
+    TIME_GROUPBY,
+    top_events,
+    top_organizers,
+    top_organizers_refunds,
+    TRANSACTIONS_COLUMNS,
 )
 
-FULL_COLUMNS = [
-    'transaction_created_date',
-    'eventholder_user_id',
-    'email',
-    'sales_flag',
-    'payment_processor',
-    'currency',
-    'PaidTix',
-    'sales_vertical',
-    'vertical',
-    'sub_vertical',
-    'event_id',
-    'event_title',
-    'eb_perc_take_rate',
-    'sale__payment_amount__epp',
-    'sale__gtf_esf__epp',
-    'sale__eb_tax__epp',
-    'sale__ap_organizer__gts__epp',
-    'sale__ap_organizer__royalty__epp',
-    'refund__payment_amount__epp',
-    'refund__gtf_epp__gtf_esf__epp',
-    'refund__eb_tax__epp',
-    'refund__ap_organizer__gts__epp',
-    'refund__ap_organizer__royalty__epp',
-]
-
-TRANSACTIONS_COLUMNS = [
-    'transaction_created_date',
-    'eventholder_user_id',
-    'email',
-    'sales_flag',
-    'payment_processor',
-    'currency',
-    'PaidTix',
-    'sales_vertical',
-    'vertical',
-    'sub_vertical',
-    'event_id',
-    'event_title',
-    'eb_perc_take_rate',
-    'sale__payment_amount__epp',
-    'sale__gtf_esf__epp',
-    'sale__eb_tax__epp',
-    'sale__ap_organizer__gts__epp',
-    'sale__ap_organizer__royalty__epp',
-    'refund__payment_amount__epp',
-    'refund__gtf_epp__gtf_esf__epp',
-    'refund__eb_tax__epp',
-    'refund__ap_organizer__gts__epp',
-    'refund__ap_organizer__royalty__epp',
-]
-
-ORGANIZER_COLUMNS = [
-    'transaction_created_date',
-    'event_id',
-    'event_title',
-    'payment_processor',
-    'currency',
-    'PaidTix',
-    'vertical',
-    'sub_vertical',
-    'eb_perc_take_rate',
-    'sale__payment_amount__epp',
-    'sale__gtf_esf__epp',
-    'sale__eb_tax__epp',
-    'sale__ap_organizer__gts__epp',
-    'sale__ap_organizer__royalty__epp',
-    'refund__payment_amount__epp',
-    'refund__gtf_epp__gtf_esf__epp',
-    'refund__eb_tax__epp',
-    'refund__ap_organizer__gts__epp',
-    'refund__ap_organizer__royalty__epp',
-]
-
-EVENT_COLUMNS = [
-    'transaction_created_date',
-    'eventholder_user_id',
-    'payment_processor',
-    'currency',
-    'PaidTix',
-    'vertical',
-    'sub_vertical',
-    'eb_perc_take_rate',
-    'sale__payment_amount__epp',
-    'sale__gtf_esf__epp',
-    'sale__eb_tax__epp',
-    'sale__ap_organizer__gts__epp',
-    'sale__ap_organizer__royalty__epp',
-    'refund__payment_amount__epp',
-    'refund__gtf_epp__gtf_esf__epp',
-    'refund__eb_tax__epp',
-    'refund__ap_organizer__gts__epp',
-    'refund__ap_organizer__royalty__epp',
-]
-
-TOP_ORGANIZERS = {
-    'columns': [
-        'eventholder_user_id',
-        'email',
-        'eb_perc_take_rate',
-        'sale__gtf_esf__epp',
-    ],
-    'labels': {
-        'eventholder_user_id': 'Organizer',
-        'email': 'Email',
-        'eb_perc_take_rate': 'Take Rate',
-        'sale__gtf_esf__epp': 'SalesGTF',
-    }
-}
+xlwt = lazy_import('xlwt')
 
-TOP_ORGANIZERS_REFUNDS = {
-    'columns': [
-        'eventholder_user_id',
-        'email',
-        'refund__gtf_epp__gtf_esf__epp',
-    ],
-    'labels': {
-        'eventholder_user_id': 'Organizer',
-        'email': 'Email',
-        'refund__gtf_epp__gtf_esf__epp': 'RefundGTF'
-    }
-}
-
-TOP_EVENTS_COLUMNS = {
-    'columns': [
-        'eventholder_user_id',
-        'email',
-        'event_id',
-        'event_title',
-        'eb_perc_take_rate',
-        'sale__gtf_esf__epp',
-    ],
-    'labels': {
-        'eventholder_user_id': 'Organizer',
-        'email': 'Email',
-        'event_title': 'Event Title',
-        'eb_perc_take_rate': 'Take Rate',
-        'sale__gtf_esf__epp': 'SalesGTF',
-    }
+SEARCH_URLS = {
+    'organizer': ('organizer-transactions', 'eventholder_user_id'),
+    'event': ('event-details', 'event_id'),
 }
 
 
 class QueriesRequiredMixin():
     def dispatch(self, request, *args, **kwargs):
         if (
-            request.session.get('transactions') is None
+            not has_dataset(request.session)
             or not request.session.get('query_info')
             or None in request.session.get('query_info').values()
         ):
             return HttpResponseRedirect(resolve_url('make-query'))
+        if not has_columns(self.get_dataset_columns(), get_view_columns(request.resolver_match.url_name, request.GET)):
+            # The dataset was fetched for a smaller report, query the missing columns and come back
+            return HttpResponseRedirect('{}?{}'.format(
+                resolve_url('make-query'),
+                urlencode({'next': request.get_full_path()}),
+            ))
         return super().dispatch(request, *args, **kwargs)
 
+    def get_dataset_columns(self):
+        return self.request.session.get('dataset_columns')
+
 
 class MakeQuery(FormView):
     template_name = 'revenue_app/query.html'
@@ -205,18 +167,48 @@ class MakeQuery(FormView):
 
     def get_initial(self):
         initial = super().get_initial()
-        today = date.today()
-        previous_month_end = date(today.year, today.month, 1) - relativedelta(days=1)
-        previous_month_start = date(previous_month_end.year, previous_month_end.month, 1)
-        initial['start_date'] = previous_month_start
-        initial['end_date'] = previous_month_end
+        initial['start_date'], initial['end_date'] = previous_month_range(date.today())
+        query_info = self.request.session.get('query_info')
+        if self.get_next_url() and query_info:
+            initial['start_date'] = query_info['start_date']
+            initial['end_date'] = query_info['end_date']
         return initial
 
+    def get_next_url(self):
+        next_url = self.request.GET.get('next')
+        if next_url and is_safe_url(next_url, allowed_hosts={self.request.get_host()}):
+            return next_url
+        return None
+
+    def get_context_data(self, **kwargs):
+        if 'next' not in kwargs:
+            kwargs['next'] = self.get_next_url()
+        # Set before the page submits, the run and its progress stream are then requested by the same owner
+        get_owner(self.request.session)
+        return super().get_context_data(**kwargs)
+
+    def get_prewarmed_dataset(self, start_date, end_date):
+        day_after = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+        return get_prewarmed_dataset(f'{start_date}_{end_date}', day_after.timestamp())
+
     def form_valid(self, form):
+        # Followed by the page while the POST runs, through the progress stream
+        with progress_channel(form.cleaned_data.get('progress_id'), get_owner(self.request.session)):
+            try:
+                response = self.run_queries(form)
+            except Exception:
+                report_progress('done', ok=False)
+                raise
+            report_progress('done', ok=not form.errors)
+        return response
+
+    def run_queries(self, form):
         start_date = form.data.get('start_date')
         end_date = form.data.get('end_date')
         okta_username = form.data.get('okta_username')
         okta_password = form.data.get('okta_password')
+        report = form.cleaned_data.get('report') or 'full'
+        columns = REPORTS[report]
 
         queries_status = []
 
@@ -226,20 +218,49 @@ class MakeQuery(FormView):
             'organizer_sales': None,
             'organizer_refunds': None,
         }
+        aggregates = dict.fromkeys(AGGREGATES)
 
+        prewarmed = self.get_prewarmed_dataset(start_date, end_date) if columns is None else None
+        queued = list(aggregates if report == PUSHDOWN_REPORT else dataframes)
+        for name in queued:
+            report_progress('query', name=name, state='queued')
         try:
-            for name, value in dataframes.items():
-                dataframe = make_query(
-                    start_date=start_date,
-                    end_date=end_date,
-                    okta_username=okta_username,
-                    okta_password=okta_password,
-                    query_name=name,
-                )
-                dataframes[name] = dataframe
-                queries_status.append(
-                    f'{name} ran successfully.'
-                )
+            if prewarmed is not None:
+                # Handed out only if Presto would let the user run the queries it was built from
+                for name in dataframes:
+                    with query_progress(name):
+                        check_query_access(start_date, end_date, okta_username, okta_password, name)
+                queries_status.append('Prewarmed dataset used.')
+            elif report == PUSHDOWN_REPORT:
+                for name, value in aggregates.items():
+                    with query_progress(name) as progress:
+                        aggregates[name] = make_aggregate_query(
+                            start_date=start_date,
+                            end_date=end_date,
+                            okta_username=okta_username,
+                            okta_password=okta_password,
+                            aggregate=name,
+                        )
+                        progress['rows'] = len(aggregates[name])
+                    queries_status.append(
+                        f'{name} aggregates ran successfully.'
+                    )
+            else:
+                for name, value in dataframes.items():
+                    with query_progress(name) as progress:
+                        dataframe = make_query(
+                            start_date=start_date,
+                            end_date=end_date,
+                            okta_username=okta_username,
+                            okta_password=okta_password,
+                            query_name=name,
+                            columns=columns,
+                        )
+                        progress['rows'] = len(dataframe)
+                    dataframes[name] = dataframe
+                    queries_status.append(
+                        f'{name} ran successfully.'
+                    )
         except PrestoError as exception:
             form.add_error(None, exception.args[0])
         else:
@@ -248,8 +269,35 @@ class MakeQuery(FormView):
                 'start_date': datetime.strptime(start_date, '%Y-%m-%d').date(),
                 'end_date': datetime.strptime(end_date, '%Y-%m-%d').date(),
             }
-            self.request.session['transactions'] = generate_transactions_consolidation(**dataframes)
+            if prewarmed is not None:
+                replace_dataset(self.request.session, 'transactions', prewarmed)
+                set_dataset(self.request.session, 'daily_transactions', None)
+            elif report == PUSHDOWN_REPORT:
+                set_content_dataset(
+                    self.request.session,
+                    'transactions',
+                    lambda: clean_aggregates(aggregates['totals']),
+                    lambda: [aggregate_query_sql(start_date, end_date, 'totals'), aggregates['totals']],
+                )
+                set_content_dataset(
+                    self.request.session,
+                    'daily_transactions',
+                    lambda: clean_aggregates(aggregates['daily']),
+                    lambda: [aggregate_query_sql(start_date, end_date, 'daily'), aggregates['daily']],
+                )
+            else:
+                set_content_dataset(
+                    self.request.session,
+                    'transactions',
+                    lambda: generate_transactions_consolidation(**dataframes),
+                    lambda: consolidation_parts(start_date, end_date, dataframes, columns),
+                )
+                set_dataset(self.request.session, 'daily_transactions', None)
             self.request.session['exchange_data'] = None
+            self.request.session['dataset_columns'] = columns
+            bump_dataset_version(self.request.session, get_dataset_key(self.request.session))
+            if self.get_next_url():
+                return HttpResponseRedirect(self.get_next_url())
 
         return self.render_to_response(
             self.get_context_data(
@@ -269,7 +317,7 @@ class Exchange(QueriesRequiredMixin, FormView):
         return exchange_data[month]
 
     def get(self, request, *args, **kwargs):
-        transactions = self.request.session.get('transactions').copy()
+        transactions = get_dataset(self.request.session)
         months = list(transactions.transaction_created_date.dt.month_name().unique())
         forms = {}
         for month in months:
@@ -277,7 +325,7 @@ class Exchange(QueriesRequiredMixin, FormView):
         return self.render_to_response({'forms': forms})
 
     def post(self, request, *args, **kwargs):
-        transactions = self.request.session.get('transactions').copy()
+        transactions = get_dataset(self.request.session)
         if self.request.session.get('exchange_data'):
             transactions = restore_currency(transactions)
         months = list(transactions.transaction_created_date.dt.month_name().unique())
@@ -289,7 +337,8 @@ class Exchange(QueriesRequiredMixin, FormView):
             converted = dataframe_to_usd(transactions, exchange_data)
             self.request.session['exchange_data'] = exchange_data
             self.request.session['class_exchange'] = 'currency' if len(exchange_data) >= 3 else 'query-info'
-            self.request.session['transactions'] = converted
+            layer_dataset(self.request.session, 'transactions', converted, exchange_data)
+            bump_dataset_version(self.request.session, get_dataset_key(self.request.session))
             return self.form_valid(forms)
         else:
             return self.form_invalid(forms)
@@ -340,9 +389,7 @@ class Dashboard(QueriesRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['summarized_data'] = get_summarized_data(
-            self.request.session.get('transactions').copy(),
-        )
+        context['summarized_data'] = get_dashboard_summary(self.request.session)
         context['title'] = 'Dashboard'
         return context
 
@@ -352,10 +399,9 @@ class OrganizersTransactions(QueriesRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        trx = manage_transactions(
-            self.request.session.get('transactions').copy(),
-            **self.request.GET.dict(),
-        )[TRANSACTIONS_COLUMNS]
+        trx = cents_to_money(
+            get_managed_transactions(self.request.session, self.request.GET.dict())[TRANSACTIONS_COLUMNS],
+        )
         self.request.session['export_transactions'] = trx
         context['title'] = 'Transactions'
         context['transactions'] = trx.head(500)
@@ -368,10 +414,13 @@ class OrganizerTransactions(QueriesRequiredMixin, TemplateView):
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         transactions, details, sales_refunds, net_sales_refunds = get_organizer_transactions(
-            self.request.session.get('transactions').copy(),
+            get_dataset(self.request.session),
             self.kwargs['eventholder_user_id'],
+            get_profiles(self.request.session).get('eventholder_user_id'),
             **self.request.GET.dict(),
         )
+        if details is None:
+            raise Http404('Organizer not found')
         context['details'] = details
         context['title'] = 'Organizer ' + details['Email']
         context['sales_refunds'] = sales_refunds
@@ -389,18 +438,8 @@ class TopOrganizersLatam(QueriesRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        trx = manage_transactions(
-            self.request.session.get('transactions').copy(),
-            **(self.request.GET.dict()),
-        )
-        ref_currency = 'local_currency' if 'local_currency' in trx.columns else 'currency'
         context['title'] = 'Top Organizers'
-        context['top_ars'] = get_top_organizers(
-            trx[trx[ref_currency] == ARS],
-        )[:10][TOP_ORGANIZERS['columns']].rename(columns=TOP_ORGANIZERS['labels'])
-        context['top_brl'] = get_top_organizers(
-            trx[trx[ref_currency] == BRL],
-        )[:10][TOP_ORGANIZERS['columns']].rename(columns=TOP_ORGANIZERS['labels'])
+        context.update(get_page_derived(self.request.session, 'top_organizers', top_organizers, self.request.GET))
         return context
 
 
@@ -409,20 +448,13 @@ class TopOrganizersRefundsLatam(QueriesRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        trx = manage_transactions(
-            self.request.session.get('transactions').copy(),
-            **(self.request.GET.dict()),
-        )
-        ref_currency = 'local_currency' if 'local_currency' in trx.columns else 'currency'
         context['title'] = 'Top Organizers Refunds'
-        context['top_ars'] = \
-            get_top_organizers_refunds(
-                trx[trx[ref_currency] == ARS],
-            )[:10][TOP_ORGANIZERS_REFUNDS['columns']].rename(columns=TOP_ORGANIZERS_REFUNDS['labels'])
-        context['top_brl'] = \
-            get_top_organizers_refunds(
-                trx[trx[ref_currency] == BRL],
-            )[:10][TOP_ORGANIZERS_REFUNDS['columns']].rename(columns=TOP_ORGANIZERS_REFUNDS['labels'])
+        context.update(get_page_derived(
+            self.request.session,
+            'top_organizers_refunds',
+            top_organizers_refunds,
+            self.request.GET,
+        ))
         return context
 
 
@@ -432,10 +464,13 @@ class TransactionsEvent(QueriesRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         transactions, details, sales_refunds, net_sales_refunds = get_event_transactions(
-            self.request.session.get('transactions').copy(),
+            get_dataset(self.request.session),
             self.kwargs['event_id'],
+            get_profiles(self.request.session).get('event_id'),
             **(self.request.GET.dict()),
         )
+        if details is None:
+            raise Http404('Event not found')
         context['details'] = details
         context['title'] = 'Event ' + details['Event Title']
         context['sales_refunds'] = sales_refunds
@@ -453,29 +488,31 @@ class TopEventsLatam(QueriesRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        trx = manage_transactions(
-            self.request.session.get('transactions').copy(),
-            **(self.request.GET.dict()),
-        )
-        ref_currency = 'local_currency' if 'local_currency' in trx.columns else 'currency'
         context['title'] = 'Top Events'
-        context['top_event_ars'] = get_top_events(
-            trx[trx[ref_currency] == ARS],
-        )[:10][TOP_EVENTS_COLUMNS['columns']].rename(columns=TOP_EVENTS_COLUMNS['labels'])
-        context['top_event_brl'] = get_top_events(
-            trx[trx[ref_currency] == BRL],
-        )[:10][TOP_EVENTS_COLUMNS['columns']].rename(columns=TOP_EVENTS_COLUMNS['labels'])
+        context.update(get_page_derived(self.request.session, 'top_events', top_events, self.request.GET))
         return context
 
 
 class TransactionsGrouped(QueriesRequiredMixin, TemplateView):
     template_name = 'revenue_app/transactions_grouped.html'
 
+    def uses_daily_transactions(self):
+        # Totals aggregated in Presto keep a separate daily series for the time groupings
+        return (
+            self.request.GET.get('groupby') in TIME_GROUPBY
+            and has_dataset(self.request.session, 'daily_transactions')
+        )
+
+    def get_dataset_columns(self):
+        if self.uses_daily_transactions():
+            return self.request.session.get('daily_transactions').columns.tolist()
+        return super().get_dataset_columns()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        trx = manage_transactions(
-            self.request.session.get('transactions').copy(),
-            **(self.request.GET.dict()),
+        dataset = 'daily_transactions' if self.uses_daily_transactions() else 'transactions'
+        trx = cents_to_money(
+            get_page_derived(self.request.session, 'transactions_grouped', None, self.request.GET, dataset),
         )
         context['title'] = 'Transactions Grouped'
         context['transactions'] = trx
@@ -483,108 +520,291 @@ class TransactionsGrouped(QueriesRequiredMixin, TemplateView):
         return context
 
 
-def top_organizers_json_data(request):
-    trx = request.session.get('transactions').copy()
-    ref_currency = 'local_currency' if 'local_currency' in trx.columns else 'currency'
-    top_organizers_ars = get_top_organizers(
-        trx[trx[ref_currency] == ARS],
+class PdfReport(QueriesRequiredMixin, View, metaclass=ABCMeta):
+    # Drawn from the summaries the pages already cached, reports with long tables are rendered in a background
+    # job and the browser polls for them
+    name = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # A report missing a method fails when the URLconf is loaded, not on its first request
+        if inspect.isabstract(cls):
+            raise TypeError(f'{cls.__name__} does not implement {", ".join(sorted(cls.__abstractmethods__))}')
+        return super().as_view(**initkwargs)
+
+    def get(self, request, *args, **kwargs):
+        render, rows = self.get_report()
+        filename = '{}_[query_ran_at_{}]_[exported_at_{}].pdf'.format(
+            self.name,
+            request.session['query_info']['run_time'],
+            datetime.now(),
+        )
+        if rows > settings.PDF_BACKGROUND_ROWS:
+            job_id = job_pool.submit(get_owner(request.session), filename, 'application/pdf', render)
+            return JsonResponse({'job': job_id, 'status_url': resolve_url('job-status', job_id=job_id)}, status=202)
+        response = HttpResponse(render(), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    def get_subtitle(self):
+        query_info = self.request.session['query_info']
+        currency = USD if self.request.session.get('exchange_data') else 'Local currency'
+        return '{:%Y-%m-%d} to {:%Y-%m-%d} · {} · Query ran at {:%Y-%m-%d %H:%M}'.format(
+            query_info['start_date'],
+            query_info['end_date'],
+            currency,
+            query_info['run_time'],
+        )
+
+    @abstractmethod
+    def get_report(self):
+        # The render function and the number of table rows
+        pass
+
+
+class DashboardPdf(PdfReport):
+    name = 'dashboard'
+
+    def get_report(self):
+        session = self.request.session
+        charts = get_derived(session, 'dashboard_charts:None:None', JSON_CHARTS['dashboard_charts'])
+        chart_type, chart_filter = self.request.GET.get('type'), self.request.GET.get('filter')
+        if chart_type and chart_filter:
+            # Just the chart picked on the page
+            charts = {chart_type: {chart_filter: charts.get(chart_type, {}).get(chart_filter, {})}}
+            return partial(dashboard_pdf, {}, charts, self.get_subtitle()), 0
+        return partial(dashboard_pdf, get_dashboard_summary(session), charts, self.get_subtitle()), 0
+
+
+class TopPdf(PdfReport):
+    title = None
+    compute = None
+    # (table, chart, heading) of every currency
+    sections = []
+
+    def get_report(self):
+        session = self.request.session
+        tables = get_page_derived(session, self.name, self.compute, self.request.GET)
+        charts = get_derived(session, f'{self.name}:None:None', JSON_CHARTS[self.name])
+        sections = [(heading, tables[table], charts[chart]) for table, chart, heading in self.sections]
+        return partial(top_pdf, self.title, sections, self.get_subtitle()), 0
+
+
+class TopOrganizersPdf(TopPdf):
+    name = 'top_organizers'
+    title = 'Top Organizers'
+    compute = staticmethod(top_organizers)
+    sections = [
+        ('top_ars', 'ars_data', 'Top 10 Argentina Organizers'),
+        ('top_brl', 'brl_data', 'Top 10 Brazil Organizers'),
+    ]
+
+
+class TopOrganizersRefundsPdf(TopPdf):
+    name = 'top_organizers_refunds'
+    title = 'Top Organizers Refunds'
+    compute = staticmethod(top_organizers_refunds)
+    sections = [
+        ('top_ars', 'ars_data', 'Top 10 Argentina Organizers with most refunds'),
+        ('top_brl', 'brl_data', 'Top 10 Brazil Organizers with most refunds'),
+    ]
+
+
+class TopEventsPdf(TopPdf):
+    name = 'top_events'
+    title = 'Top Events'
+    compute = staticmethod(top_events)
+    sections = [
+        ('top_event_ars', 'ars_data', 'Top 10 Argentina Events'),
+        ('top_event_brl', 'brl_data', 'Top 10 Brazil Events'),
+    ]
+
+
+class ProfilePdf(PdfReport):
+    columns = None
+
+    @abstractmethod
+    def get_transactions(self):
+        # What get_organizer_transactions / get_event_transactions return
+        pass
+
+    @abstractmethod
+    def get_title(self, details):
+        pass
+
+    def get_report(self):
+        transactions, details, sales_refunds, net_sales_refunds = self.get_transactions()
+        if details is None:
+            raise Http404(f'{self.name.capitalize()} not found')
+        if self.request.session.get('exchange_data'):
+            currency = USD
+        else:
+            currency = transactions['currency'].iloc[0] if len(transactions) else ''
+        return partial(
+            detail_pdf,
+            self.get_title(details),
+            details,
+            sales_refunds,
+            net_sales_refunds,
+            currency,
+            transactions[self.columns],
+            self.get_subtitle(),
+        ), len(transactions)
+
+
+class OrganizerPdf(ProfilePdf):
+    name = 'organizer'
+    columns = ORGANIZER_COLUMNS
+
+    def get_transactions(self):
+        return get_organizer_transactions(
+            get_dataset(self.request.session),
+            self.kwargs['eventholder_user_id'],
+            get_profiles(self.request.session).get('eventholder_user_id'),
+            **self.request.GET.dict(),
+        )
+
+    def get_title(self, details):
+        return 'Organizer ' + details['Email']
+
+
+class EventPdf(ProfilePdf):
+    name = 'event'
+    columns = EVENT_COLUMNS
+
+    def get_transactions(self):
+        return get_event_transactions(
+            get_dataset(self.request.session),
+            self.kwargs['event_id'],
+            get_profiles(self.request.session).get('event_id'),
+            **self.request.GET.dict(),
+        )
+
+    def get_title(self, details):
+        return 'Event ' + details['Event Title']
+
+
+def get_job_state(request, job_id):
+    state = job_pool.state(job_id)
+    # Jobs are only visible to the session that started them
+    if state is None or state['owner'] != get_owner(request.session):
+        raise Http404('Job not found')
+    return state
+
+
+def job_status(request, job_id):
+    state = get_job_state(request, job_id)
+    data = {'job': job_id, 'status': state['status']}
+    if state['status'] == DONE:
+        data['download_url'] = resolve_url('job-result', job_id=job_id)
+    elif state['status'] == FAILED:
+        data['error'] = state['error']
+    response = JsonResponse(data)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def job_result(request, job_id):
+    state = get_job_state(request, job_id)
+    if state['status'] != DONE:
+        raise Http404('Job not finished')
+    response = FileResponse(open(job_pool.result_path(job_id), 'rb'), content_type=state['content_type'])
+    response['Content-Disposition'] = f'attachment; filename="{state["filename"]}"'
+    return response
+
+
+def memoized_json_response(request, name, compute):
+    key = (
+        get_dataset_version(request.session),
+        name,
+        request.GET.get('type'),
+        request.GET.get('filter'),
     )
-    ars_quantities = top_organizers_ars['sale__gtf_esf__epp'].tolist()
-    ars_names = top_organizers_ars['email'].tolist()
-    data_ars, legend_ars = get_chart_json_data(ars_names, ars_quantities)
-    top_organizers_brl = get_top_organizers(
-        trx[trx[ref_currency] == BRL],
+
+    def serialize():
+        data = get_derived(request.session, ':'.join(str(part) for part in key[1:]), compute)
+        content = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return content, quote_etag(hashlib.sha1(content.encode()).hexdigest())
+
+    content, etag = chart_cache.get_or_set(key, serialize)
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def top_organizers_json_data(request):
+    return memoized_json_response(
+        request,
+        'top_organizers',
+        JSON_CHARTS['top_organizers'],
     )
-    brl_quantities = top_organizers_brl['sale__gtf_esf__epp'].tolist()
-    brl_names = top_organizers_brl['email'].tolist()
-    data_brl, legend_brl = get_chart_json_data(brl_names, brl_quantities)
-    res = json.dumps({
-        'ars_data': {
-            'unit': USD if 'local_currency' in trx.columns else ARS,
-            'data': data_ars,
-            'legend': legend_ars,
-        },
-        'brl_data': {
-            'unit': USD if 'local_currency' in trx.columns else BRL,
-            'data': data_brl,
-            'legend': legend_brl,
-        },
-    })
-    return HttpResponse(res, content_type="application/json")
 
 
 def top_organizers_refunds_json_data(request):
-    trx = request.session.get('transactions').copy()
-    ref_currency = 'local_currency' if 'local_currency' in trx.columns else 'currency'
-    top_organizers_ars = get_top_organizers_refunds(
-        trx[trx[ref_currency] == ARS],
-    )
-    ars_quantities = top_organizers_ars['refund__gtf_epp__gtf_esf__epp'].tolist()
-    ars_names = top_organizers_ars['email'].tolist()
-    data_ars, legend_ars = get_chart_json_data(ars_names, ars_quantities)
-    top_organizers_brl = get_top_organizers_refunds(
-        trx[trx[ref_currency] == BRL],
+    return memoized_json_response(
+        request,
+        'top_organizers_refunds',
+        JSON_CHARTS['top_organizers_refunds'],
     )
-    brl_quantities = top_organizers_brl['refund__gtf_epp__gtf_esf__epp'].tolist()
-    brl_names = top_organizers_brl['email'].tolist()
-    data_brl, legend_brl = get_chart_json_data(brl_names, brl_quantities)
-    res = json.dumps({
-        'ars_data': {
-            'unit': USD if 'local_currency' in trx.columns else ARS,
-            'data': data_ars,
-            'legend': legend_ars,
-        },
-        'brl_data': {
-            'unit': USD if 'local_currency' in trx.columns else BRL,
-            'data': data_brl,
-            'legend': legend_brl,
-        },
-    })
-    return HttpResponse(res, content_type="application/json")
 
 
 def top_events_json_data(request):
-    trx = request.session.get('transactions').copy()
-    ref_currency = 'local_currency' if 'local_currency' in trx.columns else 'currency'
-    top_events_ars = get_top_events(
-            trx[trx[ref_currency] == ARS],
-        )
-    ars_quantities = top_events_ars['sale__gtf_esf__epp'].tolist()
-    ars_names = [f'[{id}] {title[:20]}' for id, title in zip(top_events_ars['event_id'], top_events_ars['event_title'])]
-    data_ars, legend_ars = get_chart_json_data(ars_names, ars_quantities)
-    top_events_brl = get_top_events(
-            trx[trx[ref_currency] == BRL],
-        )
-    brl_quantities = top_events_brl['sale__gtf_esf__epp'].tolist()
-    brl_names = [f'[{id}] {title[:20]}' for id, title in zip(top_events_brl['event_id'], top_events_brl['event_title'])]
-    data_brl, legend_brl = get_chart_json_data(brl_names, brl_quantities)
-    res = json.dumps({
-        'ars_data': {
-            'unit': USD if 'local_currency' in trx.columns else ARS,
-            'data': data_ars,
-            'legend': legend_ars,
-        },
-        'brl_data': {
-            'unit': USD if 'local_currency' in trx.columns else BRL,
-            'data': data_brl,
-            'legend': legend_brl,
-        },
-    })
-    return HttpResponse(res, content_type="application/json")
+    return memoized_json_response(
+        request,
+        'top_events',
+        JSON_CHARTS['top_events'],
+    )
 
 
 def dashboard_summary(request):
-    transactions = request.session.get('transactions').copy()
     if request.GET.get('type') and request.GET.get('filter'):
-        res = get_charts_data(
-            transactions,
-            request.GET.get('type'),
-            request.GET.get('filter'),
+        return memoized_json_response(
+            request,
+            'dashboard_summary',
+            lambda trx: get_charts_data(trx, request.GET.get('type'), request.GET.get('filter')),
         )
-        return JsonResponse(res, status=200)
     return JsonResponse({}, status=400)
 
 
+def dashboard_charts(request):
+    return memoized_json_response(request, 'dashboard_charts', JSON_CHARTS['dashboard_charts'])
+
+
+def search(request):
+    if not has_dataset(request.session):
+        return JsonResponse({'results': []})
+    try:
+        limit = min(int(request.GET.get('limit', SEARCH_LIMIT)), 50)
+    except ValueError:
+        return JsonResponse({}, status=400)
+    results = get_search_index(request.session).search(request.GET.get('q', ''), limit)
+    for result in results:
+        url_name, url_kwarg = SEARCH_URLS[result['type']]
+        result['url'] = resolve_url(url_name, **{url_kwarg: result['id']})
+    response = JsonResponse({'results': results})
+    patch_cache_control(response, private=True, max_age=60)
+    return response
+
+
+def progress_events(request, progress_id):
+    # Only streamed to the session running the queries, like the jobs
+    channel = get_channel(progress_id, get_owner(request.session))
+    if channel is None:
+        raise Http404('Progress not found')
+    # Sent back by the browser when it reconnects, the offset of the last event it got
+    last_event_id = request.META.get('HTTP_LAST_EVENT_ID', '')
+    offset = int(last_event_id) if last_event_id.isdigit() else 0
+    response = StreamingHttpResponse(stream_events(channel, offset), content_type='text/event-stream')
+    patch_cache_control(response, no_cache=True)
+    # Nginx would otherwise buffer the stream until it ends
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 def download_excel(request, xls_name):
     response = HttpResponse(content_type='application/ms-excel')
     response['Content-Disposition'] = 'attachment; filename="{}_{}.xls"'.format(xls_name, datetime.now())
@@ -679,9 +899,51 @@ def download_csv(request, csv_name):
     return response
 
 
+def download_columnar(request, name, export_format):
+    # Typed columns (dates, dictionaries, decimals) written and sent a row group at a time
+    query_info = request.session.get('query_info')
+    export_transactions = request.session.get('export_transactions')
+    content = stream_columnar(export_transactions, export_format)
+    gzipped = COLUMNAR_FORMATS[export_format]['gzip'] and 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if gzipped:
+        content = gzip_stream(content)
+    response = StreamingHttpResponse(content, content_type=COLUMNAR_FORMATS[export_format]['content_type'])
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    response['Content-Disposition'] = 'attachment; filename="{}_[query_ran_at_{}]_[exported_at_{}].{}"'.format(
+        name,
+        query_info['run_time'],
+        datetime.now(),
+        COLUMNAR_FORMATS[export_format]['extension'],
+    )
+    return response
+
+
+def download_parquet(request, parquet_name):
+    return download_columnar(request, parquet_name, 'parquet')
+
+
+def download_arrow(request, arrow_name):
+    return download_columnar(request, arrow_name, 'arrow')
+
+
 def restore_local_currency(request):
-    transactions = request.session.get('transactions').copy()
-    restored = restore_currency(transactions)
-    request.session['transactions'] = restored
+    if not restore_base_dataset(request.session, 'transactions'):
+        transactions = get_dataset(request.session)
+        set_dataset(request.session, 'transactions', restore_currency(transactions))
     request.session['exchange_data'] = None
+    bump_dataset_version(request.session, get_dataset_key(request.session))
     return redirect('dashboard')
+
+
+@staff_member_required
+def performance_metrics(request):
+    metrics = {
+        'views': registry.summary(),
+        'caches': caches_stats(),
+        'presto_pool': presto_pool.stats(),
+        'single_flight': single_flight.stats(),
+        'jobs': job_pool.stats(),
+    }
+    return JsonResponse(metrics, status=200)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 """
 
 import os
+import tempfile
 from .utils import get_env_variable
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -43,11 +44,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'revenue_app.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'revenue_app.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -119,3 +122,46 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'revenue_app/static')
+
+
+# Request profiles captured with ?profile=cprofile|sample (staff only)
+
+PROFILES_DIR = os.path.join(BASE_DIR, 'profiles')
+# Milliseconds importing the URLconf may take after Django is set up (manage.py importtime, tests)
+COLD_START_BUDGET_MS = 200
+
+
+# Presto connection, sessions are pooled per (host, user) and reused between queries
+
+PRESTO_HOST = os.environ.get('PRESTO_HOST', 'presto-tableau.prod.dataf.eb')
+PRESTO_PORT = int(os.environ.get('PRESTO_PORT', 8443))
+PRESTO_PROTOCOL = os.environ.get('PRESTO_PROTOCOL', 'https')
+PRESTO_SQL_DIR = os.environ.get('PRESTO_SQL_DIR', 'sql')
+# Read results with the column buffer client instead of pyhive + pd.read_sql
+PRESTO_FAST_FETCH = os.environ.get('PRESTO_FAST_FETCH') == '1'
+PRESTO_POOL_SIZE = 4
+PRESTO_POOL_IDLE_TIMEOUT = 300
+PRESTO_POOL_HEALTH_CHECK_INTERVAL = 30
+PRESTO_POOL_TIMEOUT = 60
+# Identical queries running at the same time (threads or worker processes) share one fetch
+# Results are only written there while another worker waits for them
+PRESTO_SINGLE_FLIGHT_DIR = os.environ.get(
+    'PRESTO_SINGLE_FLIGHT_DIR',
+    os.path.join(tempfile.gettempdir(), 'revenue_single_flight'),
+)
+PRESTO_SINGLE_FLIGHT_RESULT_TTL = 60
+# Consolidated datasets written once and memory-mapped by every worker instead of pickled in each session,
+# disabled (kept in the session) unless a directory is set
+SHARED_DATASET_DIR = os.environ.get('SHARED_DATASET_DIR')
+SHARED_DATASET_TTL = 24 * 60 * 60
+# Query progress streamed to the browser (Server-Sent Events), one file per run read by any worker
+PROGRESS_DIR = os.environ.get('PROGRESS_DIR', os.path.join(BASE_DIR, 'progress'))
+PROGRESS_TTL = 60 * 60
+# A stream holds a worker thread, ended well before the worker timeout (30 s in gunicorn) and resumed by the browser
+PROGRESS_STREAM_TIMEOUT = 20
+PROGRESS_POLL_INTERVAL = 0.25
+# PDF reports are rendered on the server, the ones with more table rows than this in a background job
+JOBS_DIR = os.environ.get('JOBS_DIR', os.path.join(BASE_DIR, 'jobs'))
+JOBS_WORKERS = 2
+JOBS_TTL = 60 * 60
+PDF_BACKGROUND_ROWS = 2000